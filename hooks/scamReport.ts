@@ -252,20 +252,20 @@ export function useScamReporter(): UseScamReporterResult {
 
         const combinedDescription = `${current?.summary}\n\n---\n\n${description}`;
         const combinedSummary = await summariseWithGemini(combinedDescription, current?.image);
-        const combinedEmbeddings = await generateEmbedding(combinedDescription);
-        const updatedCount = current?.count + 1;
 
-        const { error: updateError } = await supabase
-          .from('scamreports')
-          .update({
-            count: updatedCount,
-            title: combinedSummary.title,
-            summary: combinedSummary.content,
-            embeddings: combinedEmbeddings,
-          })
-          .eq('id', existingId);
+        // merge_scam_report increments the count atomically and folds the new report's embedding into the
+        // stored count-weighted mean, the same way the Telegram bot merges
+        const { data: merged, error: mergeError } = await supabase.rpc('merge_scam_report', {
+          p_report_id: existingId,
+          p_user_id: null,
+          p_embedding: embedding,
+          p_title: combinedSummary.title,
+          p_summary: combinedSummary.content,
+        });
+
+        if (mergeError) throw new Error(mergeError.message);
 
-        if (updateError) throw new Error(updateError.message);
+        const updatedCount = merged?.[0]?.count ?? current?.count + 1;
 
         if (updatedCount % 3 === 0) {
           const { error: updateTimestampError } = await supabase
@@ -292,6 +292,7 @@ export function useScamReporter(): UseScamReporterResult {
             timestamp: Date.now(),
             count: 1,
             embeddings: embedding,
+            embedding_model: 'gemini-embedding-exp-03-07',
           });
 
         return feedback;
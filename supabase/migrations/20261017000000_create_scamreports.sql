@@ -0,0 +1,18 @@
+-- The reports table shared by the bot and the mobile app. It was created from the Supabase dashboard,
+-- so no earlier migration records it; this is its original shape, before the 20261018* migrations.
+-- On an existing project it is a no-op; on a fresh database (a local Postgres for the benchmarks/check_*
+-- scripts) the later migrations can then be applied in order.
+create extension if not exists vector;
+
+create table if not exists public.scamreports (
+    id uuid default gen_random_uuid() primary key,
+    timestamp bigint,  -- milliseconds since the epoch
+    title text,
+    summary text,
+    image text,
+    type text,
+    count integer default 1,
+    user_ids text[] default '{}',
+    embeddings vector,
+    was_broadcasted boolean not null default false
+);
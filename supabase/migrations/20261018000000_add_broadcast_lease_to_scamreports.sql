@@ -0,0 +1,5 @@
+-- Lease columns so a broadcast pass claims reports before sending them,
+-- preventing two bot instances (or an overlapping pass) from sending the same alert
+alter table public.scamreports
+    add column if not exists broadcast_lease_owner text,
+    add column if not exists broadcast_lease_expires_at timestamp with time zone;
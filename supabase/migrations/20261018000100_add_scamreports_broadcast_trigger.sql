@@ -0,0 +1,26 @@
+-- Partial index covering only reports still waiting to be broadcast, so the
+-- reconciliation sweep (count >= 3 and was_broadcasted = false, ordered by id) stays cheap
+create index if not exists scamreports_broadcast_pending_idx
+    on public.scamreports (id)
+    where was_broadcasted = false and count >= 3;
+
+-- Notify listeners when a report's count first reaches the broadcast threshold
+create or replace function public.notify_scam_broadcast_threshold()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.count >= 3
+        and not coalesce(new.was_broadcasted, false)
+        and (tg_op = 'INSERT' or coalesce(old.count, 0) < 3) then
+        perform pg_notify('scam_broadcast', new.id::text);
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists scamreports_broadcast_threshold on public.scamreports;
+create trigger scamreports_broadcast_threshold
+    after insert or update of count on public.scamreports
+    for each row
+    execute function public.notify_scam_broadcast_threshold();
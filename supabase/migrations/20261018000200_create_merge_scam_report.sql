@@ -0,0 +1,41 @@
+-- Merges a new incident into an existing scam report in a single statement.
+-- The row lock taken by the update serialises concurrent merges, so no count increment is lost.
+-- The embedding becomes the average of the stored and new embeddings (or the new one if none is stored).
+create or replace function public.merge_scam_report(
+    p_report_id uuid,
+    p_user_id text,
+    p_embedding vector default null,
+    p_title text default null,
+    p_summary text default null,
+    p_type text default null,
+    p_image text default null,
+    p_timestamp bigint default null
+)
+returns setof public.scamreports
+language plpgsql
+as $$
+begin
+    return query
+    update public.scamreports as r
+    set count = coalesce(r.count, 0) + 1,
+        user_ids = case
+            when p_user_id = any(coalesce(r.user_ids, '{}')) then r.user_ids
+            else array_append(coalesce(r.user_ids, '{}'), p_user_id)
+        end,
+        embeddings = case
+            when p_embedding is null then r.embeddings
+            when r.embeddings is null or vector_dims(r.embeddings) <> vector_dims(p_embedding) then p_embedding
+            else (
+                select array_agg((e.old_value + e.new_value) / 2 order by e.position)::vector
+                from unnest(r.embeddings::real[], p_embedding::real[]) with ordinality as e(old_value, new_value, position)
+            )
+        end,
+        title = coalesce(p_title, r.title),
+        summary = coalesce(p_summary, r.summary),
+        type = coalesce(p_type, r.type),
+        image = coalesce(p_image, r.image),
+        timestamp = coalesce(p_timestamp, r.timestamp)
+    where r.id = p_report_id
+    returning r.*;
+end;
+$$;
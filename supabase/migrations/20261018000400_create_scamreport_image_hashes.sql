@@ -0,0 +1,9 @@
+-- 64-bit perceptual hashes (dHash) of evidence screenshots, stored as signed bigints.
+-- The bot keeps them in an in-memory Hamming-distance index and refreshes it by id.
+create table if not exists public.scamreport_image_hashes (
+    id bigint generated always as identity primary key,
+    report_id uuid not null references public.scamreports (id) on delete cascade,
+    hash bigint not null,
+    created_at timestamp with time zone not null default now(),
+    unique (report_id, hash)
+);
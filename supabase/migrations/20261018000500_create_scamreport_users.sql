@@ -0,0 +1,45 @@
+-- One row per (user, report) so /history is an index range scan instead of a
+-- scan of scamreports.user_ids. Telegram user ids are stored as text, matching user_ids.
+create table if not exists public.scamreport_users (
+    user_id text not null,
+    report_id uuid not null references public.scamreports (id) on delete cascade,
+    reported_at bigint not null,  -- milliseconds, like scamreports.timestamp
+    primary key (user_id, report_id)
+);
+
+-- Serves the keyset-paginated history query: user_id = $1 and (reported_at, report_id) < ($2, $3)
+create index if not exists scamreport_users_history_idx
+    on public.scamreport_users (user_id, reported_at desc, report_id desc);
+
+-- Lets deletes of scamreports cascade without scanning this table
+create index if not exists scamreport_users_report_id_idx
+    on public.scamreport_users (report_id);
+
+-- Keep the table in step with scamreports.user_ids, whichever client inserts or merges the report
+create or replace function public.sync_scamreport_users()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.scamreport_users (user_id, report_id, reported_at)
+    select added.user_id,
+           new.id,
+           coalesce(new.timestamp, (extract(epoch from now()) * 1000)::bigint)
+    from unnest(coalesce(new.user_ids, '{}')) as added(user_id)
+    where tg_op = 'INSERT' or not added.user_id = any(coalesce(old.user_ids, '{}'))
+    on conflict (user_id, report_id) do nothing;
+    return new;
+end;
+$$;
+
+drop trigger if exists scamreports_sync_users on public.scamreports;
+create trigger scamreports_sync_users
+    after insert or update of user_ids on public.scamreports
+    for each row
+    execute function public.sync_scamreport_users();
+
+insert into public.scamreport_users (user_id, report_id, reported_at)
+select distinct on (u.user_id, r.id) u.user_id, r.id, coalesce(r.timestamp, 0)
+from public.scamreports as r
+cross join lateral unnest(r.user_ids) as u(user_id)
+on conflict (user_id, report_id) do nothing;
@@ -0,0 +1,15 @@
+-- Links, domains, phone numbers, crypto wallets and @handles extracted from reports (telebot/indicators.py).
+-- The bot keeps them in an in-memory lookup and refreshes it by id; `python indicators.py backfill`
+-- fills the table from existing reports' titles and summaries.
+create table if not exists public.scamreport_indicators (
+    id bigint generated always as identity primary key,
+    report_id uuid not null references public.scamreports (id) on delete cascade,
+    kind text not null check (kind in ('url', 'domain', 'phone', 'wallet', 'handle')),
+    value text not null,
+    created_at timestamp with time zone not null default now(),
+    unique (kind, value, report_id)
+);
+
+-- Cascading deletes from scamreports look rows up by report
+create index if not exists scamreport_indicators_report_id_idx
+    on public.scamreport_indicators (report_id);
@@ -0,0 +1,81 @@
+-- Report embeddings are stored as half-precision vectors: 2 bytes per dimension instead of 4, with
+-- cosine similarity unchanged to about 1e-4. Requires pgvector 0.7.0 or later (alter extension vector update).
+-- Existing rows are converted and L2-normalised in place; the table is rewritten under an exclusive lock.
+alter table public.scamreports
+    alter column embeddings type halfvec using l2_normalize(embeddings)::halfvec;
+
+-- match_scam compares against the halfvec column. Its earlier signature took a vector argument.
+do $$
+declare
+    f regprocedure;
+begin
+    for f in select oid::regprocedure from pg_proc
+             where proname = 'match_scam' and pronamespace = 'public'::regnamespace loop
+        execute 'drop function ' || f;
+    end loop;
+end;
+$$;
+
+create or replace function public.match_scam(
+    query_embedding halfvec,
+    match_threshold float,
+    match_count int
+)
+returns table (id uuid, title text, similarity float)
+language sql
+stable
+as $$
+    select r.id, r.title, 1 - (r.embeddings <=> query_embedding) as similarity
+    from public.scamreports as r
+    where r.embeddings is not null
+      and vector_dims(r.embeddings) = vector_dims(query_embedding)
+      and 1 - (r.embeddings <=> query_embedding) > match_threshold
+    order by r.embeddings <=> query_embedding
+    limit match_count;
+$$;
+
+-- merge_scam_report keeps the embedding as the normalised mean of every merged report, weighted by count,
+-- so the newest report no longer gets half the weight however many came before it
+drop function if exists public.merge_scam_report(uuid, text, vector, text, text, text, text[], bigint);
+
+create or replace function public.merge_scam_report(
+    p_report_id uuid,
+    p_user_id text,
+    p_embedding halfvec default null,
+    p_title text default null,
+    p_summary text default null,
+    p_type text default null,
+    p_images text[] default null,
+    p_timestamp bigint default null
+)
+returns setof public.scamreports
+language plpgsql
+as $$
+begin
+    return query
+    update public.scamreports as r
+    set count = coalesce(r.count, 0) + 1,
+        user_ids = case
+            when p_user_id = any(coalesce(r.user_ids, '{}')) then r.user_ids
+            else array_append(coalesce(r.user_ids, '{}'), p_user_id)
+        end,
+        embeddings = case
+            when p_embedding is null then r.embeddings
+            when r.embeddings is null or vector_dims(r.embeddings) <> vector_dims(p_embedding) then l2_normalize(p_embedding)
+            else (
+                select l2_normalize(array_agg(e.old_value * greatest(coalesce(r.count, 1), 1) + e.new_value
+                                              order by e.position)::vector)::halfvec
+                from unnest(l2_normalize(r.embeddings)::real[], l2_normalize(p_embedding)::real[])
+                    with ordinality as e(old_value, new_value, position)
+            )
+        end,
+        title = coalesce(p_title, r.title),
+        summary = coalesce(p_summary, r.summary),
+        type = coalesce(p_type, r.type),
+        image = coalesce(r.image, p_images[1]),
+        images = coalesce(r.images, '{}') || coalesce(p_images, '{}'),
+        timestamp = coalesce(p_timestamp, r.timestamp)
+    where r.id = p_report_id
+    returning r.*;
+end;
+$$;
@@ -0,0 +1,26 @@
+-- The embedding model each report's embedding came from, so embedding_backfill.py can find rows
+-- embedded with an older model. Rows embedded so far all used gemini-embedding-exp-03-07.
+alter table public.scamreports
+    add column if not exists embedding_model text;
+
+update public.scamreports
+set embedding_model = 'gemini-embedding-exp-03-07'
+where embeddings is not null and embedding_model is null;
+
+-- Writes a batch of embeddings in one statement. p_rows is a JSON array of
+-- {"id": uuid, "embedding": "[...]", "model": text}. Returns the number of reports updated;
+-- reports deleted since they were read are skipped.
+create or replace function public.set_scamreport_embeddings(p_rows jsonb)
+returns integer
+language sql
+as $$
+    with updated as (
+        update public.scamreports as r
+        set embeddings = l2_normalize(e.embedding::halfvec),
+            embedding_model = e.model
+        from jsonb_to_recordset(p_rows) as e(id uuid, embedding text, model text)
+        where r.id = e.id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
@@ -0,0 +1,125 @@
+-- Reports merged away by telebot/consolidate.py, pointing at the report that absorbed them.
+-- The bot maps matches on a merged-away report (still in its in-memory indexes until a restart) to the
+-- canonical one, and clients can follow old report ids the same way.
+create table if not exists public.scamreport_merges (
+    id bigint generated always as identity primary key,
+    duplicate_id uuid not null unique,
+    canonical_id uuid not null references public.scamreports (id) on delete cascade,
+    merged_at timestamp with time zone not null default now()
+);
+
+create index if not exists scamreport_merges_canonical_id_idx
+    on public.scamreport_merges (canonical_id);
+
+-- Merges duplicate reports into a canonical report in one transaction: counts are summed, user ids,
+-- images, screenshot hashes and indicators are united, the embedding becomes the count-weighted mean
+-- and the duplicates are deleted. Title, summary and type stay the canonical report's.
+-- A report already broadcast keeps the merged report from being broadcast again.
+-- Returns the updated canonical report, or nothing if it no longer exists.
+create or replace function public.consolidate_scam_reports(p_canonical_id uuid, p_duplicate_ids uuid[])
+returns setof public.scamreports
+language plpgsql
+as $$
+declare
+    canonical public.scamreports;
+    duplicate public.scamreports;
+    duplicate_ids uuid[];
+    merged_count integer;
+    merged_users text[];
+    merged_images text[];
+    merged_image text;
+    merged_timestamp bigint;
+    merged_broadcast boolean;
+    merged_embedding halfvec;
+begin
+    -- The canonical row first, then the duplicates in id order; the bot's merges lock one row at a time
+    select * into canonical from public.scamreports where id = p_canonical_id for update;
+    if not found then
+        return;
+    end if;
+    duplicate_ids := array(
+        select r.id from public.scamreports as r
+        where r.id = any(p_duplicate_ids) and r.id <> p_canonical_id
+        order by r.id
+        for update
+    );
+    if cardinality(duplicate_ids) = 0 then
+        return next canonical;
+        return;
+    end if;
+
+    merged_count := coalesce(canonical.count, 1);
+    merged_users := coalesce(canonical.user_ids, '{}');
+    merged_images := coalesce(canonical.images, '{}');
+    merged_image := canonical.image;
+    merged_timestamp := canonical.timestamp;
+    merged_broadcast := coalesce(canonical.was_broadcasted, false);
+    for duplicate in
+        select * from public.scamreports where id = any(duplicate_ids) order by timestamp, id
+    loop
+        merged_count := merged_count + coalesce(duplicate.count, 1);
+        merged_users := merged_users || array(
+            select u.user_id
+            from unnest(coalesce(duplicate.user_ids, '{}')) with ordinality as u(user_id, position)
+            where not u.user_id = any(merged_users)
+            order by u.position
+        );
+        merged_images := merged_images || coalesce(duplicate.images, '{}');
+        merged_image := coalesce(merged_image, duplicate.image);
+        merged_timestamp := greatest(merged_timestamp, duplicate.timestamp);
+        merged_broadcast := merged_broadcast or coalesce(duplicate.was_broadcasted, false);
+    end loop;
+
+    select l2_normalize(array_agg(totals.total order by totals.position)::vector)::halfvec
+    into merged_embedding
+    from (
+        select e.position, sum(e.value * greatest(coalesce(r.count, 1), 1)) as total
+        from public.scamreports as r
+        cross join lateral unnest(l2_normalize(r.embeddings)::real[]) with ordinality as e(value, position)
+        where (r.id = p_canonical_id or r.id = any(duplicate_ids))
+          and r.embeddings is not null
+          and vector_dims(r.embeddings) = vector_dims(canonical.embeddings)
+        group by e.position
+    ) as totals;
+
+    -- Keep each user's original reported_at for /history; the user_ids trigger skips rows that exist
+    insert into public.scamreport_users (user_id, report_id, reported_at)
+    select u.user_id, p_canonical_id, min(u.reported_at)
+    from public.scamreport_users as u
+    where u.report_id = any(duplicate_ids)
+    group by u.user_id
+    on conflict (user_id, report_id) do nothing;
+
+    insert into public.scamreport_image_hashes (report_id, hash)
+    select distinct p_canonical_id, h.hash
+    from public.scamreport_image_hashes as h
+    where h.report_id = any(duplicate_ids)
+    on conflict (report_id, hash) do nothing;
+
+    insert into public.scamreport_indicators (report_id, kind, value)
+    select distinct p_canonical_id, i.kind, i.value
+    from public.scamreport_indicators as i
+    where i.report_id = any(duplicate_ids)
+    on conflict (kind, value, report_id) do nothing;
+
+    -- Earlier merges into a duplicate now point at the canonical report
+    update public.scamreport_merges set canonical_id = p_canonical_id where canonical_id = any(duplicate_ids);
+    insert into public.scamreport_merges (duplicate_id, canonical_id)
+    select d.id, p_canonical_id from unnest(duplicate_ids) as d(id)
+    on conflict (duplicate_id) do update set canonical_id = excluded.canonical_id, merged_at = now();
+
+    delete from public.scamreports where id = any(duplicate_ids);
+
+    return query
+    update public.scamreports as r
+    set count = merged_count,
+        user_ids = merged_users,
+        images = merged_images,
+        image = merged_image,
+        timestamp = merged_timestamp,
+        was_broadcasted = merged_broadcast,
+        embeddings = coalesce(merged_embedding, r.embeddings)
+    where r.id = p_canonical_id
+    returning r.*;
+end;
+$$;
@@ -0,0 +1,30 @@
+-- When each report's embedding was last written, in epoch milliseconds like scamreports.timestamp.
+-- The bot's in-process index refreshes on this column: merges from the mobile app change a report's
+-- embedding without always bumping its timestamp, and consolidation rewrites the canonical report's.
+alter table public.scamreports
+    add column if not exists embedding_updated_at bigint;
+
+update public.scamreports
+set embedding_updated_at = coalesce(timestamp, 0)
+where embedding_updated_at is null;
+
+create index if not exists scamreports_embedding_updated_at_idx
+    on public.scamreports (embedding_updated_at, id);
+
+create or replace function public.touch_scamreport_embedding()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' or new.embeddings is distinct from old.embeddings then
+        new.embedding_updated_at := (extract(epoch from clock_timestamp()) * 1000)::bigint;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists scamreports_embedding_updated_at on public.scamreports;
+create trigger scamreports_embedding_updated_at
+    before insert or update of embeddings on public.scamreports
+    for each row
+    execute function public.touch_scamreport_embedding();
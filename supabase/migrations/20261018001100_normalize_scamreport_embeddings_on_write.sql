@@ -0,0 +1,69 @@
+-- The bot's in-process index and merge_scam_report's count-weighted mean both assume stored embeddings
+-- are L2-normalised. Clients other than the bot (the mobile app) write raw vectors, so every write is
+-- normalised here. Runs after scamreports_embedding_updated_at, which fires first by name.
+create or replace function public.normalize_scamreport_embedding()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.embeddings is not null then
+        new.embeddings := l2_normalize(new.embeddings);
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists scamreports_normalize_embedding on public.scamreports;
+create trigger scamreports_normalize_embedding
+    before insert or update of embeddings on public.scamreports
+    for each row
+    execute function public.normalize_scamreport_embedding();
+
+-- Rows the app wrote since the halfvec migration; already normalised rows are left alone
+update public.scamreports
+set embeddings = embeddings
+where embeddings is not null and abs(vector_norm(embeddings::vector) - 1) > 0.001;
+
+-- The mobile app merges through merge_scam_report too, but has no Telegram user id to record:
+-- a null p_user_id now leaves user_ids as they are instead of appending a null
+create or replace function public.merge_scam_report(
+    p_report_id uuid,
+    p_user_id text,
+    p_embedding halfvec default null,
+    p_title text default null,
+    p_summary text default null,
+    p_type text default null,
+    p_images text[] default null,
+    p_timestamp bigint default null
+)
+returns setof public.scamreports
+language plpgsql
+as $$
+begin
+    return query
+    update public.scamreports as r
+    set count = coalesce(r.count, 0) + 1,
+        user_ids = case
+            when p_user_id is null or p_user_id = any(coalesce(r.user_ids, '{}')) then r.user_ids
+            else array_append(coalesce(r.user_ids, '{}'), p_user_id)
+        end,
+        embeddings = case
+            when p_embedding is null then r.embeddings
+            when r.embeddings is null or vector_dims(r.embeddings) <> vector_dims(p_embedding) then l2_normalize(p_embedding)
+            else (
+                select l2_normalize(array_agg(e.old_value * greatest(coalesce(r.count, 1), 1) + e.new_value
+                                              order by e.position)::vector)::halfvec
+                from unnest(l2_normalize(r.embeddings)::real[], l2_normalize(p_embedding)::real[])
+                    with ordinality as e(old_value, new_value, position)
+            )
+        end,
+        title = coalesce(p_title, r.title),
+        summary = coalesce(p_summary, r.summary),
+        type = coalesce(p_type, r.type),
+        image = coalesce(r.image, p_images[1]),
+        images = coalesce(r.images, '{}') || coalesce(p_images, '{}'),
+        timestamp = coalesce(p_timestamp, r.timestamp)
+    where r.id = p_report_id
+    returning r.*;
+end;
+$$;
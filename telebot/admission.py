@@ -0,0 +1,199 @@
+"""
+Admission control for Gemini calls.
+
+Each user gets a token bucket, so one person flooding chat or /verify is turned away with a
+cheap "busy" reply instead of spending model quota. Each model has a concurrency gate whose
+queue is ordered by priority: report processing first, then /verify, then free chat. A queued
+call gives up when its deadline passes. Wait times, rejections and queue depth are exported
+through metrics.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+import metrics
+from ratelimit import TokenBucket
+
+PRIORITY_REPORT = 0
+PRIORITY_VERIFY = 1
+PRIORITY_CHAT = 2
+PRIORITY_NAMES = {PRIORITY_REPORT: "report", PRIORITY_VERIFY: "verify", PRIORITY_CHAT: "chat"}
+
+# How long a call may wait for a model slot before it is dropped, per priority
+DEADLINE_SECONDS = {
+    PRIORITY_REPORT: float(os.getenv("ADMISSION_REPORT_DEADLINE_SECONDS", "120")),
+    PRIORITY_VERIFY: float(os.getenv("ADMISSION_VERIFY_DEADLINE_SECONDS", "20")),
+    PRIORITY_CHAT: float(os.getenv("ADMISSION_CHAT_DEADLINE_SECONDS", "10")),
+}
+
+wait_seconds = metrics.registry.register(metrics.Histogram(
+    "tsfraud_admission_wait_seconds", "Time a Gemini call waited for a model slot.", ("model", "priority"),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)))
+rejections = metrics.registry.register(metrics.Counter(
+    "tsfraud_admission_rejections", "Gemini calls turned away before reaching the model.", ("priority", "reason")))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call is not admitted. `reason` is "rate_limited", "queue_full" or "deadline"."""
+
+    def __init__(self, reason, priority):
+        super().__init__(f"{PRIORITY_NAMES.get(priority, priority)} call rejected: {reason}")
+        self.reason = reason
+        self.priority = priority
+
+
+class UserRateLimiter:
+    """Per-user token buckets, keeping the max_users most recently seen users."""
+
+    def __init__(self, rate_per_minute=10, burst=5, max_users=10000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, user_id):
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+        return bucket.try_acquire()
+
+
+class PriorityGate:
+    """
+    Allows at most `limit` concurrent holders. Waiters are served lowest priority value first,
+    then in arrival order. A waiter whose deadline passes leaves the queue.
+    """
+
+    def __init__(self, limit, max_queue=200):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters = []  # heap of [priority, sequence, granted]
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def queue_depth(self):
+        return self._queued
+
+    def acquire(self, priority, timeout):
+        """Returns True once a slot is held, or False if none was free within timeout seconds."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if self.active < self.limit and not self._queued:
+                self.active += 1
+                return True
+            if self._queued >= self.max_queue:
+                raise AdmissionRejected("queue_full", priority)
+            waiter = [priority, next(self._sequence), False]
+            heapq.heappush(self._waiters, waiter)
+            self._queued += 1
+            while not waiter[2]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    waiter[2] = None  # cancelled; skipped when the heap is popped
+                    self._queued -= 1
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def release(self):
+        with self._condition:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter[2] is False:
+                    # Hand the slot straight to the next waiter, so active stays the same
+                    waiter[2] = True
+                    self._queued -= 1
+                    self._condition.notify_all()
+                    return
+            self.active -= 1
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent_per_model=8, user_rate_per_minute=10, user_burst=5, max_queue=200):
+        self.max_concurrent_per_model = max_concurrent_per_model
+        self.max_queue = max_queue
+        self.users = UserRateLimiter(user_rate_per_minute, user_burst)
+        self._gates = {}
+        self._held = threading.local()  # priorities of the slots this thread holds, innermost last
+        self._lock = threading.Lock()
+
+    def gate(self, model):
+        with self._lock:
+            gate = self._gates.get(model)
+            if gate is None:
+                gate = self._gates[model] = PriorityGate(self.max_concurrent_per_model, self.max_queue)
+            return gate
+
+    def check_user(self, user_id, priority):
+        """Charges one call to the user's bucket. Raises AdmissionRejected if they are over their rate."""
+        if not self.users.try_acquire(user_id):
+            rejections.inc(PRIORITY_NAMES[priority], "rate_limited")
+            raise AdmissionRejected("rate_limited", priority)
+
+    @contextmanager
+    def admit(self, model, priority, deadline=None):
+        """Holds a slot for `model` for the duration of the block. Raises AdmissionRejected if none frees up in time."""
+        gate = self.gate(model)
+        name = PRIORITY_NAMES[priority]
+        start = time.perf_counter()
+        try:
+            admitted = gate.acquire(priority, DEADLINE_SECONDS[priority] if deadline is None else deadline)
+        except AdmissionRejected:
+            rejections.inc(name, "queue_full")
+            raise
+        wait_seconds.observe(time.perf_counter() - start, model, name)
+        if not admitted:
+            rejections.inc(name, "deadline")
+            raise AdmissionRejected("deadline", priority)
+        held = getattr(self._held, "priorities", None)
+        if held is None:
+            held = self._held.priorities = []
+        held.append(priority)
+        try:
+            yield
+        finally:
+            held.pop()
+            gate.release()
+
+    def admit_fallback(self, model, seconds):
+        """
+        A slot for `model` at the priority of the slot this thread already holds, waiting at most `seconds`.
+        ModelClient enters it before falling back to another model, so the fallback's gate still applies.
+        Outside an admitted block (offline jobs) it admits nothing.
+        """
+        held = getattr(self._held, "priorities", None)
+        if not held:
+            return nullcontext()
+        return self.admit(model, held[-1], min(seconds, DEADLINE_SECONDS[held[-1]]))
+
+    def metric_samples(self):
+        with self._lock:
+            gates = list(self._gates.items())
+        samples = []
+        for model, gate in gates:
+            samples.append(("tsfraud_admission_queue_depth", "gauge", "Gemini calls waiting for a model slot.",
+                            {"model": model}, gate.queue_depth()))
+            samples.append(("tsfraud_admission_active", "gauge", "Gemini calls holding a model slot.",
+                            {"model": model}, gate.active))
+        return samples
+
+
+controller = AdmissionController(
+    max_concurrent_per_model=int(os.getenv("GEMINI_MAX_CONCURRENT_PER_MODEL", "8")),
+    user_rate_per_minute=float(os.getenv("ADMISSION_USER_RATE_PER_MINUTE", "10")),
+    user_burst=int(os.getenv("ADMISSION_USER_BURST", "5")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "200")),
+)
+metrics.register_collector(controller.metric_samples)
@@ -0,0 +1,155 @@
+"""
+Accuracy, coverage and latency of the local pre-classifier on a synthetic labelled corpus.
+
+Usage: python benchmarks/bench_classifier.py [--examples 6000] [--save corpus.jsonl]
+
+Scam texts are generated from common Singapore scam scripts with varied names, amounts and links;
+benign texts include genuine bank, delivery and appointment notices that share their vocabulary;
+small talk is greetings and thanks. The corpus goes through the same split, training, threshold
+choice and evaluation as `python classifier.py train`, then prediction latency is timed and
+the share of Gemini calls each handler would skip is reported.
+Synthetic text is more regular than real traffic, so treat the accuracy as an upper bound and
+retrain on real reports and logged verdicts before relying on it.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import classifier  # noqa: E402
+
+BANKS = ["DBS", "OCBC", "UOB", "POSB", "Citibank", "Standard Chartered"]
+COURIERS = ["SingPost", "Ninja Van", "J&T Express", "DHL", "Qxpress"]
+AGENCIES = ["MOM", "ICA", "IRAS", "the police", "MAS", "CPF Board"]
+NAMES = ["Alice", "Ben", "Mei Ling", "Raj", "Siti", "Jun Wei", "Aunty Lim", "Kumar"]
+SHORT_LINKS = ["bit.ly/{}", "tinyurl.com/{}", "rb.gy/{}", "cutt.ly/{}"]
+FAKE_DOMAINS = ["{}-secure-login.com", "{}-verify.xyz", "{}-support.top", "{}-refund.info"]
+
+SCAM_TEMPLATES = [
+    "Your {courier} parcel is held at our warehouse due to unpaid customs fee. Pay ${small} at {link} within 24 hours or it will be returned",
+    "{bank} ALERT: your account has been locked due to suspicious activity. Verify your identity at {link} immediately",
+    "Dear customer, your {bank} card will be suspended today. Log in at {link} and enter the OTP sent to you",
+    "This is {agency}. Your IC was used in a money laundering case. Transfer ${big} to a safe account for investigation or you will be arrested",
+    "Congratulations! You have won ${big} in the lucky draw. Pay a processing fee of ${small} at {link} to claim your prize",
+    "Hi, part time job available, earn ${small} to ${big} per day just by liking videos. Contact our HR on Telegram @{handle}",
+    "Mum/Dad, I lost my phone, this is my new number. Please transfer ${big} to this account urgently, I will explain later",
+    "Your {bank} rewards points expire today! Redeem now at {link} before they are forfeited",
+    "Investment opportunity: guaranteed 30% monthly returns in crypto. Minimum deposit ${big}. Join our VIP group {link}",
+    "{agency}: you have an outstanding fine of ${small}. Pay via {link} today to avoid legal action",
+    "Hi {name}, I'm selling concert tickets cheap, pay ${small} deposit by PayNow first and I will send the tickets",
+    "URGENT: your {courier} delivery failed. Update your address and pay ${small} redelivery fee at {link}",
+    "Your SingPass will expire. Reactivate now at {link} and provide your OTP {code} to our officer",
+    "Hello dear, I am a US army doctor in Syria, I need help to ship my gold worth ${big}, send ${small} for customs",
+]
+BENIGN_TEMPLATES = [
+    "{bank}: a transaction of ${small} was made on your card ending 1234. If this was not you, call the number on the back of your card",
+    "Your {courier} parcel will be delivered tomorrow between 9am and 1pm. No action is needed",
+    "Hi {name}, are we still meeting for lunch at 12:30 tomorrow?",
+    "Reminder: your dental appointment is on Monday at 3pm. Reply Y to confirm",
+    "{bank}: your monthly statement is now available in the {bank} app",
+    "Thanks for your payment of ${small} to Singtel. Your receipt number is {code}",
+    "{name} sent you ${small} via PayNow for dinner last night",
+    "The class tomorrow is moved to room 4-02, please bring your textbook",
+    "Your OTP for logging in to the {bank} app is {code}. Do not share it with anyone. {bank} will never ask for it",
+    "Can you pick up some milk and eggs on your way home?",
+    "{agency}: your application has been received and will be processed within 14 working days",
+    "Happy birthday {name}! Hope you have a great year ahead",
+    "Your Grab ride is arriving in 3 minutes, look for a white Toyota",
+    "Meeting notes from today are in the shared drive, let me know if I missed anything",
+]
+SMALLTALK = [
+    "hi", "hello", "hey there", "good morning", "good evening", "thanks", "thank you so much", "ok thanks",
+    "hello bot", "hi how are you", "who are you", "what can you do", "bye", "see you", "nice, thanks for the help",
+    "good night", "hey", "hello!", "thanks a lot", "morning", "cool", "great thanks", "hi there, anyone here?",
+]
+
+
+def fill(template, rng):
+    word = rng.choice(["dbs", "ocbc", "parcel", "gov", "pay", "claim", "prize", "sg"])
+    return template.format(
+        bank=rng.choice(BANKS), courier=rng.choice(COURIERS), agency=rng.choice(AGENCIES), name=rng.choice(NAMES),
+        small=f"{rng.randint(1, 99)}.{rng.randint(0, 99):02d}", big=f"{rng.randint(1, 50) * 1000:,}",
+        code=rng.randint(100000, 999999), handle=f"hr_{rng.getrandbits(16):x}",
+        link=rng.choice([rng.choice(SHORT_LINKS).format(f"{rng.getrandbits(24):x}"),
+                         "https://" + rng.choice(FAKE_DOMAINS).format(word)]),
+    )
+
+
+def perturb(text, rng):
+    """Drops, repeats or recases a word now and then, as people retyping a message do."""
+    words = text.split()
+    for _ in range(rng.randint(0, 2)):
+        i = rng.randrange(len(words))
+        action = rng.random()
+        if action < 0.4 and len(words) > 3:
+            del words[i]
+        elif action < 0.7:
+            words.insert(i, words[i])
+        else:
+            words[i] = words[i].upper()
+    return " ".join(words)
+
+
+def corpus(n, seed):
+    rng = random.Random(seed)
+    examples = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.45:
+            examples.append((perturb(fill(rng.choice(SCAM_TEMPLATES), rng), rng), "scam"))
+        elif kind < 0.85:
+            examples.append((perturb(fill(rng.choice(BENIGN_TEMPLATES), rng), rng), "benign"))
+        else:
+            text = rng.choice(SMALLTALK)
+            examples.append((text if rng.random() < 0.5 else text.capitalize() + rng.choice(["", "!", " :)", "?"]), "smalltalk"))
+    return examples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", type=int, default=6000)
+    parser.add_argument("--seed", type=int, default=21)
+    parser.add_argument("--save", help="also write the corpus as JSON lines, for `classifier.py train --examples`")
+    args = parser.parse_args()
+
+    examples = corpus(args.examples, args.seed)
+    if args.save:
+        with open(args.save, "w") as corpus_file:
+            for text, label in examples:
+                corpus_file.write(json.dumps({"text": text, "label": label}) + "\n")
+
+    train_rows, calibration_rows, test_rows = classifier.split(examples)
+    start = time.perf_counter()
+    model = classifier.train(train_rows)
+    train_seconds = time.perf_counter() - start
+    model.thresholds = classifier.choose_thresholds(model, calibration_rows)
+    print(f"trained on {len(train_rows)} in {train_seconds:.1f}s; thresholds {({k: round(v, 3) for k, v in model.thresholds.items()})}")
+    classifier.print_report(classifier.evaluate(model, test_rows))
+
+    latencies = []
+    for text, _ in test_rows * 5:
+        start = time.perf_counter()
+        model.confident(text, classifier.LABELS)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    print(f"predict latency p50 {latencies[len(latencies) // 2]:.0f}us  p99 {latencies[int(len(latencies) * 0.99)]:.0f}us  "
+          f"max {latencies[-1]:.0f}us")
+
+    # Which Gemini calls each handler would skip, and how often a skipped one got the wrong answer
+    handlers = {"verify": ("scam", "smalltalk"), "report": ("scam",), "chat": ("smalltalk",)}
+    for handler, allowed in handlers.items():
+        skipped = wrong = 0
+        for text, label in test_rows:
+            local = model.confident(text, allowed)
+            if local:
+                skipped += 1
+                wrong += local != label
+        print(f"  {handler:<7} Gemini calls avoided {skipped / len(test_rows):6.1%}  wrong local answers {wrong}")
+
+
+if __name__ == '__main__':
+    main()
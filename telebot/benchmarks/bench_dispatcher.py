@@ -0,0 +1,57 @@
+"""
+Throughput check for the update dispatcher: N users confirming a /report at the same time
+should finish in roughly the time of one, and each user's steps must stay in order.
+
+Usage: python benchmarks/bench_dispatcher.py [--users 32] [--workers 32] [--latency 2.0]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatcher import UpdateDispatcher  # noqa: E402
+
+# Steps of the /report flow; only the final confirmation pays for the model and database calls
+REPORT_STEPS = ["/report", "description", "No (Submit report)", "Confirm submission"]
+
+
+def run(users, workers, latency):
+    seen = {}
+
+    def handle(item):
+        chat_id, step = item
+        if step == REPORT_STEPS[-1]:
+            time.sleep(latency)  # stands in for process_full_report
+        seen.setdefault(chat_id, []).append(step)
+
+    dispatcher = UpdateDispatcher(handle, max_workers=workers)
+    start = time.perf_counter()
+    for step in REPORT_STEPS:
+        for chat_id in range(users):
+            dispatcher.submit(chat_id, (chat_id, step))
+    dispatcher.wait_idle()
+    elapsed = time.perf_counter() - start
+    dispatcher.shutdown()
+
+    in_order = all(steps == REPORT_STEPS for steps in seen.values()) and len(seen) == users
+    return elapsed, in_order
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per simulated process_full_report")
+    args = parser.parse_args()
+
+    single, _ = run(1, args.workers, args.latency)
+    many, in_order = run(args.users, args.workers, args.latency)
+    print(f"1 report: {single:.2f}s")
+    print(f"{args.users} simultaneous reports: {many:.2f}s ({many / single:.2f}x of one)")
+    print(f"Per-user ordering preserved: {in_order}")
+
+
+if __name__ == '__main__':
+    main()
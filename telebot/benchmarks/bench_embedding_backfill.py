@@ -0,0 +1,99 @@
+"""
+Throughput, request count and resumability of embedding_backfill.py, run against the fakes in benchmarks/fakes.py.
+
+Usage: python benchmarks/bench_embedding_backfill.py [--reports 5000] [--gemini 400:200:0.02] [--supabase 30:10]
+
+Seeds reports of which a share have no embedding and a share carry an older model's embedding, then
+re-embeds them for the new model: one text per request as the bot embeds (batch size 1, on a smaller
+table), then in batches.
+The batched run is stopped partway and resumed from its checkpoint, and every report is checked to
+end up with exactly one embedding from the new model. Gemini and Supabase latency and failures come from
+Fault specs (latency_ms:jitter_ms:failure_rate); the fake charges latency per request, not per text.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_backfill import EmbeddingBackfill  # noqa: E402
+from fakes import Fault, FakeGemini, FakeSupabase  # noqa: E402
+from model_client import ModelClient  # noqa: E402
+
+NEW_MODEL = "gemini-embedding-001"
+
+
+def seed(reports, missing, stale, seed_value):
+    supabase = FakeSupabase()
+    supabase.seed_reports(reports)
+    rng = random.Random(seed_value)
+    for row in supabase.tables["scamreports"]:
+        draw = rng.random()
+        if draw < missing:
+            row["embeddings"] = row["embedding_model"] = None
+        elif draw < missing + stale:
+            row["embedding_model"] = "text-embedding-004"
+        else:
+            row["embedding_model"] = NEW_MODEL
+    return supabase
+
+
+def run(args, reports, batch_size, concurrency, stop_after=None):
+    """Backfills a freshly seeded table. Returns (stats, seconds, gemini requests, supabase, resumed)."""
+    supabase = seed(reports, args.missing, args.stale, args.seed)
+    gemini = FakeGemini(fault=Fault.parse(args.gemini, seed=args.seed))
+    supabase.fault = Fault.parse(args.supabase, seed=args.seed)
+    checkpoint = os.path.join(tempfile.mkdtemp(), "backfill.json")
+
+    def job():
+        return EmbeddingBackfill(supabase, ModelClient(gemini), model=NEW_MODEL, batch_size=batch_size,
+                                 concurrency=concurrency, requests_per_minute=args.requests_per_minute,
+                                 checkpoint_path=checkpoint)
+
+    start = time.perf_counter()
+    resumed = False
+    if stop_after:
+        job().run(limit=stop_after)
+        resumed = os.path.exists(checkpoint)
+    stats = job().run()
+    return stats, time.perf_counter() - start, gemini.calls, supabase, resumed
+
+
+def check(supabase):
+    rows = supabase.tables["scamreports"]
+    wrong = [row["id"] for row in rows if row["embedding_model"] != NEW_MODEL or not row["embeddings"]]
+    return len(rows) - len(wrong), len(wrong)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=5000)
+    parser.add_argument("--baseline-reports", type=int, default=500, help="table size for the one-text-per-request run")
+    parser.add_argument("--missing", type=float, default=0.1, help="share of reports with no embedding")
+    parser.add_argument("--stale", type=float, default=0.6, help="share of reports embedded with an older model")
+    parser.add_argument("--gemini", default="400:200:0.02")
+    parser.add_argument("--supabase", default="30:10")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=6000)
+    parser.add_argument("--seed", type=int, default=24)
+    args = parser.parse_args()
+
+    runs = [
+        # Rows per second don't depend on the table size here, so the slow baseline gets a smaller table
+        ("one text per request", min(args.reports, args.baseline_reports), 1, None),
+        (f"batches of {args.batch_size}, stopped and resumed", args.reports, args.batch_size, args.reports // 3),
+    ]
+    for name, reports, batch_size, stop_after in runs:
+        stats, seconds, requests, supabase, resumed = run(args, reports, batch_size, args.concurrency, stop_after)
+        done, wrong = check(supabase)
+        print(f"{name:<40} {stats['rows']:>5} rows in {seconds:6.1f}s  {stats['rows'] / seconds:7.1f} rows/s  "
+              f"gemini requests {requests:>5}  ${stats['cost_per_1k_rows']:.4f} per 1k rows  "
+              f"{'resumed from checkpoint, ' if resumed else ''}{done}/{done + wrong} reports on {NEW_MODEL}")
+
+
+if __name__ == '__main__':
+    main()
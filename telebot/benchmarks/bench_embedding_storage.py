@@ -0,0 +1,112 @@
+"""
+Payload size per report and duplicate-matching accuracy of the scamreports embedding storage.
+
+Usage: python benchmarks/bench_embedding_storage.py [--dim 3072] [--campaigns 300] [--reports 6000] [--spread 0.92]
+
+Size: bytes on disk for a vector versus a halfvec column, and the JSON text sent on insert and
+returned on reads, before (float32 vector, full-precision Python floats) and after (normalised halfvec).
+
+Accuracy: a stream of reports from synthetic scam campaigns goes through the bot's duplicate check,
+a ScamVectorIndex query at SIMILARITY_THRESHOLD. A match is merged into that report and a miss becomes a new
+report. Reports sit at cosine `--spread` from their campaign's centre on average, some much further
+(a victim describing the scam in their own words), and some campaigns share a scam type, as parcel or
+bank phishing variants do. Two reports of one campaign are less alike than a report and the campaign
+centre, so matching depends on the merged embedding tracking the centre.
+The stream runs with each combination of storage precision and merge rule.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ScamVectorIndex, normalize, parse_embedding, running_mean, to_halfvec  # noqa: E402
+
+SIMILARITY_THRESHOLD = 0.85  # functions.SIMILARITY_THRESHOLD; importing functions needs the bot's config
+
+
+def pairwise_mean(centroid, count, embedding):
+    """The merge before this change: (stored + new) / 2 whatever the count."""
+    centroid, vector = parse_embedding(centroid), parse_embedding(embedding)
+    if centroid is None or centroid.size != vector.size:
+        return vector
+    return (centroid + vector) / 2
+
+
+def campaigns(args, rng):
+    """Campaign centres, a few per scam type, and a heavy-tailed stream of (campaign, embedding) reports."""
+    types_ = np.array([normalize(v) for v in rng.standard_normal((max(1, args.campaigns // 10), args.dim))])
+    centres = np.array([normalize(0.5 * types_[rng.integers(len(types_))] + np.sqrt(0.75) * normalize(v))
+                        for v in rng.standard_normal((args.campaigns, args.dim))])
+    popularity = 1.0 / np.arange(1, args.campaigns + 1)
+    labels = rng.choice(args.campaigns, size=args.reports, p=popularity / popularity.sum())
+    spreads = np.clip(rng.normal(args.spread, 0.03, size=args.reports), 0.75, 0.99)
+    noise_scales = np.sqrt(1 / spreads ** 2 - 1) / np.sqrt(args.dim)  # |noise| makes cos(report, centre) = spread
+    stream = [normalize(centres[label] + rng.standard_normal(args.dim) * scale) for label, scale in zip(labels, noise_scales)]
+    return centres, labels, stream
+
+
+def simulate(centres, labels, stream, store, merge):
+    """Runs the duplicate check over the stream. Returns (missed merges, wrong merges, rows, centre similarity of busy reports)."""
+    index = ScamVectorIndex(initial_capacity=len(stream))
+    rows = {}  # report id -> [stored embedding, count, campaign of first report]
+    missed = wrong = 0
+    for i, (label, embedding) in enumerate(zip(labels, stream)):
+        matches = index.query(embedding, k=1, threshold=SIMILARITY_THRESHOLD)
+        if matches:
+            row = rows[matches[0][0]]
+            wrong += row[2] != label
+            row[0] = store(merge(row[0], row[1], embedding))
+            row[1] += 1
+            index.upsert(matches[0][0], row[0])
+            continue
+        missed += any(row[2] == label for row in rows.values())
+        rows[i] = [store(embedding), 1, label]
+        index.upsert(i, rows[i][0])
+    # How close the stored embedding of each report with 10+ merges is to its campaign centre
+    similarity = np.mean([normalize(parse_embedding(embedding)) @ centres[label]
+                          for embedding, count, label in rows.values() if count >= 10])
+    return missed, wrong, len(rows), similarity
+
+
+def sizes(dim, rng):
+    embedding = normalize(rng.standard_normal(dim)).astype(np.float32)
+    before_insert = len(json.dumps([float(value) for value in embedding]))  # what the bot sent before
+    before_read = len("[" + ",".join(map(str, embedding)) + "]")  # vector_out: shortest float4 text
+    after = len(to_halfvec(embedding))  # insert payload, and halfvec_out on reads
+    print(f"dim {dim}: on disk vector {4 * dim + 8:,} B -> halfvec {2 * dim + 8:,} B; "
+          f"JSON insert {before_insert:,} B -> {after:,} B; read {before_read:,} B -> {after:,} B")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--campaigns", type=int, default=300)
+    parser.add_argument("--reports", type=int, default=6000)
+    parser.add_argument("--spread", type=float, default=0.92, help="cosine similarity of a report to its campaign centre")
+    parser.add_argument("--seed", type=int, default=23)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    sizes(args.dim, rng)
+    centres, labels, stream = campaigns(args, rng)
+    campaigns_seen = len(set(labels.tolist()))
+    print(f"{args.reports:,} reports from {campaigns_seen} campaigns, threshold {SIMILARITY_THRESHOLD}")
+    float32 = lambda embedding: parse_embedding(embedding).tolist()  # noqa: E731
+    runs = [
+        ("float32, pairwise mean (before)", float32, pairwise_mean),
+        ("halfvec, pairwise mean", to_halfvec, pairwise_mean),
+        ("float32, count-weighted mean", float32, running_mean),
+        ("halfvec, count-weighted mean (after)", to_halfvec, running_mean),
+    ]
+    for name, store, merge in runs:
+        missed, wrong, rows, similarity = simulate(centres, labels, stream, store, merge)
+        print(f"  {name:<38} rows {rows:>5} (ideal {campaigns_seen})  missed merges {missed:>5}  "
+              f"wrong merges {wrong:>3}  centre similarity {similarity:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Offline throughput and latency of the bot's handlers, run against the fakes in benchmarks/fakes.py.
+
+Usage: python benchmarks/bench_handlers.py [--ops 200] [--concurrency 8] [--scenarios chat verify report broadcast]
+                                           [--gemini 300:200:0] [--supabase 20:10:0] [--telegram 30:20:0]
+                                           [--compare benchmarks/results/<commit>.json]
+
+Scenarios:
+  chat       send_message in a DM (one Gemini call and one reply)
+  verify     process_verification_request, with a share of forwarded repeats (--repeat-ratio)
+  report     the whole /report state machine per user, ending in process_full_report; descriptions come
+             from a few campaigns, so later reports merge into earlier ones
+  flood      chat where half the messages come from one spammer; timed for the other users only
+  broadcast  one broadcast_popular_scams pass over --ops seeded reports, timed per alert
+
+Fault profiles are "latency_ms[:jitter_ms[:failure_rate[:stall_rate:stall_ms]]]". chat and verify also
+report the time until the user sees the first reply, which streaming (on unless --no-stream) shortens. Results are written to
+benchmarks/results/<commit>.json (with a -dirty suffix for uncommitted trees). --compare
+prints the change against an earlier result and exits non-zero if p99 latency or throughput
+regressed by more than --tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# functions.py reads these at import time; the real services are replaced below
+os.environ.setdefault("API_KEY", "offline-benchmark")
+os.environ.setdefault("TELEGRAM_CHANNEL_ID", "-1001234567890")
+os.environ["DB_ENABLED"] = "False"
+os.environ.setdefault("SESSION_BACKEND", "memory")
+
+import functions as f  # noqa: E402
+import metrics  # noqa: E402
+from fakes import Fault, FakeBot, FakeGemini, FakeSupabase, make_message  # noqa: E402
+from model_client import ModelClient  # noqa: E402
+from ratelimit import TokenBucket  # noqa: E402
+
+CAMPAIGNS = [
+    "Got an SMS from DBS saying my account is locked and asking me to log in at dbs-secure-login.com",
+    "Someone on Carousell asked me to pay a deposit through PayNow before viewing the item, then blocked me",
+    "A caller claiming to be from the police said my bank account was used for money laundering and asked for my OTP",
+    "Telegram job offer paying for liking YouTube videos, then asked me to top up 500 dollars to unlock commissions",
+    "WhatsApp message from a friend's number asking to borrow money urgently and transfer to a new account",
+]
+CHAT_MESSAGES = [
+    "How do I know if a message from my bank is real?",
+    "Is it safe to click links in SMS messages?",
+    "What should I do if I already gave my OTP to someone?",
+    "How do job scams on Telegram usually work?",
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_concurrently(task, ops, concurrency):
+    """Runs task(i) for i in range(ops) on `concurrency` threads. Returns (latencies_ms, errors, wall_seconds)."""
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            task(i)
+            ok = True
+        except Exception:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(ops)))
+    wall = time.perf_counter() - start
+    return [latency for latency, _ in results], sum(1 for _, ok in results if not ok), wall
+
+
+def summarize(latencies, errors, wall, ops):
+    return {
+        "ops": ops,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(ops / wall, 2) if wall else 0.0,
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else 0.0,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else 0.0,
+    }
+
+
+def scenario_chat(bot, gemini, args, rng):
+    def task(i):
+        bot.expect_reply(1_000 + i)
+        f.send_message(bot, gemini, make_message(1_000 + i, f"{CHAT_MESSAGES[i % len(CHAT_MESSAGES)]} ({i})"))
+    return run_concurrently(task, args.ops, args.concurrency)
+
+
+def scenario_verify(bot, gemini, args, rng):
+    words = ("parcel customs fee bank account locked verify login prize winner lottery refund tax job offer "
+             "crypto wallet investment returns loan approved urgent police courier delivery otp password").split()
+    texts = []
+    for i in range(args.ops):
+        if texts and rng.random() < args.repeat_ratio:
+            texts.append(rng.choice(texts))  # the same scam forwarded by another user
+        else:
+            texts.append(" ".join(rng.choice(words) for _ in range(20)) + f" https://{rng.getrandbits(32):08x}.example.com")
+
+    def task(i):
+        bot.expect_reply(2_000 + i)
+        f.process_verification_request(make_message(2_000 + i, texts[i]), bot, gemini)
+    return run_concurrently(task, args.ops, args.concurrency)
+
+
+def scenario_report(bot, gemini, args, rng):
+    f.load_scam_index()
+    descriptions = [f"{CAMPAIGNS[i % len(CAMPAIGNS)]}. Happened on day {rng.randint(1, 28)}." for i in range(args.ops)]
+
+    def task(i):
+        chat_id = 3_000 + i
+        steps = [make_message(chat_id, descriptions[i])]
+        if args.photos:
+            steps.append(make_message(chat_id, "Yes (Submit evidence)"))
+            for photo in range(args.photos):
+                steps.append(make_message(chat_id, photo_file_id=f"photo-{i}-{photo}"))
+                steps.append(make_message(chat_id, "Yes (Submit evidence)" if photo < args.photos - 1 else "No (Submit report)"))
+        else:
+            steps.append(make_message(chat_id, "No (Submit report)"))
+        steps.append(make_message(chat_id, "Confirm submission"))
+
+        f.report_scam(bot, make_message(chat_id, "/report"), gemini)
+        for message in steps:
+            if not bot.deliver(message):
+                raise RuntimeError(f"report flow for chat {chat_id} stopped before '{message.text}'")
+        if chat_id in f.user_reports:
+            raise RuntimeError(f"report draft for chat {chat_id} was not submitted")
+    return run_concurrently(task, args.ops, args.concurrency)
+
+
+def scenario_flood(bot, gemini, args, rng):
+    """Half the traffic is one user spamming chat; latency is measured for everyone else."""
+    spammer = 9_999
+    latencies = []
+
+    def task(i):
+        if i % 2:
+            f.send_message(bot, gemini, make_message(spammer, f"spam {i}"))
+            return
+        start = time.perf_counter()
+        f.send_message(bot, gemini, make_message(4_000 + i, f"{CHAT_MESSAGES[i % len(CHAT_MESSAGES)]} ({i})"))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    _, errors, wall = run_concurrently(task, args.ops, args.concurrency)
+    return latencies, errors, wall
+
+
+def scenario_broadcast(bot, gemini, args, rng):
+    f.supabase._client.seed_reports(args.ops, min_count=f.BROADCAST_MIN_COUNT)
+    latencies = []
+    send_broadcast = f.send_broadcast
+
+    def timed_send(*send_args, **send_kwargs):
+        start = time.perf_counter()
+        try:
+            return send_broadcast(*send_args, **send_kwargs)
+        finally:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    f.send_broadcast = timed_send
+    try:
+        start = time.perf_counter()
+        f.broadcast_popular_scams(bot)
+        wall = time.perf_counter() - start
+    finally:
+        f.send_broadcast = send_broadcast
+    unsent = sum(1 for row in f.supabase._client.tables["scamreports"] if not row["was_broadcasted"])
+    return latencies, unsent, wall
+
+
+SCENARIOS = {
+    "chat": scenario_chat,
+    "verify": scenario_verify,
+    "report": scenario_report,
+    "flood": scenario_flood,
+    "broadcast": scenario_broadcast,
+}
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", ".."], cwd=BENCHMARKS_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path, tolerance):
+    """Prints changes against a stored result. Returns True if anything regressed beyond tolerance."""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    regressed = False
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        p99_change = (current["p99_ms"] - before["p99_ms"]) / before["p99_ms"] if before["p99_ms"] else 0.0
+        throughput_change = ((current["throughput_per_second"] - before["throughput_per_second"]) / before["throughput_per_second"]
+                             if before["throughput_per_second"] else 0.0)
+        flag = p99_change > tolerance or throughput_change < -tolerance
+        regressed |= flag
+        print(f"  {name:<10} p99 {before['p99_ms']:9.1f} -> {current['p99_ms']:9.1f}ms ({p99_change:+.1%})  "
+              f"throughput {before['throughput_per_second']:8.1f} -> {current['throughput_per_second']:8.1f}/s "
+              f"({throughput_change:+.1%}){'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous users, like BOT_WORKERS")
+    parser.add_argument("--photos", type=int, default=1, help="photos attached to each /report")
+    parser.add_argument("--repeat-ratio", type=float, default=0.25, help="share of /verify messages that repeat earlier ones")
+    parser.add_argument("--gemini", default="300:200:0")
+    parser.add_argument("--supabase", default="20:10:0")
+    parser.add_argument("--storage", default="80:40:0")
+    parser.add_argument("--telegram", default="30:20:0")
+    parser.add_argument("--download", default="50:30:0")
+    parser.add_argument("--broadcast-rate", type=float, default=0.0,
+                        help="channel messages per second for broadcasts (0 = no rate limit, to time the code path)")
+    parser.add_argument("--seed", type=int, default=16)
+    parser.add_argument("--no-stream", action="store_true", help="send chat and /verify replies only once complete")
+    parser.add_argument("--output", help="where to write results (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--verbose", action="store_true", help="show the handlers' log output")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")}
+    results = {"commit": current_commit(), "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+               "config": config, "scenarios": {}}
+
+    f.STREAM_REPLIES = not args.no_stream
+    for index, name in enumerate(args.scenarios):
+        seed = args.seed * 100 + index
+        bot = FakeBot(Fault.parse(args.telegram, seed), download_fault=Fault.parse(args.download, seed + 1))
+        fake_gemini = FakeGemini(Fault.parse(args.gemini, seed + 2))
+        # The handlers get the same resilient wrapper as in production
+        gemini = ModelClient(fake_gemini, admit=f.admission.admit_fallback)
+        f.client = gemini  # embeddings go through the module-level client
+        f.supabase = metrics.InstrumentedSupabase(FakeSupabase(Fault.parse(args.supabase, seed + 3),
+                                                               storage_fault=Fault.parse(args.storage, seed + 4)))
+        f.db_enabled = True
+        f.broadcast_limiter = (TokenBucket(rate=args.broadcast_rate, capacity=1) if args.broadcast_rate
+                               else TokenBucket(rate=1e9, capacity=1e9))
+
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with log:
+            latencies, errors, wall = SCENARIOS[name](bot, gemini, args, random.Random(seed))
+        summary = summarize(latencies, errors, wall, len(latencies))
+        summary["gemini_calls"] = fake_gemini.calls
+        summary["telegram_calls"] = bot.sent
+        first_reply = ""
+        if bot.first_reply_seconds:
+            replies_ms = [seconds * 1000 for seconds in bot.first_reply_seconds]
+            summary["first_reply_p50_ms"] = round(statistics.median(replies_ms), 2)
+            summary["first_reply_p99_ms"] = round(percentile(replies_ms, 99), 2)
+            first_reply = f"  first reply p50 {summary['first_reply_p50_ms']:.1f}ms p99 {summary['first_reply_p99_ms']:.1f}ms"
+        results["scenarios"][name] = summary
+        print(f"{name:<10} {summary['ops']:>5} ops  {summary['throughput_per_second']:8.1f}/s  "
+              f"p50 {summary['p50_ms']:8.1f}ms  p99 {summary['p99_ms']:8.1f}ms  errors {errors}  "
+              f"gemini calls {fake_gemini.calls}{first_reply}")
+
+    output = args.output or os.path.join(BENCHMARKS_DIR, "results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+/history page latency at scale: the keyset query over scamreport_users against the previous
+`user_ids @> array[...] order by timestamp` scan of scamreports.
+
+Usage: python benchmarks/bench_history.py --dsn postgresql://... [--bootstrap] [--reports 1000000] [--users 200000]
+
+Runs against a Postgres with supabase/migrations applied. For a local Postgres, --bootstrap first
+applies them with the Supabase stand-ins from local_db.py.
+Synthetic reports are inserted with ids from a fixed namespace, tagged 'history benchmark',
+and deleted afterwards. One "heavy" user is attached to 1% of the reports so deep pages exist.
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+import local_db
+
+HEAVY_USER = "bench-heavy-user"
+
+KEYSET_PAGE = """
+    select u.report_id, u.reported_at, r.title, r.type
+    from public.scamreport_users as u
+    join public.scamreports as r on r.id = u.report_id
+    where u.user_id = %(user_id)s
+      and (%(reported_at)s::bigint is null
+           or u.reported_at < %(reported_at)s
+           or (u.reported_at = %(reported_at)s and u.report_id < %(report_id)s::uuid))
+    order by u.reported_at desc, u.report_id desc
+    limit %(limit)s
+"""
+
+ARRAY_SCAN = """
+    select title, summary, timestamp, type, image
+    from public.scamreports
+    where user_ids @> array[%(user_id)s]
+    order by timestamp desc
+    limit %(limit)s
+"""
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def populate(cursor, reports, users):
+    start = time.perf_counter()
+    cursor.execute(
+        """
+        insert into public.scamreports (id, title, summary, type, count, user_ids, timestamp)
+        select md5('history-bench-' || i)::uuid, 'history benchmark', '', 'General Scam', 1,
+               case when i %% 100 = 0 then array['bench-user-' || (i %% %(users)s), %(heavy)s]
+                    else array['bench-user-' || (i %% %(users)s)] end,
+               1700000000000 + i * 1000
+        from generate_series(1, %(reports)s) as i
+        """,
+        {"reports": reports, "users": users, "heavy": HEAVY_USER},
+    )
+    cursor.execute("analyze public.scamreports")
+    cursor.execute("analyze public.scamreport_users")
+    print(f"Inserted {reports} reports in {time.perf_counter() - start:.1f}s")
+
+
+def time_query(cursor, sql, params, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, rows
+
+
+def report(label, samples):
+    print(f"{label:<38} p50 {statistics.median(samples):8.2f}ms  p99 {percentile(samples, 99):8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--bootstrap", action="store_true", help="apply supabase/migrations first (local Postgres only)")
+    parser.add_argument("--reports", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    if args.bootstrap:
+        local_db.bootstrap(args.dsn)
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        populate(cursor, args.reports, args.users)
+        limit = args.page_size + 1
+
+        for user_id in ("bench-user-7", HEAVY_USER):
+            params = {"user_id": user_id, "reported_at": None, "report_id": None, "limit": limit}
+            samples, _ = time_query(cursor, KEYSET_PAGE, params, args.runs)
+            report(f"keyset first page ({user_id})", samples)
+
+        # Walk the heavy user's history and time pages far from the start
+        params = {"user_id": HEAVY_USER, "reported_at": None, "report_id": None, "limit": 1000}
+        cursor.execute(KEYSET_PAGE, params)
+        deep = cursor.fetchall()[-1]
+        params = {"user_id": HEAVY_USER, "reported_at": deep[1], "report_id": deep[0], "limit": limit}
+        samples, _ = time_query(cursor, KEYSET_PAGE, params, args.runs)
+        report("keyset page after 1000 rows (heavy)", samples)
+
+        for user_id in ("bench-user-7", HEAVY_USER):
+            samples, _ = time_query(cursor, ARRAY_SCAN, {"user_id": user_id, "limit": limit}, max(5, args.runs // 10))
+            report(f"user_ids array scan ({user_id})", samples)
+    finally:
+        start = time.perf_counter()
+        cursor.execute("delete from public.scamreports where title = 'history benchmark'")
+        print(f"Cleaned up in {time.perf_counter() - start:.1f}s")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Lookup latency of ImageHashIndex against a NumPy brute-force Hamming scan.
+
+Usage: python benchmarks/bench_image_hash.py [--sizes 10000 100000 1000000] [--max-distance 6]
+
+Stored hashes are uniformly random 64-bit values. Half of the queries are planted near-duplicates
+(a stored hash with a few bits flipped) and must be found; the rest are random misses.
+Real dHashes are less uniform, so buckets are somewhat fuller than here.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_hash import ImageHashIndex  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def flip_bits(value, count, rng):
+    for position in rng.sample(range(64), count):
+        value ^= 1 << position
+    return value
+
+
+def brute_force(hashes, query, max_distance):
+    distances = np.bitwise_count(hashes ^ np.uint64(query))
+    return np.nonzero(distances <= max_distance)[0]
+
+
+def run(size, max_distance, queries, rng):
+    hashes = [rng.getrandbits(64) for _ in range(size)]
+    start = time.perf_counter()
+    index = ImageHashIndex(max_distance=max_distance)
+    index.add_many((f"report-{i}", value) for i, value in enumerate(hashes))
+    build = time.perf_counter() - start
+
+    planted = [(i, flip_bits(hashes[i], rng.randint(0, max_distance), rng)) for i in rng.sample(range(size), queries // 2)]
+    misses = [rng.getrandbits(64) for _ in range(queries - len(planted))]
+
+    samples, found = [], 0
+    for i, query in planted:
+        start = time.perf_counter()
+        matches = index.query(query)
+        samples.append((time.perf_counter() - start) * 1e6)
+        found += any(report_id == f"report-{i}" for report_id, _ in matches)
+    for query in misses:
+        start = time.perf_counter()
+        index.query(query)
+        samples.append((time.perf_counter() - start) * 1e6)
+
+    array = np.array(hashes, dtype=np.uint64)
+    brute = []
+    for _, query in planted[:50]:
+        start = time.perf_counter()
+        brute_force(array, query, max_distance)
+        brute.append((time.perf_counter() - start) * 1e6)
+
+    print(f"{size:>9} hashes  build {build:6.1f}s  index p50 {statistics.median(samples):7.1f}us "
+          f"p99 {percentile(samples, 99):7.1f}us  recall {found}/{len(planted)}  "
+          f"brute force p50 {statistics.median(brute):9.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-distance", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, args.max_distance, args.queries, rng)
+
+
+if __name__ == '__main__':
+    main()
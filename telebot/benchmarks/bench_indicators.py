@@ -0,0 +1,127 @@
+"""
+Build time, memory and match throughput of indicators.IndicatorIndex at a million indicators.
+
+Usage: python benchmarks/bench_indicators.py [--indicators 1000000] [--messages 20000] [--hit-rate 0.2]
+
+Synthetic indicators (scam domains and links, Singapore phone numbers, wallets and handles) are
+spread over reports five at a time and loaded through add(), as a cold start from the database
+would. A batch of /verify-sized messages, a share of which mention a known indicator (sometimes on
+a subdomain), is then matched one message at a time. A plain dict of value strings is built
+alongside for comparison.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indicators import IndicatorIndex, extract_indicators  # noqa: E402
+
+WORDS = ("your parcel is held pending payment of the customs fee please act now or the item will be returned "
+         "hi are we still meeting tomorrow for lunch the bank says my account is locked click here to verify").split()
+BASE58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def random_indicator(rng, i):
+    kind = rng.random()
+    if kind < 0.35:
+        return "domain", f"{rng.choice(['dbs', 'ocbc', 'parcel', 'gov', 'claim'])}-{i:x}-{rng.choice(['verify', 'login', 'pay'])}.{rng.choice(['com', 'xyz', 'top', 'info'])}"
+    if kind < 0.6:
+        return "url", f"bit.ly/{i:x}{rng.getrandbits(20):x}"
+    if kind < 0.8:
+        return "phone", f"+65{rng.choice('89')}{rng.randrange(10_000_000):07d}"
+    if kind < 0.9:
+        return "wallet", "T" + "".join(rng.choice(BASE58) for _ in range(33))
+    return "handle", f"@scam_agent_{i:x}"
+
+
+def as_text(kind, value, rng):
+    if kind == "domain":
+        return f"https://{rng.choice(['', 'secure.', 'login.'])}{value}/account"
+    if kind == "phone":
+        # Bare numbers are only read as phone numbers after a cue word
+        return f"{rng.choice(['call', 'WhatsApp', 'SMS'])} {value[3:7]} {value[7:]}"
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--indicators", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--hit-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=22)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    rows = []
+    report_id = None
+    for i in range(args.indicators):
+        if i % 5 == 0:
+            report_id = str(uuid.uuid4())
+        rows.append((report_id,) + random_indicator(rng, i))
+
+    def build_index():
+        index = IndicatorIndex()
+        for report_id, kind, value in rows:
+            index.add(report_id, kind, value)
+        index._merge()  # as load() does at the end
+        return index
+
+    def build_baseline():
+        baseline = {}
+        for report_id, kind, value in rows:
+            baseline.setdefault(f"{kind}:{value}", []).append(report_id)
+        return baseline
+
+    def measure(build):
+        """Returns (structure, seconds, bytes); memory comes from a second, traced build since tracing slows it down."""
+        start = time.perf_counter()
+        built = build()
+        seconds = time.perf_counter() - start
+        del built
+        tracemalloc.start()
+        built = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return built, seconds, size
+
+    index, build_seconds, index_bytes = measure(build_index)
+    baseline, baseline_seconds, baseline_bytes = measure(build_baseline)
+    print(f"{len(index):,} indicators  build {build_seconds:.1f}s  {index_bytes / 2**20:.0f} MB "
+          f"(dict of strings: {baseline_seconds:.1f}s, {baseline_bytes / 2**20:.0f} MB)")
+
+    messages, expected = [], 0
+    for _ in range(args.messages):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(12, 40))]
+        if rng.random() < args.hit_rate:
+            _, kind, value = rng.choice(rows)
+            words.insert(rng.randrange(len(words)), as_text(kind, value, rng))
+            expected += 1
+        messages.append(" ".join(words))
+
+    latencies, hits = [], 0
+    start = time.perf_counter()
+    for message in messages:
+        message_start = time.perf_counter()
+        hits += bool(index.match(message))
+        latencies.append(time.perf_counter() - message_start)
+    wall = time.perf_counter() - start
+    latencies.sort()
+
+    start = time.perf_counter()
+    baseline_hits = sum(1 for message in messages
+                        if any(f"{kind}:{value}" in baseline for kind, value in extract_indicators(message)))
+    baseline_wall = time.perf_counter() - start
+
+    print(f"{len(messages):,} messages  {len(messages) / wall:,.0f} msg/s  p50 {latencies[len(latencies) // 2] * 1e6:.0f}us  "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us  hits {hits}/{expected} planted")
+    print(f"dict of strings (exact domains only, no subdomain walk): {len(messages) / baseline_wall:,.0f} msg/s, "
+          f"hits {baseline_hits}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Per-call overhead of the metrics layer, checked against metrics.OVERHEAD_BUDGET_US.
+
+Usage: python benchmarks/bench_metrics.py [--calls 200000]
+
+Measures an external_call() timer around an empty body, a @timed_handler wrapper and a
+Supabase query chained through InstrumentedSupabase (against an in-memory stand-in builder),
+each minus the same work without instrumentation, plus the time to render a scrape.
+Exits non-zero if any per-call overhead exceeds the budget.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+class FakeQuery:
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def execute(self):
+        return None
+
+
+class FakeClient:
+    storage = None
+
+    def table(self, name):
+        return FakeQuery()
+
+
+def per_call_us(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    def bare():
+        pass
+
+    def timed_block():
+        with metrics.external_call("gemini", "bench"):
+            pass
+
+    handler = metrics.timed_handler("bench")(bare)
+
+    raw, instrumented = FakeClient(), metrics.InstrumentedSupabase(FakeClient())
+
+    def raw_query():
+        raw.table("scamreports").select("*").eq("id", 1).limit(1).execute()
+
+    def instrumented_query():
+        instrumented.table("scamreports").select("*").eq("id", 1).limit(1).execute()
+
+    baseline = per_call_us(bare, args.calls)
+    results = {
+        "external_call() timer": per_call_us(timed_block, args.calls) - baseline,
+        "@timed_handler": per_call_us(handler, args.calls) - baseline,
+        "InstrumentedSupabase query (4 chained calls)": per_call_us(instrumented_query, args.calls) - per_call_us(raw_query, args.calls),
+    }
+
+    for i in range(200):
+        metrics.external_call_seconds.labels("supabase", f"table:bench{i}", "ok").observe(0.01)
+    start = time.perf_counter()
+    body = metrics.registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    over_budget = False
+    for name, overhead in results.items():
+        flag = "" if overhead <= metrics.OVERHEAD_BUDGET_US else "  OVER BUDGET"
+        over_budget |= bool(flag)
+        print(f"{name:<46} {overhead:6.2f}us per call (budget {metrics.OVERHEAD_BUDGET_US}us){flag}")
+    print(f"{'scrape render (' + str(body.count(chr(10))) + ' lines)':<46} {render_ms:6.2f}ms")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Query latency and memory of the local ScamVectorIndex on synthetic embeddings, compared against the match_scam RPC.
+
+Usage: python benchmarks/bench_vector_index.py [--sizes 10000 20000 100000] [--dim 3072] [--max-mb 256] [--rpc]
+
+gemini-embedding-exp-03-07 returns 3072 dimensions. Each size is loaded into an index capped at --max-mb;
+sizes past the cap show the index disabling itself, after which the bot matches with match_scam.
+Latency grows linearly with rows and dimension: exact search reads the whole float32 matrix.
+
+The refresh check writes a report's embedding the way the mobile app merges (an update of embeddings
+that leaves timestamp alone) into FakeSupabase and checks the next refresh picks it up.
+
+--rpc also times supabase.rpc('match_scam') against the database in SUPABASE_URL/SUPABASE_KEY.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import EMBEDDING_DIM, FakeSupabase  # noqa: E402
+from vector_index import ScamVectorIndex, normalize, to_halfvec  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_queries(query, vectors):
+    samples = []
+    for vector in vectors:
+        start = time.perf_counter()
+        query(vector)
+        samples.append((time.perf_counter() - start) * 1e3)
+    return samples
+
+
+def build_index(size, dim, max_bytes, rng):
+    index = ScamVectorIndex(max_bytes=max_bytes, initial_capacity=size)
+    chunk = 50_000
+    for offset in range(0, size, chunk):
+        block = rng.standard_normal((min(chunk, size - offset), dim), dtype=np.float32)
+        index.upsert_many((f"report-{offset + i}", row) for i, row in enumerate(block))
+        if index.disabled:
+            break
+    return index
+
+
+def check_refresh(dim, rng):
+    """Returns True if a refresh picks up an embedding rewritten without a timestamp change."""
+    supabase = FakeSupabase()
+    ids = supabase.seed_reports(50)
+    index = ScamVectorIndex(refresh_overlap_ms=0)
+    index.load(supabase)
+    moved = normalize(rng.standard_normal(dim, dtype=np.float32))
+    time.sleep(0.002)
+    supabase.table('scamreports').update({'embeddings': to_halfvec(moved), 'count': 2}).eq('id', ids[7]).execute()
+    added = index.refresh(supabase)
+    match = index.query(moved, k=1, threshold=0.99)
+    return added == 1 and bool(match) and match[0][0] == ids[7]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 20_000, 100_000])
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-mb", type=int, default=256)
+    parser.add_argument("--rpc", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    print(f"{'rows':>10} {'matrix MB':>10} {'p50 ms':>10} {'p99 ms':>10}   (cap {args.max_mb} MB)")
+    for size in args.sizes:
+        index = build_index(size, args.dim, args.max_mb * 2**20, rng)
+        if index.disabled:
+            print(f"{size:>10} {'':>10} {'disabled: over the cap, match_scam serves':>32}")
+            continue
+        samples = time_queries(lambda v: index.query(v, k=1, threshold=0.85), queries)
+        print(f"{size:>10} {index._matrix.nbytes / 2**20:>10.0f} {statistics.median(samples):>10.2f} "
+              f"{percentile(samples, 99):>10.2f}")
+        del index
+
+    print(f"refresh after an embedding-only update: {'picked up' if check_refresh(EMBEDDING_DIM, rng) else 'MISSED'}")
+
+    if args.rpc:
+        from dotenv import load_dotenv
+        from supabase import create_client
+        load_dotenv()
+        supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+        # The RPC runs against the real table, so it uses that table's embedding dimension
+        rpc_queries = rng.standard_normal((min(args.queries, 50), 3072), dtype=np.float32)
+        samples = time_queries(lambda v: supabase.rpc('match_scam', {
+            'query_embedding': to_halfvec(v), 'match_threshold': 0.85, 'match_count': 1,
+        }).execute(), rpc_queries)
+        print(f"{'table':>10} {'rpc':>10} {statistics.median(samples):>10.2f} {percentile(samples, 99):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
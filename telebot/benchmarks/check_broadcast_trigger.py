@@ -0,0 +1,106 @@
+"""
+Merges a report across the broadcast threshold and checks that the scamreports trigger notifies
+exactly once and that listen_for_broadcasts requests exactly one broadcast pass for it.
+
+Usage: python benchmarks/check_broadcast_trigger.py --dsn postgresql://... [--bootstrap] [--merges 4] [--settle 2]
+
+Runs against a Postgres with supabase/migrations applied. For a local Postgres, --bootstrap first
+applies them with the Supabase stand-ins from local_db.py.
+The report starts at count 1, so the second merge crosses the threshold of 3 and the rest go past it.
+A throwaway report is created and deleted afterwards.
+"""
+import argparse
+import os
+import select
+import sys
+import threading
+import time
+import uuid
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broadcast_trigger import NOTIFY_CHANNEL, BroadcastTrigger, listen_for_broadcasts  # noqa: E402
+import local_db  # noqa: E402
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def drain_notifications(conn, report_id, settle):
+    """Payloads for report_id that arrived on conn within `settle` seconds of the last one."""
+    payloads = []
+    while select.select([conn], [], [], settle) != ([], [], []):
+        conn.poll()
+        while conn.notifies:
+            notification = conn.notifies.pop(0)
+            if notification.payload == report_id:
+                payloads.append(notification.payload)
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--bootstrap", action="store_true", help="apply supabase/migrations first (local Postgres only)")
+    parser.add_argument("--merges", type=int, default=4)
+    parser.add_argument("--settle", type=float, default=2.0)
+    args = parser.parse_args()
+    if args.bootstrap:
+        local_db.bootstrap(args.dsn)
+
+    trigger = BroadcastTrigger(lambda: None).start()
+    threading.Thread(target=listen_for_broadcasts, args=(args.dsn, trigger),
+                     kwargs={"poll_seconds": 1}, daemon=True).start()
+    if not wait_for(lambda: trigger.requests >= 1, 10):
+        print("listen_for_broadcasts did not connect")
+        sys.exit(1)
+    requests_before = trigger.requests
+
+    # A second listener sees the raw notifications, independent of the bot's listener
+    listener = psycopg2.connect(args.dsn)
+    listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with listener.cursor() as cursor:
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+    report_id = str(uuid.uuid4())
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "insert into public.scamreports (id, title, summary, type, count, user_ids, timestamp) "
+            "values (%s, 'broadcast trigger check', '', 'General Scam', 1, '{}', %s)",
+            (report_id, int(time.time() * 1000)),
+        )
+    try:
+        counts = []
+        with conn.cursor() as cursor:
+            for i in range(args.merges):
+                cursor.execute("select count from public.merge_scam_report(%s, %s)", (report_id, f"user-{i}"))
+                counts.append(cursor.fetchone()[0])
+        notifications = drain_notifications(listener, report_id, args.settle)
+        time.sleep(args.settle)  # the bot's listener polls on its own connection
+        requested = trigger.requests - requests_before
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("delete from public.scamreports where id = %s", (report_id,))
+        conn.close()
+        listener.close()
+        trigger.stop()
+
+    print(f"counts after each merge: {counts}")
+    print(f"notifications for the report: {len(notifications)} (expected 1)")
+    print(f"broadcast passes requested: {requested} (expected 1), passes run: {trigger.passes}")
+    sys.exit(0 if len(notifications) == 1 and requested == 1 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Fires parallel merge_scam_report calls at one report and checks that no count increment is lost.
+
+Usage: python benchmarks/check_merge_concurrency.py --dsn postgresql://... [--bootstrap] [--merges 100]
+
+Runs against a Postgres with supabase/migrations applied. For a local Postgres, --bootstrap first
+applies them with the Supabase stand-ins from local_db.py.
+A throwaway report is created and deleted afterwards.
+"""
+import argparse
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+import local_db
+
+
+def merge(dsn, report_id, user_id):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("select count from public.merge_scam_report(%s, %s)", (report_id, user_id))
+            return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--bootstrap", action="store_true", help="apply supabase/migrations first (local Postgres only)")
+    parser.add_argument("--merges", type=int, default=100)
+    args = parser.parse_args()
+    if args.bootstrap:
+        local_db.bootstrap(args.dsn)
+
+    report_id = str(uuid.uuid4())
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "insert into public.scamreports (id, title, summary, type, count, user_ids, timestamp) "
+            "values (%s, 'merge concurrency check', '', 'General Scam', 1, '{}', %s)",
+            (report_id, int(time.time() * 1000)),
+        )
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.merges) as pool:
+            list(pool.map(lambda i: merge(args.dsn, report_id, str(i)), range(args.merges)))
+        elapsed = time.perf_counter() - start
+
+        with conn.cursor() as cursor:
+            cursor.execute("select count, cardinality(user_ids) from public.scamreports where id = %s", (report_id,))
+            count, users = cursor.fetchone()
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("delete from public.scamreports where id = %s", (report_id,))
+        conn.close()
+
+    expected = args.merges + 1
+    print(f"{args.merges} parallel merges in {elapsed:.2f}s: count={count} (expected {expected}), user_ids={users}")
+    sys.exit(0 if count == expected and users == args.merges else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Fault-injection check for model_client.ModelClient against the fake Gemini.
+
+Usage: python benchmarks/check_model_client.py [--calls 400] [--concurrency 16] [--deadline 2]
+
+Scenario "slow tail": every call takes 40-80ms, 3% stall for 10s and 3% fail with 503. The raw client
+is compared with ModelClient: p50/p99/max latency and the share of calls that failed.
+Scenario "primary down": every flash call fails. ModelClient should trip the breaker on flash and serve
+from flash-lite without paying the primary's retries on every call.
+Scenario "bad request on trial": the breaker opens, then the half-open trial call gets a 400. The breaker
+must not stay open: once the model answers again, calls go through.
+Scenario "mixed errors": calls alternate between 503 and 400. Bad requests say nothing about the model's
+health, so the 503s alone must still trip the breaker.
+Scenario "fallback admission": with flash down and the admission hook set, calls admitted on flash also
+take a flash-lite slot, so no more than the gate's limit reach flash-lite at once.
+Exits non-zero if ModelClient's max latency exceeds the deadline (plus scheduling slack), or if a
+scenario's check fails.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+from admission import PRIORITY_REPORT, AdmissionController  # noqa: E402
+from benchmarks.fakes import Fault, FakeGemini  # noqa: E402
+from model_client import CircuitOpen, ModelClient  # noqa: E402
+
+PRIMARY = "gemini-2.0-flash"
+FALLBACK = "gemini-2.0-flash-lite"
+SLACK_SECONDS = 0.25
+
+
+def run(client, calls, concurrency):
+    def one(i):
+        start = time.perf_counter()
+        try:
+            client.models.generate_content(model=PRIMARY, contents=f"message {i}")
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(calls)))
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(1 for _, ok in results if not ok)
+    return latencies, failed
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def report(name, latencies, failed):
+    print(f"{name:<12} p50 {percentile(latencies, 0.5) * 1000:8.1f}ms  p99 {percentile(latencies, 0.99) * 1000:8.1f}ms  "
+          f"max {latencies[-1] * 1000:8.1f}ms  failed {failed}/{len(latencies)}")
+
+
+def counter(event):
+    return metrics.events.labels(event).value
+
+
+def bad_request_on_trial(deadline):
+    """Opens the breaker, answers the half-open trial with a 400, then lets the model recover. Returns True if it did."""
+    fake = FakeGemini(faults={PRIMARY: Fault(failure_rate=1.0, seed=4)})
+    client = ModelClient(fake, fallbacks={}, deadline=deadline, base_backoff=0.01, breaker_threshold=2,
+                         breaker_reset_seconds=0.1)
+    for _ in range(2):
+        try:
+            client.models.generate_content(model=PRIMARY, contents="trip")
+        except Exception:
+            pass
+    time.sleep(0.15)
+    fake.faults[PRIMARY] = Fault(failure_rate=1.0, status=400, seed=5)
+    try:
+        client.models.generate_content(model=PRIMARY, contents="bad request")
+    except Exception as e:
+        print(f"{'':<12} trial call: {type(e).__name__}")
+    fake.faults[PRIMARY] = Fault()
+    try:
+        client.models.generate_content(model=PRIMARY, contents="recovered")
+    except CircuitOpen:
+        return False
+    return client.breaker(PRIMARY).state == "closed"
+
+
+def mixed_errors(deadline, threshold=3):
+    """Alternates 503 and 400 failures, one attempt per call. Returns the breaker state afterwards."""
+    fake = FakeGemini()
+    client = ModelClient(fake, fallbacks={}, deadline=deadline, max_attempts=1, breaker_threshold=threshold)
+    for i in range(threshold * 2):
+        fake.faults[PRIMARY] = Fault(failure_rate=1.0, status=503 if i % 2 == 0 else 400, seed=6 + i)
+        try:
+            client.models.generate_content(model=PRIMARY, contents=f"mixed {i}")
+        except Exception:
+            pass
+    return client.breaker(PRIMARY).state
+
+
+class ConcurrencyProbe:
+    """Wraps FakeGemini and records the most calls in flight per model at once."""
+
+    def __init__(self, fake):
+        self._fake = fake
+        self.models = self
+        self.in_flight = {}
+        self.peak = {}
+        self._lock = threading.Lock()
+
+    def _call(self, method, model, **kwargs):
+        with self._lock:
+            self.in_flight[model] = self.in_flight.get(model, 0) + 1
+            self.peak[model] = max(self.peak.get(model, 0), self.in_flight[model])
+        try:
+            return getattr(self._fake.models, method)(model=model, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight[model] -= 1
+
+    def generate_content(self, model, **kwargs):
+        return self._call("generate_content", model, **kwargs)
+
+
+def fallback_admission(calls, concurrency, deadline, limit=2):
+    """Calls admitted on the primary fall back with the hook set. Returns (failed, peak concurrent fallback calls)."""
+    admission = AdmissionController(max_concurrent_per_model=concurrency, max_queue=calls)
+    admission.gate(FALLBACK).limit = limit
+    probe = ConcurrencyProbe(FakeGemini(Fault(40, 40, seed=6), faults={PRIMARY: Fault(5, 5, failure_rate=1.0, seed=7)}))
+    client = ModelClient(probe, deadline=deadline, base_backoff=0.01, admit=admission.admit_fallback)
+
+    def one(i):
+        try:
+            with admission.admit(PRIMARY, PRIORITY_REPORT, deadline=deadline * 4):
+                client.models.generate_content(model=PRIMARY, contents=f"message {i}")
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(calls)))
+    return results.count(False), probe.peak.get(FALLBACK, 0), limit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--deadline", type=float, default=2.0)
+    args = parser.parse_args()
+    ok = True
+
+    print("slow tail: 40-80ms, 3% stall 10s, 3% fail")
+    fault = Fault(40, 40, failure_rate=0.03, stall_rate=0.03, stall_ms=10_000, seed=1)
+    latencies, failed = run(FakeGemini(fault), args.calls, args.concurrency)
+    report("raw", latencies, failed)
+    fault = Fault(40, 40, failure_rate=0.03, stall_rate=0.03, stall_ms=10_000, seed=1)
+    client = ModelClient(FakeGemini(fault), deadline=args.deadline, hedge_floor=0.1, base_backoff=0.05)
+    hedges, retries = counter("gemini_hedge"), counter("gemini_retry")
+    latencies, failed = run(client, args.calls, args.concurrency)
+    report("ModelClient", latencies, failed)
+    print(f"{'':<12} hedges {counter('gemini_hedge') - hedges:.0f}, retries {counter('gemini_retry') - retries:.0f}")
+    if latencies[-1] > args.deadline + SLACK_SECONDS:
+        print(f"FAIL: max latency over the {args.deadline}s deadline")
+        ok = False
+
+    print(f"\nprimary down: every {PRIMARY} call fails")
+    fake = FakeGemini(Fault(40, 40, seed=2), faults={PRIMARY: Fault(40, 40, failure_rate=1.0, seed=3)})
+    client = ModelClient(fake, deadline=args.deadline, base_backoff=0.05)
+    fallbacks = counter("gemini_fallback")
+    latencies, failed = run(client, args.calls, args.concurrency)
+    report("ModelClient", latencies, failed)
+    print(f"{'':<12} {PRIMARY} calls {fake.calls_by_model.get(PRIMARY, 0)}, {FALLBACK} calls "
+          f"{fake.calls_by_model.get(FALLBACK, 0)}, fallbacks {counter('gemini_fallback') - fallbacks:.0f}, "
+          f"breaker {client.breaker(PRIMARY).state}")
+    if failed or client.breaker(PRIMARY).state == "closed":
+        print("FAIL: calls were not served by the fallback model with the primary's breaker open")
+        ok = False
+
+    print("\nbad request on trial: breaker opens, the half-open trial gets a 400, then the model recovers")
+    recovered = bad_request_on_trial(args.deadline)
+    print(f"{'':<12} later calls {'go through' if recovered else 'still rejected with the circuit open'}")
+    if not recovered:
+        print("FAIL: a 400 on the trial call left the breaker open")
+        ok = False
+
+    print("\nmixed errors: calls alternate between 503 and 400")
+    state = mixed_errors(args.deadline)
+    print(f"{'':<12} breaker {state}")
+    if state == "closed":
+        print("FAIL: bad requests between transient failures kept the breaker from opening")
+        ok = False
+
+    print(f"\nfallback admission: {PRIMARY} down, {FALLBACK} gate limited")
+    failed, peak, limit = fallback_admission(args.calls // 4, args.concurrency, args.deadline)
+    print(f"{'':<12} peak concurrent {FALLBACK} calls {peak} (gate limit {limit}), failed {failed}")
+    if peak > limit:
+        print(f"FAIL: fallback calls bypassed the {FALLBACK} admission gate")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
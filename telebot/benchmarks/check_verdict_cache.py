@@ -0,0 +1,51 @@
+"""
+Checks that verdict_cache.VerdictCache reuses verdicts for near-duplicate messages only when they point
+at the same links, phone numbers, wallets and handles.
+
+Usage: python benchmarks/check_verdict_cache.py
+
+Scenario "link swapped": a genuine bank message is cached as not a scam, then the same message with the
+link changed to a look-alike domain is looked up. It is within the near-duplicate distance, but must miss.
+Scenario "text edited": the same message with a few words changed and the same link must still hit.
+Exits non-zero if a scenario's check fails.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import normalize_text  # noqa: E402
+from verdict_cache import VerdictCache, simhash  # noqa: E402
+
+GENUINE = ("Dear customer, your DBS card ending 1234 was used for a purchase of $52.30 at NTUC. "
+           "If you did not make this transaction, log in at https://www.dbs.com.sg/personal to review it.")
+LINK_SWAPPED = GENUINE.replace("https://www.dbs.com.sg/personal", "https://www.dbs.com.sg.xyz/personal")
+TEXT_EDITED = GENUINE.replace("Dear customer,", "Dear valued customer,")
+VERDICT = "This message is LIKELY NOT A SCAM."
+
+
+def distance(a, b):
+    return bin(simhash(normalize_text(a)) ^ simhash(normalize_text(b))).count("1")
+
+
+def main():
+    ok = True
+    cache = VerdictCache()
+    cache.put(GENUINE, VERDICT)
+
+    print(f"link swapped: Hamming distance {distance(GENUINE, LINK_SWAPPED)} (near-duplicate limit {cache.max_distance})")
+    if cache.get(LINK_SWAPPED) is not None:
+        print("FAIL: a message with a different link reused the cached verdict")
+        ok = False
+
+    print(f"text edited: Hamming distance {distance(GENUINE, TEXT_EDITED)}")
+    if cache.get(TEXT_EDITED) != VERDICT:
+        print("FAIL: a lightly edited message with the same link missed the cache")
+        ok = False
+
+    print(f"stats: {cache.stats()}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
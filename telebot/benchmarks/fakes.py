@@ -0,0 +1,703 @@
+"""
+Deterministic in-process stand-ins for Telegram, Gemini and Supabase, used by the offline benchmarks.
+
+Each fake takes a Fault profile that adds latency (mean plus uniform jitter, in milliseconds),
+stalls a fraction of calls for much longer, and fails a fraction of calls. Randomness comes from a seeded generator, so a run is repeatable.
+Only the API surface the bot actually uses is implemented.
+"""
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+import types as pytypes
+import uuid
+from datetime import datetime, timezone
+
+import telebot
+from google.genai import errors
+
+from embedding_cache import EMBEDDING_MODEL
+from vector_index import normalize, parse_embedding, running_mean, to_halfvec
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class FakeServiceError(Exception):
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status
+
+
+class Fault:
+    """Latency and failure injection for one fake service."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, stall_rate=0.0, stall_ms=0.0, seed=0, status=503):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.status = status  # HTTP status of injected failures where the service has one
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=0):
+        """Parses "latency_ms[:jitter_ms[:failure_rate[:stall_rate:stall_ms]]]", e.g. "40:20:0.01:0.05:10000"."""
+        parts = [float(part) for part in spec.split(":")] if spec else []
+        return cls(*parts, seed=seed)
+
+    def apply(self, what):
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            if self._random.random() < self.stall_rate:
+                delay += self.stall_ms
+            fail = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay / 1000)
+        if fail:
+            raise FakeServiceError(f"injected failure in {what}", self.status)
+
+
+# --- Telegram -------------------------------------------------------------------------------
+
+def make_message(chat_id, text=None, photo_file_id=None, message_id=1):
+    """Builds a telebot Message for a private chat, as Telegram would deliver it."""
+    payload = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+    }
+    if photo_file_id is not None:
+        payload["photo"] = [{"file_id": photo_file_id, "file_unique_id": photo_file_id, "width": 1280, "height": 1280}]
+    else:
+        payload["text"] = text
+    return telebot.types.Message.de_json(payload)
+
+
+def _evidence_png():
+    if Image is None:
+        return b"\x89PNG\r\n\x1a\n" + bytes(4096)
+    image = Image.new("RGB", (1280, 2400), "white")
+    for row in range(0, 2400, 120):
+        image.paste((30, 120, 200), (60, row + 20, 60 + (row * 7) % 1100, row + 90))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+class FakeBot:
+    """
+    Records sent messages and runs next-step handlers like TeleBot does in non-threaded mode.
+    Call deliver() with a user's next message to continue their flow.
+    """
+
+    def __init__(self, fault=None, download_fault=None):
+        self.fault = fault or Fault()
+        self.download_fault = download_fault or self.fault
+        self.sent = 0
+        self.first_reply_seconds = []
+        self._waiting = {}
+        self._next_steps = {}
+        self._message_ids = 0
+        self._lock = threading.Lock()
+        self._photo = _evidence_png()
+
+    def expect_reply(self, chat_id):
+        """Starts timing until the next message sent to chat_id, for first_reply_seconds."""
+        with self._lock:
+            self._waiting[chat_id] = time.perf_counter()
+
+    def _message(self, chat_id, text=None):
+        with self._lock:
+            self.sent += 1
+            started = self._waiting.pop(chat_id, None)
+            if started is not None:
+                self.first_reply_seconds.append(time.perf_counter() - started)
+            self._message_ids += 1
+            return make_message(chat_id, text, message_id=self._message_ids)
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.fault.apply("send_message")
+        return self._message(chat_id, text)
+
+    def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        self.fault.apply("send_photo")
+        return self._message(chat_id, caption)
+
+    def send_media_group(self, chat_id, media, **kwargs):
+        self.fault.apply("send_media_group")
+        return [self._message(chat_id) for _ in media]
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.fault.apply("edit_message_text")
+        return self._message(chat_id, text)
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        self.fault.apply("answer_callback_query")
+        return True
+
+    def get_me(self):
+        return telebot.types.User(id=1, is_bot=True, first_name="TsFraudPmo", username="tsfraudpmo_bot")
+
+    def get_file(self, file_id):
+        self.download_fault.apply("get_file")
+        return pytypes.SimpleNamespace(file_id=file_id, file_path=f"photos/{file_id}.png")
+
+    def download_file(self, file_path):
+        self.download_fault.apply("download_file")
+        return self._photo
+
+    def register_next_step_handler(self, message, callback, *args, **kwargs):
+        with self._lock:
+            self._next_steps[message.chat.id] = (callback, args, kwargs)
+
+    def clear_step_handler_by_chat_id(self, chat_id):
+        with self._lock:
+            self._next_steps.pop(chat_id, None)
+
+    def deliver(self, message):
+        """Runs the next-step handler registered for the message's chat. Returns False if none was waiting."""
+        with self._lock:
+            step = self._next_steps.pop(message.chat.id, None)
+        if step is None:
+            return False
+        callback, args, kwargs = step
+        callback(message, *args, **kwargs)
+        return True
+
+
+# --- Gemini ---------------------------------------------------------------------------------
+
+EMBEDDING_DIM = 768
+
+
+def text_embedding(text, dim=EMBEDDING_DIM):
+    """Hashed bag-of-words vector, so reworded copies of one scam embed close together."""
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        vector[int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _reply_text(prompt):
+    if "single boolean" in prompt:
+        return "true"
+    if "Start your response with a clear assessment" in prompt:
+        return ("This message is LIKELY A SCAM. Step 1: it creates urgency by threatening to close your account today. "
+                "Step 2: it asks for your one-time password, which no bank or official body will ever request. "
+                "Step 3: it links to a site that imitates a legitimate organisation. "
+                "Do not reply, do not click the link, and report the sender.")
+    return "Stay safe: never share one-time passwords, and verify requests through official channels."
+
+
+def _prompt_text(contents):
+    """The latest text the caller sent: a plain prompt, or the last part of a conversation."""
+    if isinstance(contents, str):
+        return contents
+    for item in reversed(contents):
+        if isinstance(item, str):
+            return item
+        if getattr(item, "parts", None):
+            return item.parts[-1].text
+    return ""
+
+
+def _usage(contents, config):
+    """Prompt tokens at about four characters each, counting the system instruction."""
+    items = [contents] if isinstance(contents, str) else contents
+    characters = len(str(getattr(config, "system_instruction", None) or ""))
+    for item in items:
+        if isinstance(item, str):
+            characters += len(item)
+        elif getattr(item, "parts", None):
+            characters += sum(len(part.text or "") for part in item.parts)
+    return pytypes.SimpleNamespace(prompt_token_count=characters // 4 + 1)
+
+
+def _chunks(text, words_per_chunk=4):
+    words = text.split(" ")
+    return [" ".join(words[i:i + words_per_chunk]) + (" " if i + words_per_chunk < len(words) else "")
+            for i in range(0, len(words), words_per_chunk)]
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def _apply_fault(self, what, model):
+        with self._client.lock:
+            self._client.calls += 1
+            self._client.calls_by_model[model] = self._client.calls_by_model.get(model, 0) + 1
+        try:
+            self._client.fault_for(model).apply(what)
+        except FakeServiceError as e:
+            # Surfaces like the SDK's error for an overloaded model, or for a bad request
+            if e.status < 500:
+                raise errors.ClientError(e.status, {"error": {"code": e.status, "message": str(e), "status": "INVALID_ARGUMENT"}})
+            raise errors.ServerError(e.status, {"error": {"code": e.status, "message": str(e), "status": "UNAVAILABLE"}})
+
+    def generate_content(self, model, contents, config=None):
+        self._apply_fault(f"generate_content({model})", model)
+        prompt = _prompt_text(contents)
+        schema = getattr(config, "response_schema", None) if config is not None else None
+        if schema is not None:
+            description = prompt.rsplit(":", 1)[-1].strip()
+            parsed = schema(
+                verdict=True,
+                title=(description[:60] or "Reported scam"),
+                type="Phishing Scam",
+                description=f"Users report: {description[:400]}",
+                avoidance="Do not click unknown links or share one-time passwords.",
+            )
+            return pytypes.SimpleNamespace(parsed=parsed, text=parsed.model_dump_json())
+        text = _reply_text(prompt)
+        # A whole response takes as long to generate as its streamed chunks
+        time.sleep((len(_chunks(text)) - 1) * self._client.chunk_ms / 1000)
+        return pytypes.SimpleNamespace(parsed=None, text=text, usage_metadata=_usage(contents, config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        """The fault's latency comes before the first chunk; later chunks follow every chunk_ms."""
+        self._apply_fault(f"generate_content_stream({model})", model)
+        prompt = _prompt_text(contents)
+        chunks = _chunks(_reply_text(prompt))
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self._client.chunk_ms / 1000)
+            usage = _usage(contents, config) if i == len(chunks) - 1 else None
+            yield pytypes.SimpleNamespace(text=chunk, usage_metadata=usage)
+
+    def embed_content(self, model, contents, config=None):
+        self._apply_fault(f"embed_content({model})", model)
+        texts = contents if isinstance(contents, list) else [contents]
+        return pytypes.SimpleNamespace(embeddings=[pytypes.SimpleNamespace(values=text_embedding(text)) for text in texts])
+
+
+class FakeGemini:
+    """Stands in for genai.Client. `faults` maps a model name to its Fault; `fault` covers the rest."""
+
+    def __init__(self, fault=None, faults=None, chunk_ms=40.0):
+        self.fault = fault or Fault()
+        self.faults = faults or {}
+        self.chunk_ms = chunk_ms
+        self.calls = 0
+        self.calls_by_model = {}
+        self.lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+    def fault_for(self, model):
+        return self.faults.get(model, self.fault)
+
+
+# --- Supabase -------------------------------------------------------------------------------
+
+def _split_top_level(expression):
+    parts, depth, current = [], 0, ""
+    for char in expression:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _coerce(value, like):
+    if value == "null":
+        return None
+    if isinstance(like, bool):
+        return value == "true"
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    return value
+
+
+def _compare(row_value, op, value):
+    if op == "is":
+        return row_value is None if value in ("null", None) else row_value == value
+    if op == "in":
+        return row_value in value
+    if row_value is None:
+        return False
+    if isinstance(value, str):
+        value = _coerce(value, row_value)
+    return {
+        "eq": row_value == value,
+        "neq": row_value != value,
+        "gt": row_value > value,
+        "gte": row_value >= value,
+        "lt": row_value < value,
+        "lte": row_value <= value,
+    }[op]
+
+
+def _parse_condition(expression):
+    """Parses a PostgREST logic expression ("a.eq.1,and(b.gt.2,c.is.null)") into a predicate on a row."""
+    expression = expression.strip()
+    for logic in ("and", "or"):
+        if expression.startswith(f"{logic}(") and expression.endswith(")"):
+            children = [_parse_condition(part) for part in _split_top_level(expression[len(logic) + 1:-1])]
+            combine = all if logic == "and" else any
+            return lambda row: combine(child(row) for child in children)
+    column, op, value = expression.split(".", 2)
+    return lambda row: _compare(row.get(column), op, value)
+
+
+class _NotProxy:
+    def __init__(self, query):
+        self._query = query
+
+    def is_(self, column, value):
+        self._query._filters.append(lambda row: not _compare(row.get(column), "is", value))
+        return self._query
+
+
+class FakeQuery:
+    def __init__(self, database, table):
+        self._database = database
+        self._table = table
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._single = False
+        self._operation = ("select", None)
+
+    # Operations
+    def select(self, *columns, **kwargs):
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._operation = ("insert", payload)
+        return self
+
+    def upsert(self, payload, on_conflict="", ignore_duplicates=False, **kwargs):
+        self._operation = ("upsert", (payload, on_conflict, ignore_duplicates))
+        return self
+
+    def update(self, values, **kwargs):
+        self._operation = ("update", values)
+        return self
+
+    def delete(self, **kwargs):
+        self._operation = ("delete", None)
+        return self
+
+    # Filters
+    def _filter(self, column, op, value):
+        self._filters.append(lambda row: _compare(row.get(column), op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", list(values))
+
+    def is_(self, column, value):
+        return self._filter(column, "is", value)
+
+    def contains(self, column, values):
+        self._filters.append(lambda row: set(values) <= set(row.get(column) or []))
+        return self
+
+    def or_(self, expression):
+        self._filters.append(_parse_condition(f"or({expression})"))
+        return self
+
+    @property
+    def not_(self):
+        return _NotProxy(self)
+
+    # Modifiers
+    def order(self, column, desc=False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def execute(self):
+        self._database.fault.apply(f"table:{self._table}")
+        with self._database.lock:
+            rows = self._database.tables.setdefault(self._table, [])
+            kind, payload = self._operation
+            if kind == "insert":
+                inserted = [self._database.prepare_row(self._table, dict(row)) for row in _as_list(payload)]
+                rows.extend(inserted)
+                return _response(inserted)
+            if kind == "upsert":
+                records, on_conflict, ignore_duplicates = payload
+                keys = [key.strip() for key in on_conflict.split(",") if key.strip()]
+                written = []
+                for record in _as_list(records):
+                    existing = next((row for row in rows if keys and all(row.get(k) == record.get(k) for k in keys)), None)
+                    if existing is None:
+                        row = self._database.prepare_row(self._table, dict(record))
+                        rows.append(row)
+                        written.append(row)
+                    elif not ignore_duplicates:
+                        existing.update(record)
+                        written.append(existing)
+                return _response(written)
+
+            matched = [row for row in rows if all(check(row) for check in self._filters)]
+            if kind == "update":
+                for row in matched:
+                    previous = row.get("embeddings")
+                    row.update(self._operation[1])
+                    if self._table == "scamreports" and row.get("embeddings") != previous:
+                        self._database.touch_embedding(row)
+            elif kind == "delete":
+                self._database.tables[self._table] = [row for row in rows if row not in matched]
+            for column, desc in reversed(self._order):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if self._limit is not None:
+                matched = matched[:self._limit]
+            data = [json.loads(json.dumps(row)) for row in matched]
+        if self._single:
+            if len(data) != 1:
+                raise FakeServiceError(f"single() matched {len(data)} rows in {self._table}")
+            return _response(data[0])
+        return _response(data)
+
+
+def _as_list(payload):
+    return payload if isinstance(payload, list) else [payload]
+
+
+def _response(data):
+    return pytypes.SimpleNamespace(data=data, count=None)
+
+
+class _FakeRpc:
+    def __init__(self, database, name, params):
+        self._database = database
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        self._database.fault.apply(f"rpc:{self._name}")
+        with self._database.lock:
+            return _response(getattr(self._database, f"rpc_{self._name}")(**self._params))
+
+
+class _FakeBucket:
+    def __init__(self, database, name):
+        self._database = database
+        self._name = name
+
+    def upload(self, path, file, file_options=None):
+        self._database.storage_fault.apply(f"storage:{self._name}")
+        with self._database.lock:
+            self._database.objects[f"{self._name}/{path}"] = len(file)
+        return pytypes.SimpleNamespace(status_code=200, content=b"{}")
+
+    def get_public_url(self, path):
+        return f"https://fake.supabase.local/storage/v1/object/public/{self._name}/{path}"
+
+    def remove(self, paths):
+        with self._database.lock:
+            for path in paths:
+                self._database.objects.pop(f"{self._name}/{path}", None)
+
+
+class _FakeStorage:
+    def __init__(self, database):
+        self._database = database
+
+    def from_(self, bucket):
+        return _FakeBucket(self._database, bucket)
+
+
+class FakeSupabase:
+    """
+    In-memory tables with the PostgREST filters the bot uses, plus the match_scam and
+    merge_scam_report RPCs and a storage bucket. Rows are JSON round-tripped like real responses.
+    """
+
+    def __init__(self, fault=None, storage_fault=None):
+        self.fault = fault or Fault()
+        self.storage_fault = storage_fault or self.fault
+        self.tables = {}
+        self.objects = {}
+        self.lock = threading.RLock()
+        self._identity = 0
+        self.storage = _FakeStorage(self)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return _FakeRpc(self, name, params or {})
+
+    def prepare_row(self, table, row):
+        """Applies the column defaults and triggers the migrations define for the tables involved."""
+        if table == "scamreports":
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("was_broadcasted", False)
+            row.setdefault("broadcast_lease_owner", None)
+            row.setdefault("broadcast_lease_expires_at", None)
+            row.setdefault("images", [])
+            row.setdefault("embedding_model", None)
+            row.setdefault("timestamp", int(time.time() * 1000))
+            self.touch_embedding(row)
+            self._sync_users(row, [])
+        else:
+            self._identity += 1
+            row.setdefault("id", self._identity)
+            row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        return row
+
+    @staticmethod
+    def touch_embedding(row):
+        """The scamreports_embedding_updated_at trigger: stamps the time the embedding was written."""
+        row["embedding_updated_at"] = int(time.time() * 1000)
+
+    def _sync_users(self, row, previous):
+        users = self.tables.setdefault("scamreport_users", [])
+        for user_id in row.get("user_ids") or []:
+            if user_id not in previous:
+                users.append({"user_id": user_id, "report_id": row["id"], "reported_at": row.get("timestamp") or 0,
+                              "scamreports": {"title": row.get("title"), "type": row.get("type"), "timestamp": row.get("timestamp")}})
+
+    def seed_reports(self, count, min_count=1, with_embeddings=True):
+        """Adds `count` synthetic reports. Returns their ids."""
+        ids = []
+        with self.lock:
+            for i in range(count):
+                text = f"seeded scam campaign {i} asking for bank login and one time password"
+                row = self.prepare_row("scamreports", {
+                    "title": f"Seeded scam {i}", "summary": text, "type": "Phishing Scam",
+                    "count": min_count, "user_ids": [str(10_000_000 + i)], "image": None,
+                    "embeddings": to_halfvec(text_embedding(text)) if with_embeddings else None,
+                    "embedding_model": EMBEDDING_MODEL if with_embeddings else None,
+                    "timestamp": 1_700_000_000_000 + i,
+                })
+                self.tables.setdefault("scamreports", []).append(row)
+                ids.append(row["id"])
+        return ids
+
+    def rpc_match_scam(self, query_embedding, match_threshold, match_count):
+        matches = []
+        query = parse_embedding(query_embedding)
+        for row in self.tables.get("scamreports", []):
+            stored = parse_embedding(row.get("embeddings"))
+            if stored is None or stored.size != query.size:
+                continue
+            similarity = float(stored @ query)
+            if similarity > match_threshold:
+                matches.append((similarity, row))
+        matches.sort(key=lambda match: -match[0])
+        return [{"id": row["id"], "title": row.get("title"), "similarity": similarity} for similarity, row in matches[:match_count]]
+
+    def rpc_set_scamreport_embeddings(self, p_rows):
+        reports = {row["id"]: row for row in self.tables.get("scamreports", [])}
+        updated = 0
+        for update in p_rows:
+            row = reports.get(update["id"])
+            if row is not None:
+                row["embeddings"] = to_halfvec(update["embedding"])
+                row["embedding_model"] = update["model"]
+                self.touch_embedding(row)
+                updated += 1
+        return updated
+
+    def rpc_consolidate_scam_reports(self, p_canonical_id, p_duplicate_ids):
+        reports = self.tables.get("scamreports", [])
+        canonical = next((row for row in reports if row["id"] == p_canonical_id), None)
+        if canonical is None:
+            return []
+        duplicates = sorted((row for row in reports if row["id"] in p_duplicate_ids and row["id"] != p_canonical_id),
+                            key=lambda row: (row.get("timestamp") or 0, row["id"]))
+        if not duplicates:
+            return [json.loads(json.dumps(canonical))]
+        duplicate_ids = {row["id"] for row in duplicates}
+        members = [canonical] + duplicates
+        vectors = [(parse_embedding(row.get("embeddings")), max(row.get("count") or 1, 1)) for row in members]
+        centroid = vectors[0][0]
+        if centroid is not None:
+            total = sum(normalize(vector) * weight for vector, weight in vectors
+                        if vector is not None and vector.size == centroid.size)
+            canonical["embeddings"] = to_halfvec(total)
+            self.touch_embedding(canonical)
+        canonical["count"] = sum(row.get("count") or 1 for row in members)
+        canonical["user_ids"] = list(dict.fromkeys(user for row in members for user in row.get("user_ids") or []))
+        canonical["images"] = [image for row in members for image in row.get("images") or []]
+        canonical["image"] = next((row["image"] for row in members if row.get("image")), None)
+        canonical["timestamp"] = max(row.get("timestamp") or 0 for row in members)
+        canonical["was_broadcasted"] = any(row.get("was_broadcasted") for row in members)
+        for table, key in (("scamreport_users", ("user_id",)), ("scamreport_image_hashes", ("hash",)),
+                           ("scamreport_indicators", ("kind", "value"))):
+            rows = self.tables.setdefault(table, [])
+            kept = {tuple(row[k] for k in key) for row in rows if row["report_id"] == p_canonical_id}
+            for row in list(rows):
+                if row["report_id"] in duplicate_ids and tuple(row[k] for k in key) not in kept:
+                    kept.add(tuple(row[k] for k in key))
+                    rows.append(dict(row, report_id=p_canonical_id))
+            self.tables[table] = [row for row in rows if row["report_id"] not in duplicate_ids]
+        merges = self.tables.setdefault("scamreport_merges", [])
+        for row in merges:
+            if row["canonical_id"] in duplicate_ids:
+                row["canonical_id"] = p_canonical_id
+        for duplicate_id in sorted(duplicate_ids):
+            merges.append(self.prepare_row("scamreport_merges", {"duplicate_id": duplicate_id, "canonical_id": p_canonical_id}))
+        # scamreport_users rows were moved above, so the user_ids trigger has nothing to add
+        self.tables["scamreports"] = [row for row in reports if row["id"] not in duplicate_ids]
+        return [json.loads(json.dumps(canonical))]
+
+    def rpc_merge_scam_report(self, p_report_id, p_user_id, p_embedding=None, p_title=None, p_summary=None,
+                              p_type=None, p_images=None, p_timestamp=None):
+        row = next((row for row in self.tables.get("scamreports", []) if row["id"] == p_report_id), None)
+        if row is None:
+            return []
+        previous = list(row.get("user_ids") or [])
+        row["count"] = (row.get("count") or 0) + 1
+        if p_user_id not in previous:
+            row["user_ids"] = previous + [p_user_id]
+        if p_embedding:
+            row["embeddings"] = to_halfvec(running_mean(row.get("embeddings"), row["count"] - 1, p_embedding))
+            self.touch_embedding(row)
+        for column, value in (("title", p_title), ("summary", p_summary), ("type", p_type), ("timestamp", p_timestamp)):
+            if value is not None:
+                row[column] = value
+        if p_images:
+            row["image"] = row.get("image") or p_images[0]
+            row["images"] = (row.get("images") or []) + list(p_images)
+        self._sync_users(row, previous)
+        return [json.loads(json.dumps(row))]
@@ -0,0 +1,111 @@
+"""
+Prepares a plain local Postgres as a stand-in for the Supabase database, for the scripts in this
+directory that take --dsn (check_broadcast_trigger.py, check_merge_concurrency.py, bench_history.py).
+
+Usage: python benchmarks/local_db.py --dsn postgresql://...
+
+Creates what Supabase provides and the migrations rely on (auth.role(), public.set_updated_at()), then
+applies supabase/migrations in filename order, recording each in public.local_schema_migrations so a
+second run only applies new files. Needs the pgvector extension installed. pgvector before 0.7 has no
+halfvec type or l2_normalize(); they are then stood in by a domain over vector and a SQL function, so the
+functions run at full precision. Do not point this at the Supabase project itself.
+"""
+import argparse
+import os
+
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                              "supabase", "migrations")
+
+SUPABASE_STAND_INS = """
+create schema if not exists auth;
+
+create or replace function auth.role()
+returns text
+language sql
+stable
+as $$ select 'service_role'::text $$;
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+create extension if not exists vector;
+
+create table if not exists public.local_schema_migrations (
+    name text primary key,
+    applied_at timestamp with time zone not null default now()
+);
+"""
+
+HALFVEC_STAND_INS = """
+create domain public.halfvec as vector;
+
+create or replace function public.l2_normalize(v vector)
+returns vector
+language sql
+immutable
+as $$
+    select coalesce(
+        (select array_agg(e.value / nullif(n.norm, 0) order by e.position)::vector
+         from unnest(v::real[]) with ordinality as e(value, position),
+              (select sqrt(sum(x * x)) as norm from unnest(v::real[]) as x) as n),
+        v)
+$$;
+"""
+
+
+def has_halfvec(cursor):
+    cursor.execute("select exists (select 1 from pg_type where typname = 'halfvec')")
+    return cursor.fetchone()[0]
+
+
+def bootstrap(dsn, migrations_dir=MIGRATIONS_DIR):
+    """Applies the Supabase stand-ins and any migrations not applied yet. Returns the names applied."""
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    applied = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SUPABASE_STAND_INS)
+            if not has_halfvec(cursor):
+                print("[local_db] pgvector has no halfvec; using a domain over vector instead")
+                cursor.execute(HALFVEC_STAND_INS)
+            cursor.execute("select name from public.local_schema_migrations")
+            done = {row[0] for row in cursor.fetchall()}
+        for name in sorted(os.listdir(migrations_dir)):
+            if not name.endswith(".sql") or name in done:
+                continue
+            with open(os.path.join(migrations_dir, name)) as fh:
+                sql = fh.read()
+            # Each migration and its bookkeeping row commit together, or not at all
+            conn.autocommit = False
+            with conn, conn.cursor() as cursor:
+                cursor.execute(sql)
+                cursor.execute("insert into public.local_schema_migrations (name) values (%s)", (name,))
+            conn.autocommit = True
+            applied.append(name)
+    finally:
+        conn.close()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply supabase/migrations to a local Postgres.")
+    parser.add_argument("--dsn", required=True)
+    args = parser.parse_args()
+    applied = bootstrap(args.dsn)
+    for name in applied:
+        print(f"Applied {name}")
+    print(f"{len(applied)} migrations applied")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,28 @@
-import telebot
 import os
 from google import genai
 from dotenv import load_dotenv
 import functions as f
+import metrics
+from dispatcher import DispatchingTeleBot
+from admission import controller as admission
+from model_client import ModelClient
+from webhook import run_webhook
+from broadcast_trigger import listen_for_broadcasts
 import schedule
 import time
 import threading
 
 
 load_dotenv()
-bot = telebot.TeleBot(os.environ["BOT_TOKEN"], parse_mode=None)
-client = genai.Client(api_key=os.getenv("API_KEY"))
+# Updates are handled on a worker pool so one slow report does not block other chats
+bot = DispatchingTeleBot(
+    os.environ["BOT_TOKEN"],
+    parse_mode=None,
+    num_workers=int(os.getenv("BOT_WORKERS", "8")),
+    max_pending=int(os.getenv("BOT_MAX_PENDING_UPDATES", "1000")),
+)
+client = ModelClient(genai.Client(api_key=os.getenv("API_KEY")), admit=admission.admit_fallback)
+f.register_session_eviction(bot)
 # for models in client.models.list():
 #     print(models.name)
 
@@ -35,6 +47,11 @@ def handle_view_reports(message):
     f.view_report_history(bot, message, f.supabase)
 
 
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith(f.HISTORY_CALLBACK_PREFIX))
+def handle_history_page(call):
+    f.handle_history_page(bot, call, f.supabase)
+
+
 @bot.message_handler(content_types=['text'])
 def handle_message(message):
     f.send_message(bot, client, message)
@@ -45,20 +62,102 @@ def handle(message):
     f.send_error_message(bot, message, message.content_type)
 
 
+def log_runtime_stats():
+    stats = bot.dispatcher.stats()
+    print(f"[Dispatcher] queue_depth={stats['queue_depth']} active_workers={stats['active_workers']}/{stats['max_workers']} "
+          f"processed={stats['processed']} failed={stats['failed']}")
+    session_stats = f.user_reports.stats()
+    print(f"[Sessions] live={session_stats['live_sessions']} ttl_evictions={session_stats['ttl_evictions']} "
+          f"lru_evictions={session_stats['lru_evictions']} memory_bytes={session_stats['memory_bytes']}")
+    cache_stats = f.embedding_cache.stats()
+    print(f"[EmbeddingCache] hits={cache_stats['hits']} (disk {cache_stats['disk_hits']}) misses={cache_stats['misses']} "
+          f"hit_rate={cache_stats['hit_rate']:.2%}")
+    for name, cache in (("/verify", f.verification_cache), ("report", f.report_verdict_cache)):
+        verdict_stats = cache.stats()
+        print(f"[VerdictCache {name}] exact_hits={verdict_stats['exact_hits']} near_hits={verdict_stats['near_hits']} "
+              f"misses={verdict_stats['misses']} hit_rate={verdict_stats['hit_rate']:.2%} "
+              f"gemini_calls_saved={verdict_stats['gemini_calls_saved']}")
+
+
+def runtime_metric_samples():
+    """Exposes the counters the dispatcher, session store, caches and indexes already keep."""
+    stats = bot.dispatcher.stats()
+    samples = [
+        ("tsfraud_dispatcher_queue_depth", "gauge", "Updates waiting for a worker.", {}, stats['queue_depth']),
+        ("tsfraud_dispatcher_active_workers", "gauge", "Workers handling an update.", {}, stats['active_workers']),
+        ("tsfraud_dispatcher_updates_total", "counter", "Updates handled.", {"outcome": "ok"}, stats['processed'] - stats['failed']),
+        ("tsfraud_dispatcher_updates_total", "counter", "Updates handled.", {"outcome": "error"}, stats['failed']),
+        ("tsfraud_sessions_live", "gauge", "Report drafts in progress.", {}, f.user_reports.stats()['live_sessions']),
+        ("tsfraud_scam_index_size", "gauge", "Rows in a local similarity index.", {"index": "embeddings"}, len(f.scam_index)),
+        ("tsfraud_scam_index_size", "gauge", "Rows in a local similarity index.", {"index": "image_hashes"}, len(f.image_hash_index)),
+    ]
+    cache_stats = f.embedding_cache.stats()
+    for result, value in (("hit", cache_stats['hits']), ("miss", cache_stats['misses'])):
+        samples.append(("tsfraud_cache_lookups_total", "counter", "Cache lookups by cache and result.",
+                        {"cache": "embedding", "result": result}, value))
+    for name, cache in (("verify", f.verification_cache), ("report_verdict", f.report_verdict_cache)):
+        verdict_stats = cache.stats()
+        for result, value in (("hit", verdict_stats['exact_hits']), ("near_hit", verdict_stats['near_hits']),
+                              ("miss", verdict_stats['misses'])):
+            samples.append(("tsfraud_cache_lookups_total", "counter", "Cache lookups by cache and result.",
+                            {"cache": name, "result": result}, value))
+    return samples
+
+
+metrics.register_collector(runtime_metric_samples)
+
+
+def start_consolidation():
+    # A pass compares every pair of reports, so it runs on its own thread instead of holding up the scheduler
+    threading.Thread(target=f.consolidate_reports, name="consolidate", daemon=True).start()
+
+
 def run_scheduler():
     """Runs the scheduled tasks in a separate thread."""
-    # Schedule the broadcast_popular_scams function to run every 5 minutes
-    schedule.every(5).minutes.do(f.broadcast_popular_scams, bot=bot)
-    # schedule.every(20).seconds.do(f.broadcast_popular_scams, bot=bot) # For testing
+    # Broadcasts are triggered when a report crosses the threshold; this sweep only reconciles missed events
+    sweep_minutes = int(os.getenv("BROADCAST_SWEEP_MINUTES", "30"))
+    schedule.every(sweep_minutes).minutes.do(f.broadcast_trigger.request, reason="reconciliation sweep")
+    # schedule.every(20).seconds.do(f.broadcast_trigger.request, reason="testing") # For testing
+    schedule.every(1).minutes.do(f.user_reports.sweep)
+    # Picks up reports inserted or merged elsewhere (e.g. the mobile app)
+    schedule.every(1).minutes.do(f.load_scam_index)
+    schedule.every(1).minutes.do(log_runtime_stats)
+    # Merges duplicate reports (consolidate.py --apply); off unless CONSOLIDATE_EVERY_HOURS is set
+    consolidate_hours = int(os.getenv("CONSOLIDATE_EVERY_HOURS", "0"))
+    if consolidate_hours:
+        schedule.every(consolidate_hours).hours.do(start_consolidation)
 
     print("[Scheduler] Starting scheduler...")
+    f.load_scam_index()
     while True:
         schedule.run_pending()
         time.sleep(1)
 
 
 if __name__ == '__main__':
+    # Local Prometheus scrape endpoint; METRICS_PORT=0 disables it
+    metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+    if metrics_port:
+        metrics.serve_metrics(os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port)
+    f.start_broadcast_trigger(bot)
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
-
-    bot.infinity_polling()
+    # Optional: direct Postgres connection string to receive count-threshold notifications from the database
+    listen_dsn = os.getenv("BROADCAST_LISTEN_DSN")
+    if listen_dsn:
+        threading.Thread(target=listen_for_broadcasts, args=(listen_dsn, f.broadcast_trigger), daemon=True).start()
+
+    # BOT_MODE=webhook serves updates from a local HTTP endpoint instead of long polling
+    if os.getenv("BOT_MODE", "polling").lower() == "webhook":
+        run_webhook(
+            bot,
+            public_url=os.environ["WEBHOOK_URL"],
+            secret_token=os.environ["WEBHOOK_SECRET"],
+            host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            port=int(os.getenv("WEBHOOK_PORT", "8443")),
+            path=os.getenv("WEBHOOK_PATH", "/telegram"),
+            max_queued=int(os.getenv("WEBHOOK_MAX_QUEUED", "100")),
+        )
+    else:
+        bot.remove_webhook()
+        bot.infinity_polling()
@@ -0,0 +1,93 @@
+"""
+Event-driven broadcasting: a report is broadcast as soon as its count crosses the threshold,
+instead of waiting for the next periodic scan.
+
+Events come from process_full_report merges in this process and, when BROADCAST_LISTEN_DSN
+points at the Postgres database, from the scamreports trigger's pg_notify on NOTIFY_CHANNEL
+(which also covers reports merged by the mobile app). Against a local Postgres, run
+`NOTIFY scam_broadcast, 'some-report-id';` to fire an event by hand.
+"""
+import select
+import threading
+import time
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:  # the LISTEN source is optional; in-process events still work without it
+    psycopg2 = None
+
+NOTIFY_CHANNEL = "scam_broadcast"
+
+
+class BroadcastTrigger:
+    """
+    Runs a broadcast pass on a background thread whenever request() is called.
+    Requests that arrive while a pass is running are coalesced into one follow-up pass.
+    """
+
+    def __init__(self, run_pass):
+        self._run_pass = run_pass
+        self._requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.requests = 0
+        self.passes = 0
+
+    def request(self, reason=""):
+        self.requests += 1
+        print(f"[BroadcastTrigger] Broadcast requested: {reason}")
+        self._requested.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._requested.wait()
+            if self._stopped.is_set():
+                return
+            self._requested.clear()
+            try:
+                self._run_pass()
+            except Exception as e:
+                print(f"[BroadcastTrigger] Broadcast pass failed: {e}")
+            self.passes += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="broadcast-trigger")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._requested.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def listen_for_broadcasts(dsn, trigger, channel=NOTIFY_CHANNEL, poll_seconds=60, reconnect_seconds=5):
+    """Blocks, forwarding Postgres NOTIFY events on `channel` to the trigger. Reconnects on errors."""
+    if psycopg2 is None:
+        print("[listen_for_broadcasts] psycopg2 is not installed; database change notifications are disabled.")
+        return
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel}")
+            print(f"[listen_for_broadcasts] Listening for '{channel}' notifications")
+            # Anything that crossed the threshold while we were disconnected gets picked up by this pass
+            trigger.request("listener connected")
+            while True:
+                if select.select([conn], [], [], poll_seconds) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    trigger.request(f"report {notification.payload} crossed the broadcast threshold")
+        except Exception as e:
+            print(f"[listen_for_broadcasts] Connection error: {e}. Reconnecting in {reconnect_seconds}s")
+            time.sleep(reconnect_seconds)
+        finally:
+            if conn is not None:
+                conn.close()
@@ -0,0 +1,349 @@
+"""
+A small in-process text classifier that answers obvious inputs without a Gemini call.
+
+Texts become hashed features (word unigrams and bigrams, plus tokens for link, money and code
+shapes) in a 2^18-dimensional sparse vector, scored by a linear softmax model over LABELS. A label
+is only acted on when its probability clears the threshold chosen at training time for
+TARGET_PRECISION on held-out examples; everything else goes to Gemini as before.
+
+The model is trained offline and saved as versioned JSON (CLASSIFIER_MODEL_PATH). It is loaded on
+first use, and the bot behaves as before if the file is missing or was built by another version.
+
+Usage:
+  python classifier.py train [--examples labelled.jsonl ...] [--from-supabase] [--output PATH]
+  python classifier.py evaluate --examples labelled.jsonl [--model PATH]
+
+Examples are JSON lines of {"text": ..., "label": "scam" | "benign" | "smalltalk"}. --from-supabase
+adds every scamreports title and summary as "scam". /verify verdicts from Gemini are appended
+to CLASSIFIER_VERDICT_LOG (when set) in the same format, to train the next model on.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from embedding_cache import normalize_text
+import metrics
+
+MODEL_VERSION = 1  # bump when features() changes; older model files are then ignored
+LABELS = ("scam", "benign", "smalltalk")
+N_FEATURES = 1 << 18
+TARGET_PRECISION = 0.98
+MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "scam_classifier.json"))
+VERDICT_LOG = os.getenv("CLASSIFIER_VERDICT_LOG", "")
+
+_URL = re.compile(r"(?:https?://|www\.)\S+|\b[a-z0-9-]+\.(?:com|net|org|sg|ly|co|io|xyz|top|info|link|me)(?:/\S*)?")
+_SHORTENERS = ("bit.ly", "tinyurl", "t.co/", "goo.gl", "is.gd", "rb.gy", "cutt.ly", "t.ly")
+_MONEY = re.compile(r"(?:\$|sgd|usd|s\$)\s?\d[\d,.]*|\d[\d,.]*\s?(?:dollars|sgd|usd)")
+_CODE = re.compile(r"\b\d{4,8}\b")
+_WORD = re.compile(r"[a-z][a-z']+|\d+")
+
+decisions = metrics.registry.register(metrics.Counter(
+    "tsfraud_classifier_decisions", "Inputs the local classifier answered, or passed on to Gemini as uncertain.",
+    ("handler", "outcome")))
+
+
+def tokens(text):
+    """Word tokens of normalised text, with links, amounts and numeric codes replaced by shape tokens."""
+    text = normalize_text(text)
+    shapes = []
+    for url in _URL.findall(text):
+        shapes.append("<shortlink>" if any(shortener in url for shortener in _SHORTENERS) else "<url>")
+    text = _URL.sub(" ", text)
+    if _MONEY.search(text):
+        shapes.append("<money>")
+    text = _MONEY.sub(" ", text)
+    if _CODE.search(text):
+        shapes.append("<code>")
+    words = _WORD.findall(_CODE.sub(" ", text))
+    if len(words) <= 3:
+        shapes.append(f"<len{len(words)}>")
+    return shapes + words
+
+
+def features(text):
+    """Sparse {index: value} vector, L2-normalised so short and long texts score on one scale."""
+    words = tokens(text)
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    indices = {zlib.crc32(gram.encode()) & (N_FEATURES - 1) for gram in grams}
+    value = 1 / math.sqrt(len(indices)) if indices else 0.0
+    return {index: value for index in indices}
+
+
+def _softmax(scores):
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class LinearClassifier:
+    def __init__(self, labels=LABELS, weights=None, bias=None, thresholds=None, metadata=None):
+        self.labels = tuple(labels)
+        self.weights = weights or [dict() for _ in self.labels]  # per label: {feature index: weight}
+        self.bias = bias or [0.0] * len(self.labels)
+        self.thresholds = thresholds or {}  # label -> minimum probability to act on it
+        self.metadata = metadata or {}
+
+    def probabilities(self, text):
+        x = features(text)
+        scores = [b + sum(w.get(i, 0.0) * v for i, v in x.items()) for w, b in zip(self.weights, self.bias)]
+        return dict(zip(self.labels, _softmax(scores)))
+
+    def predict(self, text):
+        """Returns (label, probability) for the most likely label."""
+        probabilities = self.probabilities(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def confident(self, text, allowed):
+        """Returns the predicted label if it is in `allowed` and clears its threshold, else None."""
+        label, probability = self.predict(text)
+        threshold = self.thresholds.get(label)
+        if label in allowed and threshold is not None and probability >= threshold:
+            return label
+        return None
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        payload = {
+            "version": MODEL_VERSION,
+            "n_features": N_FEATURES,
+            "labels": list(self.labels),
+            "bias": self.bias,
+            "thresholds": self.thresholds,
+            "metadata": self.metadata,
+            # JSON keys are strings; weights are rounded since the file is mostly their digits
+            "weights": [{str(i): round(w, 5) for i, w in weights.items() if abs(w) >= 1e-5} for weights in self.weights],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as model_file:
+            json.dump(payload, model_file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as model_file:
+            payload = json.load(model_file)
+        if payload.get("version") != MODEL_VERSION or payload.get("n_features") != N_FEATURES:
+            raise ValueError(f"model version {payload.get('version')} does not match {MODEL_VERSION}")
+        weights = [{int(i): w for i, w in label_weights.items()} for label_weights in payload["weights"]]
+        return cls(payload["labels"], weights, payload["bias"], payload.get("thresholds"), payload.get("metadata"))
+
+
+def train(examples, labels=LABELS, epochs=10, learning_rate=0.5, l2=1e-5, seed=0):
+    """Softmax regression by SGD on (text, label) pairs. Returns a LinearClassifier without thresholds."""
+    model = LinearClassifier(labels)
+    index = {label: i for i, label in enumerate(labels)}
+    rows = [(features(text), index[label]) for text, label in examples]
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(rows)
+        rate = learning_rate / (1 + epoch)
+        for x, target in rows:
+            scores = [b + sum(w.get(i, 0.0) * v for i, v in x.items()) for w, b in zip(model.weights, model.bias)]
+            for k, probability in enumerate(_softmax(scores)):
+                gradient = probability - (k == target)
+                weights = model.weights[k]
+                for i, v in x.items():
+                    weights[i] = weights.get(i, 0.0) * (1 - rate * l2) - rate * gradient * v
+                model.bias[k] -= rate * gradient
+    return model
+
+
+def choose_thresholds(model, examples, target_precision=TARGET_PRECISION):
+    """
+    For each label, the lowest probability at which predictions of that label on `examples` reach
+    target_precision. Labels that never get there are left out, so they are never acted on.
+    """
+    predictions = [(model.predict(text), label) for text, label in examples]
+    thresholds = {}
+    for label in model.labels:
+        scored = sorted(((probability, true_label == label)
+                         for (predicted_label, probability), true_label in predictions if predicted_label == label),
+                        reverse=True)
+        correct = 0
+        for n, (probability, ok) in enumerate(scored, 1):
+            correct += ok
+            if correct / n >= target_precision and n >= 5:
+                thresholds[label] = probability
+    return thresholds
+
+
+def evaluate(model, examples):
+    """Precision and recall per label at the model's thresholds, plus the share of inputs answered locally."""
+    per_label = {label: {"true_positive": 0, "predicted": 0, "actual": 0} for label in model.labels}
+    answered = 0
+    start = time.perf_counter()
+    for text, label in examples:
+        confident = model.confident(text, model.labels)
+        per_label[label]["actual"] += 1
+        if confident is not None:
+            answered += 1
+            per_label[confident]["predicted"] += 1
+            per_label[confident]["true_positive"] += confident == label
+    elapsed = time.perf_counter() - start
+    report = {"examples": len(examples), "answered_locally": round(answered / len(examples), 4) if examples else 0.0,
+              "mean_predict_us": round(elapsed / max(1, len(examples)) * 1e6, 1), "labels": {}}
+    for label, counts in per_label.items():
+        report["labels"][label] = {
+            "threshold": model.thresholds.get(label),
+            "precision": round(counts["true_positive"] / counts["predicted"], 4) if counts["predicted"] else None,
+            "recall": round(counts["true_positive"] / counts["actual"], 4) if counts["actual"] else None,
+            "support": counts["actual"],
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{report['examples']} examples, {report['answered_locally']:.1%} answered without Gemini, "
+          f"{report['mean_predict_us']:.0f}us per prediction")
+    for label, row in report["labels"].items():
+        threshold = "never acted on" if row["threshold"] is None else f"threshold {row['threshold']:.3f}"
+        precision = "-" if row["precision"] is None else f"{row['precision']:.3f}"
+        recall = "-" if row["recall"] is None else f"{row['recall']:.3f}"
+        print(f"  {label:<10} precision {precision:>6}  recall {recall:>6}  support {row['support']:>6}  ({threshold})")
+
+
+# --- Serving ----------------------------------------------------------------------------------
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The model at MODEL_PATH, loaded on first call. None if there is no usable model."""
+    global _model, _model_loaded
+    if _model_loaded:
+        return _model
+    with _model_lock:
+        if not _model_loaded:
+            try:
+                _model = LinearClassifier.load(MODEL_PATH)
+                print(f"[classifier] Loaded model trained {_model.metadata.get('trained_at')} from {MODEL_PATH}")
+            except FileNotFoundError:
+                print(f"[classifier] No model at {MODEL_PATH}; every input goes to Gemini")
+            except (ValueError, KeyError) as e:
+                print(f"[classifier] Ignoring {MODEL_PATH}: {e}")
+            _model_loaded = True
+    return _model
+
+
+def classify(text, handler, allowed):
+    """Returns a confident label from `allowed` for the text, or None to ask Gemini."""
+    model = get_model()
+    if model is None:
+        return None
+    label = model.confident(text, allowed)
+    decisions.inc(handler, label or "uncertain")
+    return label
+
+
+def log_verdict(text, verdict):
+    """Appends a Gemini /verify verdict to CLASSIFIER_VERDICT_LOG as a training example."""
+    if not VERDICT_LOG:
+        return
+    if "LIKELY NOT A SCAM" in verdict:
+        label = "benign"
+    elif "LIKELY A SCAM" in verdict:
+        label = "scam"
+    else:
+        return  # "SOME RED FLAGS" is not a label worth learning
+    try:
+        with open(VERDICT_LOG, "a") as log_file:
+            log_file.write(json.dumps({"text": text, "label": label}) + "\n")
+    except OSError as e:
+        print(f"[classifier] Could not log verdict: {e}")
+
+
+# --- Training CLI -----------------------------------------------------------------------------
+
+def read_examples(paths):
+    examples = []
+    for path in paths:
+        with open(path) as examples_file:
+            for line in examples_file:
+                if line.strip():
+                    row = json.loads(line)
+                    if row.get("label") in LABELS and row.get("text"):
+                        examples.append((row["text"], row["label"]))
+    return examples
+
+
+def fetch_report_examples(page_size=1000):
+    """Every scamreports title and summary, labelled "scam"."""
+    from supabase import create_client
+    supabase_client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    examples, last_id = [], None
+    while True:
+        query = supabase_client.table('scamreports').select('id, title, summary').order('id').limit(page_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.execute().data or []
+        for row in rows:
+            for text in (row.get("title"), row.get("summary")):
+                if text:
+                    examples.append((text, "scam"))
+        if len(rows) < page_size:
+            return examples
+        last_id = rows[-1]["id"]
+
+
+def split(examples, held_out=0.15):
+    """
+    Splits into (train, calibration, test) on a hash of the text, so duplicates never straddle sets.
+    Thresholds are chosen on calibration and reported on test, so the report isn't tuned to itself.
+    """
+    train_rows, calibration_rows, test_rows = [], [], []
+    for text, label in examples:
+        bucket = zlib.crc32(normalize_text(text).encode()) % 1000 / 1000
+        rows = test_rows if bucket < held_out else calibration_rows if bucket < 2 * held_out else train_rows
+        rows.append((text, label))
+    return train_rows, calibration_rows, test_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local scam pre-classifier.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    train_parser = subcommands.add_parser("train")
+    train_parser.add_argument("--examples", nargs="*", default=[], help="JSON lines files of {text, label}")
+    train_parser.add_argument("--from-supabase", action="store_true", help="add scamreports titles and summaries as scam")
+    train_parser.add_argument("--output", default=MODEL_PATH)
+    train_parser.add_argument("--epochs", type=int, default=10)
+    train_parser.add_argument("--target-precision", type=float, default=TARGET_PRECISION)
+    evaluate_parser = subcommands.add_parser("evaluate")
+    evaluate_parser.add_argument("--examples", nargs="+", required=True)
+    evaluate_parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    if args.command == "evaluate":
+        model = LinearClassifier.load(args.model)
+        print_report(evaluate(model, read_examples(args.examples)))
+        return
+
+    examples = read_examples(args.examples)
+    if args.from_supabase:
+        examples += fetch_report_examples()
+    train_rows, calibration_rows, test_rows = split(examples)
+    counts = {label: sum(1 for _, row_label in examples if row_label == label) for label in LABELS}
+    print(f"Training on {len(train_rows)} examples, calibrating on {len(calibration_rows)}, "
+          f"testing on {len(test_rows)} ({counts})")
+    start = time.perf_counter()
+    model = train(train_rows, epochs=args.epochs)
+    model.thresholds = choose_thresholds(model, calibration_rows, args.target_precision)
+    report = evaluate(model, test_rows)
+    model.metadata = {"trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "examples": counts,
+                      "target_precision": args.target_precision, "test": report}
+    model.save(args.output)
+    print(f"Trained in {time.perf_counter() - start:.1f}s; saved to {args.output}")
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+Offline consolidation of duplicate scam reports.
+
+process_full_report matches a new report against existing ones once, when it arrives. Near-duplicates that
+arrived before they had an embedding, were worded differently from the report they matched, or raced
+each other stay separate rows and may never reach BROADCAST_MIN_COUNT. This job compares every pair of
+report embeddings and merges each group of duplicates into one canonical report with the
+consolidate_scam_reports database function.
+
+Usage: python consolidate.py [--apply] [--threshold 0.85] [--block-size 4096] [--workdir DIR] [--max-clusters N]
+
+Without --apply it only prints the diff: each canonical report with the count and users it would gain,
+and the reports that would be merged into it. The bot also runs it with --apply every CONSOLIDATE_EVERY_HOURS
+hours when that is set (bot.py); by default it is off and the job is run by hand or from cron.
+
+Groups are the connected components of report pairs at or above the threshold. The canonical report is the
+most reported in its group, then the oldest. A report is merged only if it is also above the threshold
+against the group's count-weighted mean embedding, which the merged report gets. That is the test a new
+report faces at insert time, and it keeps a chain of similar reports from pulling in one unlike the rest.
+Reports left out are considered again on the next run. Only embeddings from EMBEDDING_MODEL are compared; run
+embedding_backfill.py first after a model change.
+
+Memory stays bounded at 1M rows. Embeddings are streamed from the database into a half-precision file in
+--workdir and compared a block of --block-size rows against another. RAM holds two float32 blocks, one block
+of similarities, the pairs from a slice of it and a few dozen bytes per report; a group's mean embedding is
+summed a block at a time, so one viral campaign with most of the table in it costs no more. The comparison is
+exact, so time grows with the square of the row count (benchmarks/bench_consolidate.py measures the rate).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import EMBEDDING_MODEL
+from vector_index import normalize, parse_embedding
+
+SIMILARITY_THRESHOLD = float(os.getenv("CONSOLIDATE_SIMILARITY_THRESHOLD", "0.85"))  # as functions.SIMILARITY_THRESHOLD
+BLOCK_SIZE = int(os.getenv("CONSOLIDATE_BLOCK_SIZE", "4096"))
+PAIR_ROWS = 256  # rows of a similarity block turned into pairs at once
+BROADCAST_MIN_COUNT = 3  # functions.BROADCAST_MIN_COUNT
+
+
+class ReportEmbeddings:
+    """
+    Report embeddings in a half-precision file on disk (read through a memmap), with their ids,
+    counts and timestamps in memory.
+    """
+
+    def __init__(self, path, ids, counts, timestamps, dim):
+        self.path = path
+        self.ids = ids
+        self.counts = counts
+        self.timestamps = timestamps
+        self.dim = dim
+        self.vectors = np.memmap(path, dtype=np.float16, mode='r', shape=(len(ids), dim)) if ids else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def block(self, start, stop):
+        return np.asarray(self.vectors[start:stop], dtype=np.float32)
+
+    @classmethod
+    def build(cls, rows, path):
+        """Writes (id, count, timestamp, embedding) rows to path; embeddings of another dimension than the first are skipped."""
+        ids, counts, timestamps, dim = [], [], [], None
+        with open(path, "wb") as vector_file:
+            for report_id, count, timestamp, embedding in rows:
+                vector = parse_embedding(embedding)
+                if vector is None or (dim is not None and vector.size != dim):
+                    continue
+                dim = vector.size
+                vector_file.write(normalize(vector).astype(np.float16).tobytes())
+                ids.append(report_id)
+                counts.append(count or 1)
+                timestamps.append(timestamp or 0)
+        return cls(path, ids, np.array(counts, dtype=np.int64), np.array(timestamps, dtype=np.int64), dim)
+
+    @classmethod
+    def load(cls, supabase_client, path, model=EMBEDDING_MODEL, page_size=500):
+        """Streams every report embedded with `model` from the database, keyset-paginated on id."""
+        def rows():
+            last_id = None
+            while True:
+                query = (supabase_client.table('scamreports')
+                    .select('id, count, timestamp, embeddings')
+                    .not_.is_('embeddings', 'null')
+                    .eq('embedding_model', model)
+                    .order('id')
+                    .limit(page_size))
+                if last_id is not None:
+                    query = query.gt('id', last_id)
+                page = query.execute().data or []
+                for row in page:
+                    yield row['id'], row.get('count'), row.get('timestamp'), row['embeddings']
+                if len(page) < page_size:
+                    return
+                last_id = page[-1]['id']
+                print(f"[consolidate] Loaded embeddings up to report {last_id}")
+        return cls.build(rows(), path)
+
+
+def similar_pairs(embeddings, threshold=SIMILARITY_THRESHOLD, block_size=BLOCK_SIZE, pair_rows=PAIR_ROWS):
+    """
+    Yields (rows, columns, similarities) arrays of every pair i < j with cosine similarity >= threshold, one block
+    pair at a time, split into slices of pair_rows rows so a dense block yields at most pair_rows * block_size pairs.
+    """
+    count = len(embeddings)
+    for start in range(0, count, block_size):
+        left = embeddings.block(start, min(start + block_size, count))
+        for other in range(start, count, block_size):
+            right = left if other == start else embeddings.block(other, min(other + block_size, count))
+            similarities = left @ right.T
+            if other == start:
+                similarities = np.triu(similarities, k=1)
+            for offset in range(0, similarities.shape[0], pair_rows):
+                rows, columns = np.nonzero(similarities[offset:offset + pair_rows] >= threshold)
+                if rows.size:
+                    yield rows + start + offset, columns + other, similarities[rows + offset, columns]
+
+
+def _roots(parent, rows):
+    """The root of each row, compressing the path of every row visited."""
+    roots = parent[rows]
+    while True:
+        above = parent[roots]
+        if np.array_equal(above, roots):
+            break
+        roots = above
+    parent[rows] = roots
+    return roots
+
+
+def _union(parent, rows, columns):
+    """
+    Joins the components of every (row, column) pair, vectorised. A root only ever points at a lower row, so
+    hooking each higher root to the lowest root it is paired with cannot make a cycle; pairs whose higher
+    root got hooked elsewhere are joined on the next round.
+    """
+    # The first round's rows and columns come from two block spans: find each span's roots once, not each pair's
+    row_span, column_span = np.arange(rows.min(), rows.max() + 1), np.arange(columns.min(), columns.max() + 1)
+    row_roots = _roots(parent, row_span)[rows - row_span[0]]
+    column_roots = _roots(parent, column_span)[columns - column_span[0]]
+    while True:
+        differ = row_roots != column_roots
+        if not differ.any():
+            return
+        low = np.minimum(row_roots[differ], column_roots[differ])
+        high = np.maximum(row_roots[differ], column_roots[differ])
+        pairs = np.unique(high * parent.size + low)
+        high, low = pairs // parent.size, pairs % parent.size
+        np.minimum.at(parent, high, low)
+        row_roots, column_roots = _roots(parent, low), _roots(parent, high)
+
+
+def find_clusters(embeddings, threshold=SIMILARITY_THRESHOLD, block_size=BLOCK_SIZE):
+    """
+    Returns [(canonical row, [(duplicate row, similarity to the group's mean), ...])] for every group of
+    duplicates, largest first. Groups are read block_size rows at a time, so one very large group costs no
+    more memory than the pairwise comparison.
+    """
+    parent = np.arange(len(embeddings), dtype=np.int64)
+    for rows, columns, _ in similar_pairs(embeddings, threshold, block_size):
+        _union(parent, rows, columns)
+
+    roots = _roots(parent, np.arange(len(embeddings)))
+    order = np.argsort(roots, kind='stable')  # rows stay in ascending order within a component
+    starts = np.flatnonzero(np.r_[True, np.diff(roots[order]) != 0])
+    sizes = np.diff(np.r_[starts, len(order)])
+    clusters = []
+    for begin, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+        members = order[begin:begin + size]
+        # Most reported first, then oldest
+        canonical = members[np.lexsort((embeddings.timestamps[members], -embeddings.counts[members]))[0]]
+        # Members are checked against the count-weighted mean the merged report will carry, as a new report would be
+        centroid = np.zeros(embeddings.dim, dtype=np.float32)
+        for chunk in range(0, size, block_size):
+            rows = members[chunk:chunk + block_size]
+            centroid += embeddings.counts[rows].astype(np.float32) @ np.asarray(embeddings.vectors[rows], dtype=np.float32)
+        centroid = normalize(centroid)
+        similarities = np.concatenate([np.asarray(embeddings.vectors[members[chunk:chunk + block_size]], dtype=np.float32) @ centroid
+                                       for chunk in range(0, size, block_size)])
+        if similarities[members == canonical][0] < threshold:
+            continue
+        duplicates = [(int(row), float(similarity)) for row, similarity in zip(members, similarities)
+                      if row != canonical and similarity >= threshold]
+        if duplicates:
+            clusters.append((int(canonical), duplicates))
+    clusters.sort(key=lambda cluster: -len(cluster[1]))
+    return clusters
+
+
+def fetch_reports(supabase_client, report_ids, chunk=200):
+    """Returns {id: row} with the title and user ids of each report, for the diff."""
+    reports = {}
+    for start in range(0, len(report_ids), chunk):
+        rows = (supabase_client.table('scamreports')
+            .select('id, title, count, user_ids, was_broadcasted')
+            .in_('id', report_ids[start:start + chunk])
+            .execute().data) or []
+        reports.update((row['id'], row) for row in rows)
+    return reports
+
+
+def print_diff(embeddings, clusters, reports):
+    """Prints what consolidating each cluster would change. Returns the number of reports that would newly reach the broadcast threshold."""
+    newly_broadcast = 0
+    for canonical, duplicates in clusters:
+        members = [embeddings.ids[canonical]] + [embeddings.ids[row] for row, _ in duplicates]
+        canonical_row = reports.get(members[0], {})
+        count = sum(int(embeddings.counts[row]) for row in [canonical] + [row for row, _ in duplicates])
+        users = {user for report_id in members for user in reports.get(report_id, {}).get('user_ids') or []}
+        broadcast = any(reports.get(report_id, {}).get('was_broadcasted') for report_id in members)
+        crosses = not broadcast and embeddings.counts[canonical] < BROADCAST_MIN_COUNT <= count
+        newly_broadcast += crosses
+        print(f"~ {members[0]} {canonical_row.get('title')!r}: count {embeddings.counts[canonical]} -> {count}, "
+              f"users {len(canonical_row.get('user_ids') or [])} -> {len(users)}"
+              f"{', reaches the broadcast threshold' if crosses else ''}")
+        for row, similarity in duplicates:
+            report = reports.get(embeddings.ids[row], {})
+            print(f"  - {embeddings.ids[row]} {report.get('title')!r} (count {embeddings.counts[row]}, similarity {similarity:.3f})")
+    return newly_broadcast
+
+
+def consolidate(supabase_client, embeddings, clusters):
+    """Merges each cluster with consolidate_scam_reports. Returns the number of reports merged away."""
+    merged = 0
+    for canonical, duplicates in clusters:
+        canonical_id = embeddings.ids[canonical]
+        duplicate_ids = [embeddings.ids[row] for row, _ in duplicates]
+        try:
+            response = supabase_client.rpc('consolidate_scam_reports', {
+                'p_canonical_id': canonical_id, 'p_duplicate_ids': duplicate_ids,
+            }).execute()
+        except Exception as e:
+            print(f"[consolidate] Could not merge {len(duplicate_ids)} reports into {canonical_id}: {e}")
+            continue
+        if not response.data:
+            print(f"[consolidate] Report {canonical_id} no longer exists; skipped")
+            continue
+        merged += len(duplicate_ids)
+        print(f"[consolidate] Merged {len(duplicate_ids)} reports into {canonical_id} (count {response.data[0].get('count')})")
+    return merged
+
+
+class MergedReports:
+    """
+    Maps reports merged away by consolidate_scam_reports to the report that absorbed them, refreshed by id
+    from scamreport_merges. The bot drops newly merged reports from its embedding index; the hash and
+    indicator indexes keep them until a restart, so their matches are resolved through here.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.last_id = 0
+        self._canonical = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._canonical)
+
+    def resolve(self, report_id):
+        """The report that now holds report_id, following merges of merged reports."""
+        with self._lock:
+            while report_id in self._canonical:
+                report_id = self._canonical[report_id]
+            return report_id
+
+    def refresh(self, supabase_client, page_size=1000):
+        """Pulls merges newer than the last one seen. Returns the ids of the reports newly merged away."""
+        added = []
+        while True:
+            rows = (supabase_client.table('scamreport_merges')
+                .select('id, duplicate_id, canonical_id')
+                .gt('id', self.last_id)
+                .order('id')
+                .limit(page_size)
+                .execute().data) or []
+            with self._lock:
+                for row in rows:
+                    self._canonical[row['duplicate_id']] = row['canonical_id']
+                    self.last_id = row['id']
+            added.extend(row['duplicate_id'] for row in rows)
+            if len(rows) < page_size:
+                return added
+
+    def load(self, supabase_client, page_size=1000):
+        added = self.refresh(supabase_client, page_size)
+        self.ready = True
+        return added
+
+
+def run(supabase_client, apply=False, threshold=SIMILARITY_THRESHOLD, block_size=BLOCK_SIZE, model=EMBEDDING_MODEL,
+        workdir=None, max_clusters=None):
+    """
+    One consolidation pass. Without apply only the diff is printed. Returns the number of reports merged away
+    (or that would be, on a dry run).
+    """
+    workdir = tempfile.mkdtemp(prefix="consolidate-", dir=workdir)
+    try:
+        start = time.perf_counter()
+        embeddings = ReportEmbeddings.load(supabase_client, os.path.join(workdir, "embeddings.f16"), model)
+        print(f"[consolidate] Loaded {len(embeddings)} embeddings in {time.perf_counter() - start:.0f}s")
+        start = time.perf_counter()
+        clusters = find_clusters(embeddings, threshold, block_size)[:max_clusters]
+        duplicates = sum(len(cluster[1]) for cluster in clusters)
+        print(f"[consolidate] {len(clusters)} clusters, {duplicates} duplicate reports, found in {time.perf_counter() - start:.0f}s")
+        if not apply:
+            reports = fetch_reports(supabase_client, [embeddings.ids[row] for canonical, members in clusters
+                                                      for row in [canonical] + [row for row, _ in members]])
+            newly_broadcast = print_diff(embeddings, clusters, reports)
+            print(f"[consolidate] Dry run: {duplicates} reports would merge into {len(clusters)}; "
+                  f"{newly_broadcast} would reach the broadcast threshold. Run with --apply to merge.")
+            return duplicates
+        merged = consolidate(supabase_client, embeddings, clusters)
+        print(f"[consolidate] Merged {merged} reports into {len(clusters)}")
+        return merged
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apply", action="store_true", help="merge the clusters; without it only the diff is printed")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--workdir", help="where the embeddings file goes (about 2 bytes per dimension per report)")
+    parser.add_argument("--max-clusters", type=int, help="consolidate at most this many clusters, largest first")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+    load_dotenv()
+    supabase_client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    run(supabase_client, args.apply, args.threshold, args.block_size, args.model, args.workdir, args.max_clusters)
+
+
+if __name__ == '__main__':
+    main()
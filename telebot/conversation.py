@@ -0,0 +1,68 @@
+"""
+Recent chat turns per chat, so free-chat replies can follow the conversation.
+
+Each chat keeps a ring buffer of (role, text, tokens) turns, trimmed oldest first to CHAT_CONTEXT_TOKENS
+and CHAT_CONTEXT_TURNS. Chats live in a MemorySessionStore, so the least recently active chat is
+dropped beyond CHAT_CONTEXT_MAX_CHATS and idle chats expire after CHAT_CONTEXT_TTL_SECONDS. Context is
+deliberately not persisted: losing it on restart only makes the next reply less specific.
+"""
+import os
+
+from google.genai import types
+
+import metrics
+from sessions import MemorySessionStore
+
+TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKENS", "1200"))
+MAX_TURNS = int(os.getenv("CHAT_CONTEXT_TURNS", "12"))
+MAX_CHATS = int(os.getenv("CHAT_CONTEXT_MAX_CHATS", "5000"))
+TTL_SECONDS = int(os.getenv("CHAT_CONTEXT_TTL_SECONDS", "3600"))
+
+input_tokens = metrics.registry.register(metrics.Histogram(
+    "tsfraud_chat_input_tokens", "Prompt tokens billed per chat turn, as reported by Gemini.", ("model",),
+    buckets=(50, 100, 200, 400, 800, 1200, 1600, 2400, 3200, 6400)))
+
+
+def estimate_tokens(text):
+    """About four characters per token, which is close enough for budgeting English chat text."""
+    return len(text) // 4 + 1
+
+
+class ConversationContext:
+    def __init__(self, token_budget=TOKEN_BUDGET, max_turns=MAX_TURNS, max_chats=MAX_CHATS, ttl_seconds=TTL_SECONDS):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.store = MemorySessionStore(max_sessions=max_chats, ttl_seconds=ttl_seconds)
+
+    def history(self, chat_id):
+        """The chat's recent turns as Gemini contents, oldest first."""
+        turns = self.store.get(chat_id, {}).get("turns", [])
+        return [types.Content(role=role, parts=[types.Part(text=text)]) for role, text, _ in turns]
+
+    def contents(self, chat_id, text):
+        """History followed by the new user message."""
+        return self.history(chat_id) + [types.Content(role="user", parts=[types.Part(text=text)])]
+
+    def record(self, chat_id, user_text, reply_text):
+        """Appends one exchange and drops the oldest turns until the chat fits its budget."""
+        turns = self.store.get(chat_id, {}).get("turns", [])
+        turns.append(["user", user_text, estimate_tokens(user_text)])
+        turns.append(["model", reply_text, estimate_tokens(reply_text)])
+        total = sum(tokens for _, _, tokens in turns)
+        # Drop whole exchanges so the history never starts with a model turn
+        while len(turns) > 2 and (total > self.token_budget or len(turns) > self.max_turns):
+            total -= turns[0][2] + turns[1][2]
+            del turns[:2]
+        if total > self.token_budget:
+            # A single exchange over budget isn't worth keeping
+            turns = []
+        self.store.put(chat_id, {"turns": turns})
+
+    def clear(self, chat_id):
+        self.store.delete(chat_id)
+
+
+def observe_usage(model, usage):
+    """Records the prompt tokens a chat turn was billed for, if the response reported usage."""
+    if usage is not None and usage.prompt_token_count:
+        input_tokens.observe(usage.prompt_token_count, model)
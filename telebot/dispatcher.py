@@ -0,0 +1,147 @@
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+
+import metrics
+
+# Bot API methods the handlers and broadcasts call; each is timed as an external call
+TIMED_API_METHODS = ('send_message', 'send_photo', 'send_media_group', 'edit_message_text',
+                     'answer_callback_query', 'get_file', 'download_file', 'get_me')
+
+def update_key(update):
+    """
+    Returns the ordering key for an update. Next-step handlers are registered per chat,
+    so updates from the same chat (the user, in a DM) must be handled one after another.
+    """
+    for attr in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        message = getattr(update, attr, None)
+        if message is not None:
+            return message.chat.id
+    callback_query = getattr(update, 'callback_query', None)
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+    return update.update_id
+
+
+class UpdateDispatcher:
+    """
+    Runs handlers on a bounded worker pool while keeping items with the same key in order.
+    Each key has its own FIFO queue, and at most one worker drains a given key at a time.
+    """
+
+    def __init__(self, handle, max_workers=8, max_pending=1000):
+        self._handle = handle
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatcher")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._pending = 0
+        self._active = 0
+        self._processed = 0
+        self._failed = 0
+
+    def submit(self, key, item):
+        # Blocks when max_pending items are queued, so a backlog slows down ingestion
+        # instead of growing without bound.
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(item)
+                return
+            self._queues[key] = deque([item])
+        self._executor.submit(self._drain, key)
+
+    def _drain(self, key):
+        with self._lock:
+            item = self._queues[key].popleft()
+            self._active += 1
+        try:
+            self._handle(item)
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            print(f"[UpdateDispatcher] Handler error for key {key}: {e}")
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._pending -= 1
+                self._processed += 1
+                more = bool(self._queues[key])
+                if not more:
+                    del self._queues[key]
+            self._slots.release()
+        if more:
+            # Requeue instead of looping so a busy chat cannot hold a worker forever.
+            self._executor.submit(self._drain, key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._pending - self._active,
+                "active_workers": self._active,
+                "max_workers": self.max_workers,
+                "worker_utilization": self._active / self.max_workers,
+                "active_keys": len(self._queues),
+                "processed": self._processed,
+                "failed": self._failed,
+            }
+
+    def wait_idle(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._pending == 0:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def shutdown(self, wait=True):
+        if wait:
+            self.wait_idle()
+        self._executor.shutdown(wait=wait)
+
+
+class DispatchingTeleBot(telebot.TeleBot):
+    """
+    TeleBot that hands each update to an UpdateDispatcher instead of processing the batch inline.
+    Handlers run synchronously inside the worker, so register_next_step_handler flows stay ordered per chat.
+    """
+
+    def __init__(self, token, num_workers=8, max_pending=1000, **kwargs):
+        kwargs["threaded"] = False
+        super().__init__(token, **kwargs)
+        self.dispatcher = UpdateDispatcher(self._process_update, max_workers=num_workers, max_pending=max_pending)
+
+    def _process_update(self, update):
+        super().process_new_updates([update])
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # Advance the polling offset here, since the update itself is processed later on a worker.
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(update_key(update), update)
+
+
+def _timed_api_method(name):
+    method = getattr(telebot.TeleBot, name)
+
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        with metrics.external_call("telegram", name):
+            return method(self, *args, **kwargs)
+    return timed
+
+
+for _name in TIMED_API_METHODS:
+    setattr(DispatchingTeleBot, _name, _timed_api_method(_name))
@@ -0,0 +1,195 @@
+"""
+Embeds scamreports rows that have no embedding (the embedding call failed when they were reported, so
+match_scam can never find them) or whose embedding came from a model other than the one asked for.
+
+Usage: python embedding_backfill.py [--model MODEL] [--batch-size 100] [--concurrency 4]
+                                    [--requests-per-minute 100] [--limit N] [--checkpoint PATH] [--restart]
+
+Reports are read in id order a page at a time. Their summaries (the original description is not stored)
+are embedded in batch requests of --batch-size texts, at most --concurrency requests at once and
+--requests-per-minute overall. Each page is written back with one set_scamreport_embeddings call,
+stamped with the model, and then checkpointed. A stopped or failed run resumes after the last
+written page; a finished run deletes the checkpoint. Rows per second and the estimated cost per 1,000
+rows are printed as it goes.
+
+To move to a new embedding model: run this with --model set to it, then set EMBEDDING_MODEL and restart
+the bot, then run it once more for reports added in between. The bot's local index picks up rewritten
+embeddings when it restarts; match_scam sees them at once.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from conversation import estimate_tokens
+from embedding_cache import EMBEDDING_MODEL
+from ratelimit import TokenBucket
+from vector_index import to_halfvec
+
+BATCH_SIZE = int(os.getenv("EMBEDDING_BACKFILL_BATCH_SIZE", "100"))  # most texts the API takes per request
+CONCURRENCY = int(os.getenv("EMBEDDING_BACKFILL_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_BACKFILL_REQUESTS_PER_MINUTE", "100"))
+CHECKPOINT_PATH = os.getenv("EMBEDDING_BACKFILL_CHECKPOINT", "embedding_backfill.json")
+# USD per million input tokens; gemini-embedding-001's paid tier. Experimental models are free.
+PRICE_PER_MILLION_TOKENS = float(os.getenv("EMBEDDING_PRICE_PER_MILLION_TOKENS", "0.15"))
+
+
+def report_text(report):
+    """What gets embedded for a report: its summary, or the title if there is none."""
+    return (report.get('summary') or report.get('title') or '').strip()
+
+
+class EmbeddingBackfill:
+    def __init__(self, supabase_client, gemini_client, model=EMBEDDING_MODEL, batch_size=BATCH_SIZE,
+                 concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE, checkpoint_path=CHECKPOINT_PATH,
+                 price_per_million_tokens=PRICE_PER_MILLION_TOKENS):
+        self.supabase = supabase_client
+        self.gemini = gemini_client
+        self.model = model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path
+        self.price_per_million_tokens = price_per_million_tokens
+        self.limiter = TokenBucket(rate=requests_per_minute / 60, capacity=concurrency)
+        self.state = self._load_checkpoint()
+
+    def _fresh_state(self):
+        return {"model": self.model, "last_id": None, "rows": 0, "skipped": 0, "requests": 0, "tokens": 0, "seconds": 0.0}
+
+    def _load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return self._fresh_state()
+        with open(self.checkpoint_path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        if state.get("model") != self.model:
+            print(f"[embedding_backfill] Checkpoint is for {state.get('model')}; starting over for {self.model}")
+            return self._fresh_state()
+        print(f"[embedding_backfill] Resuming after report {state['last_id']} ({state['rows']} rows already embedded)")
+        return state
+
+    def _save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        partial = self.checkpoint_path + ".tmp"
+        with open(partial, "w") as checkpoint_file:
+            json.dump(self.state, checkpoint_file)
+        os.replace(partial, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        self.state = self._fresh_state()
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def pending(self, after_id, limit):
+        """The next reports after after_id, by id, that have no embedding or one from another model."""
+        query = (self.supabase.table('scamreports')
+            .select('id, title, summary')
+            .or_(f"embeddings.is.null,embedding_model.is.null,embedding_model.neq.{self.model}")
+            .order('id')
+            .limit(limit))
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return query.execute().data or []
+
+    def embed_batch(self, texts):
+        """One batch request. Raises if the call fails after the client's retries."""
+        self.limiter.acquire()
+        result = self.gemini.models.embed_content(
+            model=self.model,
+            contents=texts,
+            config=types.EmbedContentConfig(task_type="CLUSTERING"),
+        )
+        if len(result.embeddings) != len(texts):
+            raise ValueError(f"asked for {len(texts)} embeddings and got {len(result.embeddings)}")
+        return [embedding.values for embedding in result.embeddings]
+
+    def stats(self):
+        rows = self.state["rows"]
+        seconds = self.state["seconds"]
+        tokens_per_1k = self.state["tokens"] / rows * 1000 if rows else 0
+        return {
+            "rows": rows,
+            "skipped": self.state["skipped"],
+            "requests": self.state["requests"],
+            "rows_per_second": rows / seconds if seconds else 0.0,
+            "tokens_per_1k_rows": tokens_per_1k,
+            "cost_per_1k_rows": tokens_per_1k / 1e6 * self.price_per_million_tokens,
+        }
+
+    def print_progress(self):
+        stats = self.stats()
+        print(f"[embedding_backfill] {stats['rows']} rows embedded ({stats['skipped']} without text skipped) "
+              f"in {stats['requests']} requests: {stats['rows_per_second']:.1f} rows/s, "
+              f"~{stats['tokens_per_1k_rows']:,.0f} tokens and ${stats['cost_per_1k_rows']:.4f} per 1k rows")
+
+    def run(self, limit=None):
+        """Embeds pending reports until none are left, or `limit` rows this run. Returns stats()."""
+        page_size = self.batch_size * self.concurrency
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as pool:
+            while limit is None or processed < limit:
+                start = time.perf_counter()
+                size = page_size if limit is None else min(page_size, limit - processed)
+                reports = self.pending(self.state["last_id"], size)
+                if not reports:
+                    stats = self.stats()
+                    self.clear_checkpoint()
+                    print("[embedding_backfill] No reports left to embed")
+                    return stats
+                work = [report for report in reports if report_text(report)]
+                batches = [work[i:i + self.batch_size] for i in range(0, len(work), self.batch_size)]
+                # A failed batch raises here, before anything from this page is written or checkpointed
+                vectors = list(pool.map(lambda batch: self.embed_batch([report_text(report) for report in batch]), batches))
+                rows = [{"id": report["id"], "embedding": to_halfvec(vector), "model": self.model}
+                        for batch, batch_vectors in zip(batches, vectors)
+                        for report, vector in zip(batch, batch_vectors)]
+                if rows:
+                    self.supabase.rpc('set_scamreport_embeddings', {'p_rows': rows}).execute()
+
+                processed += len(reports)
+                self.state["last_id"] = reports[-1]["id"]
+                self.state["rows"] += len(rows)
+                self.state["skipped"] += len(reports) - len(work)
+                self.state["requests"] += len(batches)
+                self.state["tokens"] += sum(estimate_tokens(report_text(report)) for report in work)
+                self.state["seconds"] += time.perf_counter() - start
+                self._save_checkpoint()
+                self.print_progress()
+        return self.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--requests-per-minute", type=float, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--limit", type=int, help="stop after this many reports (the checkpoint keeps the place)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from google import genai
+    from supabase import create_client
+    from model_client import ModelClient
+    load_dotenv()
+    job = EmbeddingBackfill(create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")),
+                            ModelClient(genai.Client(api_key=os.getenv("API_KEY"))),
+                            model=args.model, batch_size=args.batch_size, concurrency=args.concurrency,
+                            requests_per_minute=args.requests_per_minute, checkpoint_path=args.checkpoint)
+    if args.restart:
+        job.clear_checkpoint()
+    try:
+        job.run(limit=args.limit)
+    except Exception as e:
+        print(f"[embedding_backfill] Stopped: {e}. Run again to resume after report {job.state['last_id']}.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from google.genai import types
+
+# Reports store the model their embedding came from; run embedding_backfill.py before switching models
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "gemini-embedding-exp-03-07")
+
+
+def normalize_text(text):
+    """Normalises text so trivially different copies of the same message share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def cache_key(text, model, task_type):
+    return hashlib.sha256(f"{model}\0{task_type}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with an in-memory LRU tier and an optional SQLite tier on disk.
+    Vectors are kept as float32 arrays in memory and as raw float32 blobs on disk.
+    """
+
+    def __init__(self, max_entries=2048, path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+            if self._conn is not None:
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = array('f')
+                    vector.frombytes(row[0])
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector.tolist()
+            self.misses += 1
+            return None
+
+    def put(self, key, values):
+        """Stores a vector and returns it as float32-rounded floats, matching what later hits return."""
+        vector = array('f', values)
+        with self._lock:
+            self._remember(key, vector)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                   (key, vector.tobytes()))
+        return vector.tolist()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+    path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+)
+
+
+def embed_text(client, text, model=EMBEDDING_MODEL, task_type="CLUSTERING", cache=embedding_cache, gate=None):
+    """
+    Returns the embedding for text, calling the model only on a cache miss. Raises on API errors.
+    `gate` is an optional context manager (e.g. an admission slot) entered around the model call only.
+    """
+    key = cache_key(text, model, task_type)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    with gate or nullcontext():
+        result = client.models.embed_content(
+            model=model,
+            contents=text,
+            config=types.EmbedContentConfig(task_type=task_type)
+        )
+    return cache.put(key, result.embeddings[0].values)
@@ -0,0 +1,161 @@
+import io
+import json
+import mimetypes
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from image_hash import dhash
+
+try:
+    from PIL import Image
+except ImportError:  # without Pillow, images are sent to the model as downloaded
+    Image = None
+
+# Images sent to Gemini are downscaled to fit within this many pixels on the long side
+MODEL_MAX_DIMENSION = int(os.getenv("EVIDENCE_MODEL_MAX_DIMENSION", "1568"))
+MODEL_MAX_BYTES = int(os.getenv("EVIDENCE_MODEL_MAX_BYTES", str(1024 * 1024)))
+# Photos per report that are downloaded, stored and sent to the model, and how many are transferred at once
+MAX_PHOTOS = int(os.getenv("EVIDENCE_MAX_PHOTOS", "10"))
+TRANSFER_WORKERS = int(os.getenv("EVIDENCE_TRANSFER_WORKERS", "4"))
+
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def sniff_mime_type(data, file_path=None):
+    """Detects the MIME type from magic bytes, falling back to the file extension."""
+    for signature, mime_type in SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if file_path:
+        return mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    return 'application/octet-stream'
+
+
+class EvidenceImage:
+    """
+    A photo downloaded once from Telegram. The same bytes feed the storage upload and the Gemini prompt.
+    bot.download_file returns the whole file, so the bytes are kept as they are: Telegram caps bot
+    downloads at 20 MB and MAX_PHOTOS bounds how many a report holds.
+    Per-stage timings (seconds) are recorded in `timings`.
+    """
+
+    def __init__(self, file_id, data, file_path=None):
+        self.file_id = file_id
+        self.size = len(data)
+        self.mime_type = sniff_mime_type(data, file_path)
+        self.file_ext = mimetypes.guess_extension(self.mime_type) or os.path.splitext(file_path or "")[1] or ".jpg"
+        if self.file_ext == ".jpe":
+            self.file_ext = ".jpg"
+        self.timings = {}
+        self._perceptual_hash = None
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def close(self):
+        # Releases the bytes even if the image is still referenced after the report is handled
+        self._data = b""
+
+    def perceptual_hash(self):
+        """Returns the image's 64-bit dHash (computed once), or None if it is not a decodable image."""
+        if self._perceptual_hash is None and self.mime_type.startswith("image/"):
+            start = time.perf_counter()
+            self._perceptual_hash = dhash(self.read())
+            self.timings["hash"] = time.perf_counter() - start
+        return self._perceptual_hash
+
+    def model_part(self):
+        """Returns a types.Part for Gemini, downscaled and re-encoded as JPEG if the image is large."""
+        start = time.perf_counter()
+        data, mime_type = self.read(), self.mime_type
+        if Image is not None and mime_type.startswith("image/"):
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    if max(image.size) > MODEL_MAX_DIMENSION or len(data) > MODEL_MAX_BYTES:
+                        image.thumbnail((MODEL_MAX_DIMENSION, MODEL_MAX_DIMENSION))
+                        output = io.BytesIO()
+                        image.convert("RGB").save(output, format="JPEG", quality=85)
+                        data, mime_type = output.getvalue(), "image/jpeg"
+            except Exception as e:
+                print(f"[EvidenceImage] Could not downscale {self.file_id}, sending original: {e}")
+        self.timings["preprocess"] = time.perf_counter() - start
+        return types.Part(inline_data=types.Blob(mime_type=mime_type, data=data))
+
+
+def download_evidence(bot, file_id):
+    """Downloads a Telegram file into an EvidenceImage."""
+    start = time.perf_counter()
+    file_info = bot.get_file(file_id)
+    if file_info.file_path is None:
+        raise ValueError("File path is None from Telegram API")
+    image = EvidenceImage(file_id, bot.download_file(file_info.file_path), file_info.file_path)
+    image.timings["download"] = time.perf_counter() - start
+    return image
+
+
+def upload_evidence(image, supabase_client, bucket='images'):
+    """Uploads evidence bytes to Supabase storage. Returns the stored file name, or None on failure."""
+    start = time.perf_counter()
+    file_name = f"{uuid.uuid4()}{image.file_ext}"
+    try:
+        upload_response = supabase_client.storage.from_(bucket).upload(
+            path=file_name,
+            file=image.read(),
+            file_options={"content-type": image.mime_type}
+        )
+        if hasattr(upload_response, 'status_code') and upload_response.status_code != 200:
+            error_message = f"Failed to upload image to Supabase. Status: {upload_response.status_code}"
+            try:
+                error_content = upload_response.content.decode()
+                error_details = json.loads(error_content)
+                error_message += f" Details: {error_details.get('message', error_content)}"
+            except (json.JSONDecodeError, AttributeError):
+                error_message += " Could not parse error details from response."
+            print(error_message)
+            return None
+        return file_name
+    except Exception as e:
+        print(f"Error uploading image to Supabase: {e}")
+        return None
+    finally:
+        image.timings["upload"] = time.perf_counter() - start
+
+
+def _download_or_error(bot, file_id):
+    try:
+        return download_evidence(bot, file_id), None
+    except Exception as e:
+        print(f"[download_evidence_batch] Could not download {file_id}: {e}")
+        return None, e
+
+
+def download_evidence_batch(bot, file_ids, max_workers=TRANSFER_WORKERS):
+    """
+    Downloads several photos concurrently. Returns (file_id, EvidenceImage or None, error or None)
+    tuples in the order given; one failed download does not affect the others.
+    """
+    if not file_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_ids))) as pool:
+        results = list(pool.map(lambda file_id: _download_or_error(bot, file_id), file_ids))
+    return [(file_id, image, error) for file_id, (image, error) in zip(file_ids, results)]
+
+
+def upload_evidence_batch(images, supabase_client, max_workers=TRANSFER_WORKERS, bucket='images'):
+    """Uploads several images concurrently. Returns the stored file names in order, with None for failed uploads."""
+    if not images:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(images))) as pool:
+        return list(pool.map(lambda image: upload_evidence(image, supabase_client, bucket), images))
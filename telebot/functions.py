@@ -1,30 +1,87 @@
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 import telebot
 import os
-import requests
+import time
 import io
-import mimetypes
+import threading
 import uuid
-import json
 from supabase import create_client, Client as SupabaseClient
+from sessions import create_session_store
+from vector_index import ScamVectorIndex, normalize, parse_embedding, to_halfvec
+from embedding_cache import EMBEDDING_MODEL, embed_text, embedding_cache
+from verdict_cache import VerdictCache
+from report_ai import REPORT_MODEL, analyze_report
+from ratelimit import TokenBucket
+import metrics
+from model_client import ModelClient
+import classifier
+from conversation import ConversationContext, observe_usage
+from streaming import STREAM_REPLIES, StreamingReply, StreamInterrupted, edit_interval
+from admission import AdmissionRejected, PRIORITY_CHAT, PRIORITY_REPORT, PRIORITY_VERIFY, controller as admission
+from broadcast_trigger import BroadcastTrigger
+from image_hash import ImageHashIndex, to_signed
+from indicators import IndicatorIndex, extract_indicators
+import consolidate
+from consolidate import MergedReports
+from evidence_media import MAX_PHOTOS, download_evidence, download_evidence_batch, upload_evidence, upload_evidence_batch
 
 load_dotenv()
-user_reports = {}
+# In-progress /report drafts, keyed by user id. Abandoned drafts expire after SESSION_TTL_SECONDS.
+user_reports = create_session_store()
+chat_context = ConversationContext()
+# Local copy of scamreports embeddings for duplicate matching; match_scam is the fallback, and takes over
+# for good once the table outgrows SCAM_INDEX_MAX_MB
+scam_index = ScamVectorIndex(max_bytes=int(os.getenv("SCAM_INDEX_MAX_MB", "256")) * 2**20)
+SIMILARITY_THRESHOLD = 0.85
+# Perceptual hashes of stored evidence screenshots, for reports whose descriptions differ but whose screenshots match.
+# A screenshot match only counts with a shared indicator or text at least this similar, and at most
+# SCREENSHOT_MAX_CANDIDATES of the closest screenshots are checked.
+image_hash_index = ImageHashIndex()
+SCREENSHOT_SIMILARITY_FLOOR = float(os.getenv("SCREENSHOT_SIMILARITY_FLOOR", "0.7"))
+SCREENSHOT_MAX_CANDIDATES = 3
+indicator_index = IndicatorIndex()
+# Known indicators settle /verify and report verification without a model call only once this many distinct reports
+# mention them: a single report can carry a genuine number or link, and nothing else would catch the mistake.
+# Bare domains never do: reports name the real site a scammer imitated ("the real site is dhl.com"), so brand
+# domains get indexed alongside the scam ones.
+INDICATOR_MIN_REPORTS = int(os.getenv("INDICATOR_MIN_REPORTS", "2"))
+DECISIVE_INDICATOR_KINDS = ("url", "phone", "wallet", "handle")
+# Reports merged away by consolidate.py stay in the hash and indicator indexes until a restart; matches on them resolve here
+merged_reports = MergedReports()
+# Forwarded scam messages repeat with small edits, so model verdicts are reused for near-duplicates
+verdict_cache_size = int(os.getenv("VERDICT_CACHE_SIZE", "5000"))
+verdict_cache_ttl = int(os.getenv("VERDICT_CACHE_TTL_SECONDS", "86400"))
+verification_cache = VerdictCache(max_entries=verdict_cache_size, ttl_seconds=verdict_cache_ttl)
+report_verdict_cache = VerdictCache(max_entries=verdict_cache_size, ttl_seconds=verdict_cache_ttl)
+# Verify and summarise a report in one structured Gemini call instead of verify_report_py plus a summary call.
+# Either way a report is only saved, merged or counted toward BROADCAST_MIN_COUNT once it is verified: a model
+# verdict accepts it, or it mentions indicators earlier reports confirmed. If no verdict can be had (overload,
+# outage, unparsable reply) the report is held back and the user keeps the draft to submit again later.
+combined_report_analysis = os.getenv("COMBINED_REPORT_ANALYSIS", "True").lower() == "true"
+BROADCAST_MIN_COUNT = 3
+broadcast_batch_size = int(os.getenv("BROADCAST_BATCH_SIZE", "20"))
+broadcast_concurrency = int(os.getenv("BROADCAST_CONCURRENCY", "4"))
+broadcast_lease_seconds = int(os.getenv("BROADCAST_LEASE_SECONDS", "600"))
+# Telegram allows roughly 20 messages per minute to a single channel
+broadcast_limiter = TokenBucket(rate=int(os.getenv("BROADCAST_MESSAGES_PER_MINUTE", "20")) / 60, capacity=3)
+broadcast_owner = f"bot-{uuid.uuid4()}"
+broadcast_trigger: BroadcastTrigger | None = None
 # banned_words = ["model", "models", "gemma", "gemini", "google", "gpt", "openai", "chatgpt", "llama", "meta", "mistral",
 #                 "anthropic", "claude", "gex", "mistral", "prompt", "gernig", "llm"]
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 db_enabled = os.getenv("DB_ENABLED", "False").lower() == "true"
-client = genai.Client(api_key=os.getenv("API_KEY"))
+client = ModelClient(genai.Client(api_key=os.getenv("API_KEY")), admit=admission.admit_fallback)
 supabase: SupabaseClient | None = None
 
 if db_enabled:
     if supabase_url and supabase_key:
         try:
-            supabase = create_client(supabase_url, supabase_key)
+            supabase = metrics.InstrumentedSupabase(create_client(supabase_url, supabase_key))
             print("Supabase client initialized successfully")
         except Exception as e:
             print(f"Supabase client initialization failed: {e}")
@@ -53,6 +110,7 @@ def send_welcome(bot, message):
                  reply_markup=markup)
 
 
+@metrics.timed_handler("chat")
 def send_message(bot, client, message):
     if message.chat.type in ['group', 'supergroup'] or message.text.lower().startswith('confirm'):
         bot_info = bot.get_me()
@@ -66,28 +124,78 @@ def send_message(bot, client, message):
         process_message(bot, client, message, message.text)
 
 
+# Sent once per call as the system instruction; the conversation itself goes in the contents
+CHAT_CONFIG = types.GenerateContentConfig(system_instruction=(
+    "You are TsFraudPmo, a bot made by TeamAurora (Ryan, Nicolas, Yin Zi). "
+    "You have already introduced yourself to the user. Only reintroduce yourself if the user asks. "
+    "You raise awareness about scams, and help people avoid and report scams. "
+    "You also regularly broadcast information about scams to users. "
+    "Reply (in under 5 sentences) to the user's latest message, using the earlier messages for context."
+))
+
+
+# Answers the local classifier gives without asking Gemini
+SMALLTALK_REPLY = (
+    "Hi! I'm TsFraudPmo. Forward me a suspicious message with /verify, report a scam with /report, "
+    "or ask me anything about staying safe from scams."
+)
+LOCAL_SCAM_VERDICT = (
+    "This message is LIKELY A SCAM.\n\n"
+    "It closely matches scam messages that other users have reported. Do not click its links, reply to it, "
+    "or share any codes, passwords or bank details. If you were targeted, tell us with /report."
+)
+LOCAL_SMALLTALK_VERDICT = (
+    "This message is LIKELY NOT A SCAM.\n\n"
+    "It reads like ordinary conversation, with no links, payment requests or requests for personal details."
+)
+
+
 def process_message(bot, client, message, text):
     # if any(word in text.lower() for word in banned_words) or len(text) < 2:
     #     bot.send_message(message.chat.id, "Sorry, I can't respond to that content. ")
     #     return
 
-    prompt = (
-            "You are TsFraudPmo, a bot made by TeamAurora (Ryan, Nicolas, Yin Zi). "
-            "You have already introduced yourself to the user. Only reintroduce yourself if the user asks. "
-            "You raise awareness about scams, and help people avoid and report scams. "
-            "You also regularly broadcast information about scams to users. "
-            "Your task is to provide a reply (in under 5 sentences) addressing the user's following message: "
-            + text
-    )
+    if classifier.classify(text, "chat", ("smalltalk",)):
+        bot.send_message(message.chat.id, SMALLTALK_REPLY)
+        chat_context.record(message.chat.id, text, SMALLTALK_REPLY)
+        return
+
+    contents = chat_context.contents(message.chat.id, text)
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-lite", contents=prompt,
-        )
+        admission.check_user(message.from_user.id, PRIORITY_CHAT)
+        if STREAM_REPLIES:
+            reply = StreamingReply(bot, message.chat.id, "chat", "gemini-2.0-flash-lite", edit_interval(message.chat))
+            with admission.admit("gemini-2.0-flash-lite", PRIORITY_CHAT):
+                reply.consume(client.models.generate_content_stream(
+                    model="gemini-2.0-flash-lite", contents=contents, config=CHAT_CONFIG,
+                ))
+            chat_context.record(message.chat.id, text, reply.finish())
+            observe_usage("gemini-2.0-flash-lite", reply.usage)
+            return
+        with admission.admit("gemini-2.0-flash-lite", PRIORITY_CHAT):
+            response = client.models.generate_content(
+                model="gemini-2.0-flash-lite", contents=contents, config=CHAT_CONFIG,
+            )
         bot.send_message(message.chat.id, response.text)
+        chat_context.record(message.chat.id, text, response.text)
+        observe_usage("gemini-2.0-flash-lite", response.usage_metadata)
+    except AdmissionRejected as e:
+        send_busy_reply(bot, message, e)
+    except StreamInterrupted as e:
+        print(f"[process_message] Reply cut off: {e}")
     except Exception as e:
         bot.send_message(message.chat.id, "Oops, something went wrong! Please try again, or wait a while.")
 
 
+def send_busy_reply(bot, message, rejection):
+    """Answers without calling Gemini when a request was not admitted."""
+    print(f"[admission] {rejection} (user {message.from_user.id})")
+    if rejection.reason == "rate_limited":
+        bot.send_message(message.chat.id, "You're sending messages faster than I can answer. Please wait a minute and try again.")
+    else:
+        bot.send_message(message.chat.id, "I'm handling a lot of requests right now. Please try again in a minute.")
+
+
 def send_error_message(bot, message, content_type):
     if message.chat.type not in ['group', 'supergroup']:
         match content_type:
@@ -109,9 +217,44 @@ def send_error_message(bot, message, content_type):
 
 
 
+def register_session_eviction(bot):
+    """Clears pending next-step handlers when an abandoned report draft is evicted."""
+    def on_evict(user_id, report):
+        bot.clear_step_handler_by_chat_id(report.get("chat_id", user_id))
+        print(f"[user_reports] Evicted report draft for user {user_id}")
+    user_reports.on_evict = on_evict
+
+
+def get_report_draft(message):
+    return user_reports.get(message.from_user.id) or {"description": "", "evidence": [], "chat_id": message.chat.id}
+
+
 def report_scam(bot, message, gemini_client):
     user_id = message.from_user.id
-    user_reports[user_id] = { "description" : "", "evidence" : [] }
+    draft = user_reports.get(user_id)
+    if draft and draft.get("description"):
+        # Drafts survive restarts with the sqlite backend, so offer to pick up where the user left off
+        markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+        markup.add(telebot.types.KeyboardButton("Resume report"), telebot.types.KeyboardButton("Start new report"))
+        bot.send_message(message.chat.id, "You have an unfinished report. Would you like to resume it or start a new one?",
+                         reply_markup=markup)
+        bot.register_next_step_handler(message, choose_draft, bot, gemini_client)
+        return
+    start_new_report(bot, message, gemini_client)
+
+
+def choose_draft(message, bot, gemini_client):
+    if (message.text or "").lower().startswith("start new"):
+        # The old draft is discarded, so a later /report cannot bring it back
+        user_reports.delete(message.from_user.id)
+        start_new_report(bot, message, gemini_client)
+    else:
+        bot.send_message(message.chat.id, "Resuming your unfinished report.")
+        show_evidence_options(bot, message, gemini_client)
+
+
+def start_new_report(bot, message, gemini_client):
+    user_reports.put(message.from_user.id, {"description": "", "evidence": [], "chat_id": message.chat.id})
 
     bot.send_message(message.chat.id, "Please provide a brief description of the scam. "
                                       "Include relevant information such as:\n\n"
@@ -128,8 +271,9 @@ def get_description(message, bot, gemini_client):
         bot.register_next_step_handler(message, get_description, bot, gemini_client)
         return
 
-    user_id = message.from_user.id
-    user_reports[user_id]["description"] = message.text
+    report = get_report_draft(message)
+    report["description"] = message.text
+    user_reports.put(message.from_user.id, report)
 
     show_evidence_options(bot, message, gemini_client)
 
@@ -162,7 +306,7 @@ def request_evidence(message, bot, gemini_client):
 
 def show_report_preview(bot, message, gemini_client, confirm=False):
     user_id = message.from_user.id
-    report = user_reports.get(user_id, {})
+    report = user_reports.get(user_id) or {}
     desc = report.get("description", "(none)")
     evidence = report.get("evidence", [])
     
@@ -236,8 +380,9 @@ def edit_description(message, bot, gemini_client):
         bot.register_next_step_handler(message, edit_description, bot, gemini_client)
         return
 
-    user_id = message.from_user.id
-    user_reports[user_id]["description"] = message.text
+    report = get_report_draft(message)
+    report["description"] = message.text
+    user_reports.put(message.from_user.id, report)
     bot.send_message(message.chat.id, "Description updated successfully!")
     show_evidence_options(bot, message, gemini_client)
 
@@ -252,8 +397,9 @@ def collect_evidence(message, bot, gemini_client):
         bot.register_next_step_handler(message, collect_evidence, bot, gemini_client)
         return
 
-    user_id = message.from_user.id
-    user_reports[user_id]["evidence"].append(message.text + "\n")
+    report = get_report_draft(message)
+    report["evidence"].append(message.text + "\n")
+    user_reports.put(message.from_user.id, report)
 
     markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     yes_btn = telebot.types.KeyboardButton("Yes (Submit evidence)")
@@ -267,13 +413,11 @@ def collect_evidence(message, bot, gemini_client):
 
 
 def handle_photo_evidence(bot, message, gemini_client):
-    user_id = message.from_user.id
-    if user_id not in user_reports:
-        user_reports[user_id] = {"description": "", "evidence": []}
-
+    report = get_report_draft(message)
     photo = message.photo[-1]
     file_id = photo.file_id
-    user_reports[user_id]["evidence"].append(f"[PHOTO] {file_id}")
+    report["evidence"].append(f"[PHOTO] {file_id}")
+    user_reports.put(message.from_user.id, report)
 
     markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     yes_btn = telebot.types.KeyboardButton("Yes (Submit evidence)")
@@ -288,60 +432,368 @@ def handle_photo_evidence(bot, message, gemini_client):
 
 def generate_embedding_py(text: str, client):
     try:
-        result = client.models.embed_content(
-            model="gemini-embedding-exp-03-07",
-            contents=text,
-            config=types.EmbedContentConfig(task_type="CLUSTERING")
-        )
-        embeddings = result.embeddings[0].values
-        return embeddings
+        # Repeated reports of the same scam text are served from the embedding cache
+        return embed_text(client, text, gate=admission.admit(EMBEDDING_MODEL, PRIORITY_REPORT))
     except Exception as e:
         print(f"Error generating embeddings: {e}")
     return []
         
 
+def local_report_verdict(description: str):
+    """
+    A verdict on the report without a model call: the cached verdict for the same description, or True
+    when the local classifier is confident it describes a scam. None if neither applies.
+    """
+    cached = report_verdict_cache.get(description)
+    if cached is not None:
+        return cached
+    if classifier.classify(description, "report", ("scam",)):
+        return True
+    return None
+
+
 def verify_report_py(description: str, gemini_client):
     """
     Verifies if the scam description appears legitimate using Gemini.
-    Returns True if likely legitimate, False otherwise or if an error occurs.
+    Returns True if likely legitimate, False if not, or None if no verdict could be had.
     """
+    local = local_report_verdict(description)
+    if local is not None:
+        return local
+
     prompt = (
         f"Verify whether this scam is a legitimate incident through identifiying common scam red flags such as phishing links, unsolicited requests for personal info (passwords, bank details, phone number), sense of urgency or threats. If unsure, just return true to be safe.\\n "
         f"Return a single boolean (true or false) response.\\n"
         f"Incident description:\\n{description}"
     )
     try:
-        response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash", contents=prompt,
-        )
+        with admission.admit("gemini-2.0-flash", PRIORITY_REPORT):
+            response = gemini_client.models.generate_content(
+                model="gemini-2.0-flash", contents=prompt,
+            )
         
         text = response.text.strip().lower()
 
-        if text == 'true':
-            return True
-        if text == 'false':
-            return False
-        
+        verdict = None
+        if text == 'true' or text == 'false':
+            verdict = text == 'true'
         # Fallback for responses that might include the boolean within other text
-        if 'true' in text:
-            return True
-        if 'false' in text:
-            return False
+        elif 'true' in text:
+            verdict = True
+        elif 'false' in text:
+            verdict = False
+
+        if verdict is not None:
+            report_verdict_cache.put(description, verdict)
+            return verdict
+
+        print(f"[verify_report_py] Unable to parse verification response: '{text}'. Leaving the report unverified.")
+        return None
+    except Exception as e:
+        # Overload or an outage is not evidence of a false report, nor of a real one
+        print(f"[verify_report_py] Error during report verification with Gemini: {e}")
+        return None
+
+
+def merge_scam_report(report_id, user_id, embeddings, title, summary, report_type, images, timestamp):
+    """
+    Merges a new incident into an existing report with the merge_scam_report database function.
+    New image URLs are appended to the report's images. Returns the merged row, or None if the
+    report no longer exists or the call fails.
+    """
+    params = {
+        'p_report_id': report_id,
+        'p_user_id': str(user_id),
+        'p_embedding': to_halfvec(embeddings) if embeddings else None,
+        'p_title': title,
+        'p_summary': summary,
+        'p_type': report_type,
+        'p_images': images or None,
+        'p_timestamp': timestamp,
+    }
+    try:
+        response = supabase.rpc('merge_scam_report', params).execute()
+    except Exception as e:
+        print(f"[merge_scam_report] Supabase merge error for report {report_id}: {e}")
+        return None
+    if not response.data:
+        print(f"[merge_scam_report] Report {report_id} was not found while merging.")
+        return None
+    return response.data[0]
+
+
+def load_scam_index():
+    """
+    Loads (or incrementally refreshes) the local embedding, screenshot-hash and indicator indexes, and the
+    map from reports consolidate.py merged away to the report that absorbed them.
+    """
+    if not db_enabled or not supabase:
+        return
+    try:
+        if scam_index.ready:
+            added = scam_index.refresh(supabase)
+        else:
+            added = scam_index.load(supabase)  # nothing once the table has outgrown the index
+            if scam_index.ready:
+                print(f"[scam_index] Loaded {len(scam_index)} report embeddings")
+        if added:
+            print(f"[scam_index] Indexed {added} new or updated reports")
+    except Exception as e:
+        print(f"[scam_index] Could not load report embeddings: {e}")
+    try:
+        if image_hash_index.ready:
+            added = image_hash_index.refresh(supabase)
+        else:
+            added = image_hash_index.load(supabase)
+            print(f"[image_hash_index] Loaded {len(image_hash_index)} screenshot hashes")
+        if added:
+            print(f"[image_hash_index] Indexed {added} new screenshot hashes")
+    except Exception as e:
+        print(f"[image_hash_index] Could not load screenshot hashes: {e}")
+    try:
+        if indicator_index.ready:
+            added = indicator_index.refresh(supabase)
+        else:
+            added = indicator_index.load(supabase)
+            print(f"[indicator_index] Loaded {len(indicator_index)} scam indicators")
+        if added:
+            print(f"[indicator_index] Indexed {added} new scam indicators")
+    except Exception as e:
+        print(f"[indicator_index] Could not load scam indicators: {e}")
+    try:
+        if merged_reports.ready:
+            merged = merged_reports.refresh(supabase)
+            if merged:
+                # The canonical reports' new embeddings arrive through scam_index.refresh (embedding_updated_at)
+                removed = scam_index.remove(merged)
+                print(f"[merged_reports] {len(merged)} reports newly consolidated, {removed} dropped from scam_index")
+        else:
+            merged_reports.load(supabase)
+            print(f"[merged_reports] Loaded {len(merged_reports)} consolidated reports")
+    except Exception as e:
+        print(f"[merged_reports] Could not load consolidated reports: {e}")
 
-        print(f"[verify_report_py] Unable to parse verification response: '{text}'. Assuming non-verified.")
-        return False # Default to False if parsing fails
+
+consolidation_lock = threading.Lock()
+
+
+def consolidate_reports():
+    """
+    Merges clusters of duplicate reports (consolidate.py --apply), then refreshes the local indexes so matches
+    on reports merged away resolve to the report that absorbed them. Skipped while an earlier pass still runs.
+    """
+    if not db_enabled or not supabase:
+        return
+    if not consolidation_lock.acquire(blocking=False):
+        print("[consolidate_reports] Previous pass still running, skipping")
+        return
+    try:
+        consolidate.run(supabase, apply=True)
+        load_scam_index()
     except Exception as e:
-        print(f"Error during report verification with Gemini: {e}")
-        return False # Default to False on error
+        print(f"[consolidate_reports] Consolidation failed: {e}")
+    finally:
+        consolidation_lock.release()
 
 
+def find_similar_report(embeddings):
+    """
+    Returns the most similar existing report row above SIMILARITY_THRESHOLD, or None.
+    Uses the local index when loaded, and the match_scam RPC otherwise or if the local lookup fails.
+    """
+    if scam_index.ready:
+        try:
+            matches = scam_index.query(embeddings, k=1, threshold=SIMILARITY_THRESHOLD)
+            if not matches:
+                return None
+            report_id = merged_reports.resolve(matches[0][0])
+            return supabase.table('scamreports').select('*').eq('id', report_id).single().execute().data
+        except Exception as e:
+            print(f"[find_similar_report] Local index lookup failed, falling back to match_scam: {e}")
+
+    match_params = {
+        'query_embedding': to_halfvec(embeddings),
+        'match_threshold': SIMILARITY_THRESHOLD,
+        'match_count': 1
+    }
+    response = supabase.rpc('match_scam', match_params).execute()
+    if not (hasattr(response, 'data') and response.data):
+        return None
+    existing_report = response.data[0]
+    if 'count' not in existing_report:
+        existing_report = supabase.table('scamreports').select('*').eq('id', existing_report.get('id')).single().execute().data
+    return existing_report
+
+
+def find_report_by_screenshot(image_hashes, embeddings=None, known_indicators=()):
+    """
+    Returns the report whose stored evidence screenshot is closest to one of image_hashes (within the
+    index's max distance) and whose text agrees with the new report, or None. Only the local index is searched.
+    Chat screenshots with the same layout hash alike whatever scam they show, so the report must also be
+    one of known_indicators' reports, or have an embedding at least SCREENSHOT_SIMILARITY_FLOOR similar.
+    """
+    if not image_hashes or not image_hash_index.ready:
+        return None
+    distances = {}
+    for image_hash in image_hashes:
+        for report_id, distance in image_hash_index.query(image_hash):
+            report_id = merged_reports.resolve(report_id)
+            distances[report_id] = min(distance, distances.get(report_id, distance))
+    shared_indicator_reports = {report_id for _, _, report_ids in known_indicators for report_id in report_ids}
+    query_vector = parse_embedding(embeddings)
+    candidates = sorted(distances.items(), key=lambda item: item[1])[:SCREENSHOT_MAX_CANDIDATES]
+    for report_id, distance in candidates:
+        if report_id not in shared_indicator_reports and query_vector is None:
+            continue
+        report = supabase.table('scamreports').select('*').eq('id', report_id).single().execute().data
+        if report_id in shared_indicator_reports:
+            print(f"[find_report_by_screenshot] Screenshot matches report {report_id} at Hamming distance {distance}, "
+                  f"with a shared indicator")
+            return report
+        stored_vector = parse_embedding(report.get('embeddings'))
+        if stored_vector is None or stored_vector.size != query_vector.size:
+            continue
+        similarity = float(normalize(stored_vector) @ normalize(query_vector))
+        if similarity >= SCREENSHOT_SIMILARITY_FLOOR:
+            print(f"[find_report_by_screenshot] Screenshot matches report {report_id} at Hamming distance {distance}, "
+                  f"with text similarity {similarity:.2f}")
+            return report
+        print(f"[find_report_by_screenshot] Ignoring screenshot match with report {report_id}: "
+              f"text similarity {similarity:.2f} is below {SCREENSHOT_SIMILARITY_FLOOR}")
+    return None
+
+
+def store_image_hashes(report_id, image_hashes):
+    """Saves screenshot hashes for a report and adds them to the local index."""
+    if not image_hashes:
+        return
+    rows = [{"report_id": report_id, "hash": to_signed(image_hash)} for image_hash in set(image_hashes)]
+    try:
+        supabase.table('scamreport_image_hashes').upsert(rows, on_conflict='report_id,hash', ignore_duplicates=True).execute()
+    except Exception as e:
+        print(f"[store_image_hashes] Could not save screenshot hashes for report {report_id}: {e}")
+        return
+    for image_hash in image_hashes:
+        image_hash_index.add(report_id, image_hash)
+
+
+def find_known_indicators(indicators, min_reports=INDICATOR_MIN_REPORTS):
+    """
+    Returns [(kind, value, report_ids)] for the extracted URLs, phone numbers, wallets and handles that at least
+    min_reports distinct earlier reports mention, most reported first. Bare domains are skipped (see
+    DECISIVE_INDICATOR_KINDS).
+    """
+    indicators = [(kind, value) for kind, value in indicators if kind in DECISIVE_INDICATOR_KINDS]
+    if not indicators or not indicator_index.ready:
+        return []
+    matches = [(kind, value, list(dict.fromkeys(merged_reports.resolve(report_id) for report_id in report_ids)))
+               for kind, value, report_ids in indicator_index.match_indicators(indicators)]
+    matches = [match for match in matches if len(match[2]) >= min_reports]
+    return sorted(matches, key=lambda match: len(match[2]), reverse=True)
+
+
+def describe_indicators(matches, limit=3):
+    lines = []
+    for kind, value, report_ids in matches[:limit]:
+        reports = "1 report" if len(report_ids) == 1 else f"{len(report_ids)} reports"
+        lines.append(f"- {value} ({kind}, in {reports})")
+    return "\n".join(lines)
+
+
+def store_indicators(report_id, indicators):
+    """Saves a report's (kind, value) indicators and adds them to the local index."""
+    if not indicators:
+        return
+    rows = [{"report_id": report_id, "kind": kind, "value": value} for kind, value in indicators]
+    try:
+        supabase.table('scamreport_indicators').upsert(rows, on_conflict='kind,value,report_id', ignore_duplicates=True).execute()
+    except Exception as e:
+        print(f"[store_indicators] Could not save indicators for report {report_id}: {e}")
+        return
+    for kind, value in indicators:
+        indicator_index.add(report_id, kind, value)
+
+
+def run_report_analysis(gemini_client, description, existing_summary=None, image_parts=()):
+    """Returns the ReportAnalysis for a report, or None if the model call or parsing fails."""
+    try:
+        with admission.admit(REPORT_MODEL, PRIORITY_REPORT):
+            return analyze_report(gemini_client, description, existing_summary, image_parts)
+    except Exception as e:
+        print(f"[run_report_analysis] Could not analyse report with Gemini: {e}")
+        return None
+
+
+def accept_analysis(bot, message, description, analysis, verified, evidence_images, merging=False):
+    """
+    Applies the verification policy (see combined_report_analysis) to a report's analysis. `verified` is True
+    when the report needs no model verdict; otherwise the model's verdict is cached for the description.
+    Returns True if the report may be saved or merged; otherwise the user has been told, the evidence
+    released and the report rejected or held back.
+    """
+    if analysis is not None:
+        if combined_report_analysis and not verified:
+            report_verdict_cache.put(description, analysis.verdict)
+            if not analysis.verdict:
+                reject_report(bot, message, evidence_images)
+                return False
+        return True
+    if combined_report_analysis and not verified:
+        defer_report(bot, message, evidence_images)
+        return False
+    if merging:
+        bot.send_message(message.chat.id, "Could not re-summarize with AI for merging. Using existing/combined data for title, summary, type.")
+    else:
+        bot.send_message(message.chat.id, "Could not generate AI summary for new report. Using defaults.")
+    return True
+
+
+def defer_report(bot, message, evidence_images=()):
+    """Holds back a report no verdict could be had for. The draft is kept so the user can submit it again."""
+    metrics.count("report_deferred")
+    bot.send_message(message.chat.id, "We could not verify your report right now, so it has not been submitted. "
+                                      "Your draft is saved: please send /report again in a few minutes to resubmit it.")
+    release_evidence_images(evidence_images)
+
+
+def reject_report(bot, message, evidence_images=()):
+    metrics.count("report_rejected")
+    bot.send_message(message.chat.id, "Your report could not be verified as a legitimate scam or appears to be a false report. Submission has been cancelled.")
+    user_reports.delete(message.from_user.id)
+    release_evidence_images(evidence_images)
+
+
+def release_evidence_images(evidence_images):
+    for evidence_image in evidence_images:
+        timings = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in evidence_image.timings.items())
+        print(f"[process_full_report] Evidence timings for {evidence_image.file_id}: {timings}")
+        evidence_image.close()
+
+
+def store_evidence_images(bot, message, evidence_images):
+    """
+    Uploads downloaded photo evidence to the images bucket concurrently.
+    Returns the public URLs of the photos that uploaded; failed photos are skipped.
+    """
+    if not evidence_images:
+        return []
+    uploaded_file_names = upload_evidence_batch(evidence_images, supabase)
+    image_public_urls = [supabase.storage.from_('images').get_public_url(name) for name in uploaded_file_names if name]
+    failed = len(evidence_images) - len(image_public_urls)
+    if failed:
+        bot.send_message(message.chat.id, f"{failed} of {len(evidence_images)} photos could not be uploaded. Proceeding without them.")
+    print(f"[process_full_report] Uploaded {len(image_public_urls)} of {len(evidence_images)} photos")
+    return image_public_urls
+
+
+@metrics.timed_handler("process_full_report")
 def process_full_report(bot, message, gemini_client):
     user_id = message.from_user.id
-    if user_id not in user_reports:
+    report_data = user_reports.get(user_id)
+    if report_data is None:
         bot.send_message(message.chat.id, "No report data found to submit. Please start a new report with /report.")
         return
 
-    report_data = user_reports[user_id]
     description = report_data.get("description", "")
     evidence_list = report_data.get("evidence", [])
 
@@ -350,44 +802,64 @@ def process_full_report(bot, message, gemini_client):
         show_report_preview(bot, message, gemini_client, confirm=True)
         return
 
-    is_verified = verify_report_py(description, gemini_client)
-
-    if not is_verified:
-        bot.send_message(message.chat.id, "Your report could not be verified as a legitimate scam or appears to be a false report. Submission has been cancelled.")
-        if user_id in user_reports:
-            del user_reports[user_id]
-        return
-    bot.send_message(message.chat.id, "Report has been verified to be a potential scam. Please wait while we process it...")
-
-    image_public_url = None
+    # Links and contacts that earlier reports already mention need no model to confirm the report
+    report_indicators = extract_indicators("\n".join(
+        [description] + [item for item in evidence_list if not item.startswith("[PHOTO]")]))
+    # A URL, phone number, wallet or handle shared with one report can confirm a screenshot match with that report;
+    # verifying the report takes one that INDICATOR_MIN_REPORTS reports mention
+    indicator_matches = find_known_indicators(report_indicators, min_reports=1)
+    known_indicators = [match for match in indicator_matches if len(match[2]) >= INDICATOR_MIN_REPORTS]
+    if known_indicators:
+        metrics.count("report_known_indicator")
+        bot.send_message(message.chat.id, "Your report mentions links or contacts that other users have already reported:\n"
+                         + describe_indicators(known_indicators))
+
+    verified = bool(known_indicators)
+    if combined_report_analysis:
+        # A cached or classifier verdict settles the report; the analysis is still needed for the summary
+        local = None if verified else local_report_verdict(description)
+        if local is False:
+            reject_report(bot, message)
+            return
+        verified = verified or local is True
+        # The verdict comes back with the summary further down
+        bot.send_message(message.chat.id, "Please wait while we verify and process your report...")
+    else:
+        verdict = True if verified else verify_report_py(description, gemini_client)
+        if verdict is None:
+            defer_report(bot, message)
+            return
+        if not verdict:
+            reject_report(bot, message)
+            return
+        verified = True
+        bot.send_message(message.chat.id, "Report has been verified to be a potential scam. Please wait while we process it...")
+
+    image_public_urls = None
     text_evidence_items = []
-    processed_photo_evidence = False
+    photo_file_ids = []
 
     for evidence_item in evidence_list:
-        if evidence_item.startswith("[PHOTO]") and not processed_photo_evidence:
-            file_id = evidence_item.replace("[PHOTO] ", "")
-            if db_enabled and supabase:
-                try:
-                    uploaded_file_name = upload_image_to_supabase_py(bot, file_id, supabase)
-                    if uploaded_file_name:
-                        image_public_url = supabase.storage.from_('images').get_public_url(uploaded_file_name) 
-                        print(f"[process_full_report] Image uploaded successfully: {image_public_url}")
-                        text_evidence_items.append(f"[Photo evidence link: {image_public_url}]")
-                        processed_photo_evidence = True
-                    else:
-                        text_evidence_items.append("[Photo evidence provided but upload failed.]")
-                        bot.send_message(message.chat.id, "Photo evidence upload failed. Proceeding without it.") # Added user feedback
-                except Exception as e:
-                    print(f"Error uploading image during full report processing: {e}")
-                    bot.send_message(message.chat.id, f"Could not upload photo evidence: {str(e)[:100]}. Proceeding without it.")
-                    text_evidence_items.append(f"[Photo evidence upload error: {str(e)[:100]}]")
-            else:
-                text_evidence_items.append("[Photo evidence provided but storage is disabled.]")
-        elif evidence_item.startswith("[PHOTO]") and processed_photo_evidence:
-            text_evidence_items.append("[Additional photo evidence noted, but only one primary image is stored per report.]")
+        if evidence_item.startswith("[PHOTO]") and len(photo_file_ids) < MAX_PHOTOS:
+            photo_file_ids.append(evidence_item.replace("[PHOTO] ", ""))
+        elif evidence_item.startswith("[PHOTO]"):
+            text_evidence_items.append(f"[Additional photo evidence noted, but only {MAX_PHOTOS} photos are stored per report.]")
         else:
             text_evidence_items.append(evidence_item)
-    
+
+    # Photos are downloaded concurrently, once; the same bytes go to Gemini and, after verification, to storage
+    evidence_images = []
+    for file_id, evidence_image, error in download_evidence_batch(bot, photo_file_ids):
+        if evidence_image is None:
+            text_evidence_items.append(f"[Photo evidence download error: {str(error)[:100]}]")
+        else:
+            evidence_images.append(evidence_image)
+    if len(evidence_images) < len(photo_file_ids):
+        bot.send_message(message.chat.id, f"Could not download {len(photo_file_ids) - len(evidence_images)} of {len(photo_file_ids)} photos. Proceeding without them.")
+
+    image_parts = [image.model_part() for image in evidence_images if image.mime_type.startswith("image/")]
+    image_hashes = [image_hash for image_hash in (image.perceptual_hash() for image in evidence_images) if image_hash is not None]
+
     # Defaults, might be overwritten by Gemini or existing report data
     report_title = description[:75] + "..." if len(description) > 75 else description 
     report_summary = description
@@ -399,13 +871,19 @@ def process_full_report(bot, message, gemini_client):
 
 
     if not db_enabled or not supabase:
+        if combined_report_analysis:
+            analysis = run_report_analysis(gemini_client, description, image_parts=image_parts)
+            if not accept_analysis(bot, message, description, analysis, verified, evidence_images):
+                return
+            if analysis is not None:
+                report_title, report_type, report_summary = analysis.title, analysis.type, analysis.content
         bot.send_message(message.chat.id, 
                          "Report processing complete (database is disabled).\n"
                          f"Thank you for your submission!\n\n"
                          f"ID: {report_uuid} (not saved)\nTitle: {report_title}\nSummary: {report_summary}\n"
-                         f"Image: {'Yes' if image_public_url else 'No'}\nType: {report_type}")
-        if user_id in user_reports:
-            del user_reports[user_id]
+                         f"Images: {len(evidence_images)} (not stored)\nType: {report_type}")
+        user_reports.delete(user_id)
+        release_evidence_images(evidence_images)
         send_welcome(bot, message)
         return
 
@@ -415,22 +893,18 @@ def process_full_report(bot, message, gemini_client):
 
     
     similar_report_found = False
-    if final_embeddings:
+    if final_embeddings or image_hashes:
         try:
-            match_params = {
-                'query_embedding': final_embeddings,
-                'match_threshold': 0.85,
-                'match_count': 1 
-            }
-            similar_reports_response = supabase.rpc('match_scam', match_params).execute()
-
-            if hasattr(similar_reports_response, 'data') and similar_reports_response.data:
-                # Successful response with data
-                existing_report = similar_reports_response.data[0]
+            existing_report = find_similar_report(final_embeddings) if final_embeddings else None
+            if not existing_report:
+                # Campaigns reuse the same screenshots with differently worded descriptions
+                existing_report = find_report_by_screenshot(image_hashes, final_embeddings, indicator_matches)
+
+            if existing_report:
                 existing_id = existing_report.get('id')
                 bot.send_message(message.chat.id, f"Similar report found (ID: {existing_id[:8]}...). Merging information.")
                 
-                current_count = supabase.table('scamreports').select('*').eq('id', existing_id).single().execute().data.get('count', 1)
+                current_count = existing_report.get('count') or 1
                 print(f"Current count for existing report: {current_count}")
                 current_title = existing_report.get('title', '')
                 current_summary = existing_report.get('summary', '')
@@ -441,150 +915,60 @@ def process_full_report(bot, message, gemini_client):
                 merged_report_title = current_title
                 merged_report_summary = combined_description
                 merged_report_type = existing_type
-                existing_embeddings = existing_report.get('embeddings', [])
-                if existing_embeddings and final_embeddings:
-                    merged_report_embeddings = [
-                        (existing_embeddings[i] + final_embeddings[i]) / 2
-                        for i in range(min(len(existing_embeddings), len(final_embeddings)))
-                    ]
-                else:
-                    merged_report_embeddings = existing_embeddings or final_embeddings or []
-
-                try:
-                    combined_prompt = (
-                        f"Summarise the combined scam information into a short title, scam type, and content (description of the scam, and how to avoid falling for such scams).\n"
-                        f"DO NOT include Markdown formatted content in the response. Respond ONLY with a single, valid JSON object.\n"
-                        f"The JSON object must have three keys: 'title' (string), 'type' (string), and 'content' (string).\n"
-                        f"Split the content into two segments (description and how to avoid) and separate them using the exact literal string '[SECTION_BREAK]'. This string is a placeholder and will be replaced later.\n"
-                        f"Keep the content to under 120 words.\\n"
-                        f"Combined Information:\\n{combined_description}"
-                    )
-                    gemini_response = gemini_client.models.generate_content(
-                        model="gemini-2.0-flash", 
-                        contents=combined_prompt,
-                    )
-
-                    cleaned_text = gemini_response.text.strip()
-                    if cleaned_text.startswith("```json"):
-                        cleaned_text = cleaned_text[7:-3] if cleaned_text.endswith("```") else cleaned_text[7:]
-                    elif cleaned_text.startswith("```"):
-                        cleaned_text = cleaned_text[3:-3] if cleaned_text.endswith("```") else cleaned_text[3:]
-
-                    combined_gemini_output = json.loads(cleaned_text)
-                    
-                    if 'content' in combined_gemini_output and isinstance(combined_gemini_output['content'], str):
-                        combined_gemini_output['content'] = combined_gemini_output['content'].replace('[SECTION_BREAK]', '\n\n')
-
-                    merged_report_title = combined_gemini_output.get("title", merged_report_title)
-                    merged_report_summary = combined_gemini_output.get("content", current_summary) 
-                    merged_report_type = combined_gemini_output.get("type", existing_type) 
-
-                except json.JSONDecodeError as e_json_re:
-                    bot.send_message(message.chat.id, "Could not parse AI re-summary for merging. Using existing/combined data for title, summary, type.")
-                except Exception as e_gemini_re:
-                    print(f"Error re-summarizing with Gemini: {e_gemini_re}")
-                    bot.send_message(message.chat.id, "Could not re-summarize with AI for merging. Using existing/combined data for title, summary, type.")
-
-                update_payload = {
-                    "count": current_count + 1,
-                    "title": merged_report_title,
-                    "summary": merged_report_summary,
-                    "type": merged_report_type,
-                    "timestamp": current_timestamp_for_db,
-                    "embeddings": merged_report_embeddings,
-                    "user_ids": supabase.rpc('array_append_unique', {'arr': existing_report.get('user_ids', []), 'val': user_id}).execute().data
-                }
-                print(f"Count after merging: {update_payload['count']}")
-                if image_public_url:
-                    update_payload["image"] = image_public_url
-
-                update_op = supabase.table('scamreports').update(update_payload).eq('id', existing_id).execute()
-                update_error_occurred = False
-                error_detail = "Unknown error during update."
-
-                # Check for errors in the response
-                if hasattr(update_op, 'data') and update_op.data is None:
-                    update_error_occurred = True
-                    error_detail = "Update operation returned null data"
-                elif not hasattr(update_op, 'data'):
-                    update_error_occurred = True
-                    error_detail = "Update operation did not return expected data structure."
-                
-                if not update_error_occurred:
+                analysis = run_report_analysis(gemini_client, description, existing_summary=current_summary,
+                                               image_parts=image_parts)
+                if not accept_analysis(bot, message, description, analysis, verified, evidence_images, merging=True):
+                    return
+                # Accepted: if the merge fails, the new-report fallback must not reject or defer it again
+                verified = True
+                if analysis is not None:
+                    merged_report_title = analysis.title
+                    merged_report_summary = analysis.content
+                    merged_report_type = analysis.type
+
+                image_public_urls = store_evidence_images(bot, message, evidence_images)
+
+                # One transaction on the server: increments count, appends the user id and folds the embedding into
+                # the count-weighted mean, so concurrent merges into the same report cannot lose increments
+                merged_report = merge_scam_report(existing_id, user_id, final_embeddings, merged_report_title,
+                                                  merged_report_summary, merged_report_type, image_public_urls,
+                                                  current_timestamp_for_db)
+
+                if merged_report:
+                    merged_count = merged_report.get('count') or current_count + 1
+                    print(f"Count after merging: {merged_count}")
+                    scam_index.upsert(existing_id, merged_report.get('embeddings'))
+                    store_image_hashes(existing_id, image_hashes)
+                    store_indicators(existing_id, report_indicators)
+                    if (broadcast_trigger and merged_count >= BROADCAST_MIN_COUNT
+                            and not merged_report.get('was_broadcasted')):
+                        broadcast_trigger.request(f"report {existing_id} reached {merged_count} reports")
+                    metrics.count("report_merged")
                     bot.send_message(message.chat.id, "Merge successful. Thank you for your report and please continue staying vigilant!")
                     similar_report_found = True
                 else: 
-                    error_msg = "Failed to update existing report."
-                    error_msg += f" Details: {error_detail}"
-                    print(f"Supabase update error (merging): {error_detail}. Response: {update_op}")
-                    bot.send_message(message.chat.id, error_msg + " The system will attempt to save this as a new report.")
+                    bot.send_message(message.chat.id, "Failed to update existing report. The system will attempt to save this as a new report.")
             else:
                 print("[process_full_report] No similar reports found, proceeding to save as a new report.")
                 similar_report_found = False
 
     
         except Exception as e_rpc: # Catch other exceptions during RPC call or initial response handling
-            print(f"Error calling Supabase RPC 'match_scam' or processing its response: {e_rpc}")
+            print(f"Error looking up similar reports or processing the match: {e_rpc}")
             bot.send_message(message.chat.id, "Could not check for similar reports due to an unexpected error. Will proceed to save as a new report.")
 
     # Logic for new report or if merging failed and we fallback to new
     if not similar_report_found:
-        try:
-            gemini_request_contents = []
-            main_prompt_text = (
-                f"Summarise the scam information into a short title, scam type, and content (description of the scam, and how to avoid falling for such scams).\n"
-                f"DO NOT include Markdown formatted content in the response. Respond ONLY with a single, valid JSON object.\n"
-                f"The JSON object must have three keys: 'title' (string), 'type' (string), and 'content' (string).\n"
-                f"Split the content into two segments (description and how to avoid) and separate them using the exact literal string '[SECTION_BREAK]'. This string is a placeholder and will be replaced later.\n Keep it to under 120 words."
-                f"Incident description:\\n{description}"
-            )
-            gemini_request_contents.append(main_prompt_text)
+        analysis = run_report_analysis(gemini_client, description, image_parts=image_parts)
+        if not accept_analysis(bot, message, description, analysis, verified, evidence_images):
+            return
+        if analysis is not None:
+            report_title = analysis.title
+            report_type = analysis.type
+            report_summary = analysis.content
 
-            if image_public_url:
-                try:
-                    print(f"Fetching image from {image_public_url} for Gemini prompt...")
-                    image_response = requests.get(image_public_url, timeout=15)
-                    image_response.raise_for_status()
-                    image_bytes = image_response.content
-                    content_type_header = image_response.headers.get('Content-Type')
-                    guessed_mime_type = mimetypes.guess_type(image_public_url)[0]
-                    final_mime_type = content_type_header or guessed_mime_type
-                    if not final_mime_type:
-                        if image_bytes.startswith(b'\xff\xd8\xff'): final_mime_type = 'image/jpeg'
-                        elif image_bytes.startswith(b'\x89PNG\r\n\x1a\n'): final_mime_type = 'image/png'
-                        else: final_mime_type = 'application/octet-stream'
-                    if final_mime_type.startswith("image/"):
-                        image_blob = types.Blob(mime_type=final_mime_type, data=image_bytes)
-                        image_part = types.Part(inline_data=image_blob)
-                        gemini_request_contents.append(image_part)
-                    else: print(f"Skipping image for Gemini: mime_type '{final_mime_type}' not image for {image_public_url}")
-                except Exception as e_img_fetch: 
-                    print(f"Error fetching/processing image for new report Gemini: {e_img_fetch}")
-
-            response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash", contents=gemini_request_contents,
-            )   
-
-            cleaned_response_text = response.text.strip()
-            if cleaned_response_text.startswith("```json"):
-                cleaned_response_text = cleaned_response_text[7:-3] if cleaned_response_text.endswith("```") else cleaned_response_text[7:]
-            elif cleaned_response_text.startswith("```"):
-                 cleaned_response_text = cleaned_response_text[3:-3] if cleaned_response_text.endswith("```") else cleaned_response_text[3:]
-            
-            gemini_output = json.loads(cleaned_response_text)
-            
-            if 'content' in gemini_output and isinstance(gemini_output['content'], str):
-                gemini_output['content'] = gemini_output['content'].replace('[SECTION_BREAK]', '\n\n')
-
-            report_title = gemini_output.get("title", report_title)
-            report_type = gemini_output.get("type", report_type)
-            report_summary = gemini_output.get("content", report_summary)
-
-        except json.JSONDecodeError as e_json:
-            bot.send_message(message.chat.id, "Could not parse AI summary for new report. Using defaults.")
-        except Exception as e_gemini:
-            print(f"Error generating summary with Gemini for new report: {e_gemini}")
-            bot.send_message(message.chat.id, "Could not generate AI summary for new report. Using defaults.")
+        if image_public_urls is None:
+            image_public_urls = store_evidence_images(bot, message, evidence_images)
 
         # Database insertion for new report
         db_payload = {
@@ -592,30 +976,39 @@ def process_full_report(bot, message, gemini_client):
             "timestamp": current_timestamp_for_db,
             "title": report_title,
             "summary": report_summary,
-            "image": image_public_url,
+            "image": image_public_urls[0] if image_public_urls else None,
+            "images": image_public_urls,
             "count": 1,
             "type": report_type,
-            "embeddings": final_embeddings if final_embeddings else None, # Store embeddings
-            "user_ids": [user_id] # Store as an array with the initial user_id
+            "embeddings": to_halfvec(final_embeddings) if final_embeddings else None, # Normalised half precision
+            "embedding_model": EMBEDDING_MODEL if final_embeddings else None, # Rows without one are picked up by embedding_backfill.py
+            "user_ids": [str(user_id)] # Store as an array with the initial user_id (as text, like merge_scam_report)
         }
         
         insert_op = supabase.table('scamreports').insert(db_payload).execute()
 
         if hasattr(insert_op, 'data') and insert_op.data:
+            if final_embeddings:
+                scam_index.upsert(report_uuid, final_embeddings)
+            store_image_hashes(report_uuid, image_hashes)
+            store_indicators(report_uuid, report_indicators)
+            metrics.count("report_created")
             bot.send_message(message.chat.id, "Thank you for your report and please continue staying vigilant!")
         else:
+            metrics.count("report_save_failed")
             error_msg = "Failed to save new report."
             print(f"Supabase insert error for new report: {getattr(insert_op, 'error', 'Unknown error')}")
             bot.send_message(message.chat.id, error_msg + " Please try again later.")
 
     # Common cleanup and final message
-    if user_id in user_reports:
-        del user_reports[user_id]
+    user_reports.delete(user_id)
+    release_evidence_images(evidence_images)
 
 def initiate_verify_message(bot, message, gemini_client):
     bot.send_message(message.chat.id, "Please send the message you want to verify for potential scam content.")
     bot.register_next_step_handler(message, process_verification_request, bot, gemini_client)
 
+@metrics.timed_handler("verify")
 def process_verification_request(message, bot, gemini_client):
     if message.content_type != 'text':
         bot.send_message(message.chat.id, "Sorry, I can only verify text messages. Please try the /verify command again and send the message text.")
@@ -648,20 +1041,126 @@ def process_verification_request(message, bot, gemini_client):
         f"{user_message_text}\\n"
     )
 
+    cached_result = verification_cache.get(user_message_text)
+    if cached_result is not None:
+        bot.send_message(message.chat.id, cached_result)
+        return
+    known_indicators = find_known_indicators(extract_indicators(user_message_text))
+    if known_indicators:
+        metrics.count("verify_known_indicator")
+        bot.send_message(message.chat.id, "This message is LIKELY A SCAM.\n\n"
+                         "It contains links or contacts that other users have reported as scams:\n"
+                         + describe_indicators(known_indicators)
+                         + "\n\nDo not click the links, reply, or send money or personal details.")
+        return
+    local_label = classifier.classify(user_message_text, "verify", ("scam", "smalltalk"))
+    if local_label:
+        bot.send_message(message.chat.id, LOCAL_SCAM_VERDICT if local_label == "scam" else LOCAL_SMALLTALK_VERDICT)
+        return
+
     try:
-        response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash-lite",
-            contents=prompt,
-        )
+        admission.check_user(message.from_user.id, PRIORITY_VERIFY)
+        if STREAM_REPLIES:
+            reply = StreamingReply(bot, message.chat.id, "verify", "gemini-2.0-flash-lite", edit_interval(message.chat))
+            with admission.admit("gemini-2.0-flash-lite", PRIORITY_VERIFY):
+                reply.consume(gemini_client.models.generate_content_stream(
+                    model="gemini-2.0-flash-lite",
+                    contents=prompt,
+                ))
+            verification_result = reply.finish().strip()
+            verification_cache.put(user_message_text, verification_result)
+            classifier.log_verdict(user_message_text, verification_result)
+            return
+
+        with admission.admit("gemini-2.0-flash-lite", PRIORITY_VERIFY):
+            response = gemini_client.models.generate_content(
+                model="gemini-2.0-flash-lite",
+                contents=prompt,
+            )
         
         verification_result = response.text.strip()
+        verification_cache.put(user_message_text, verification_result)
+        classifier.log_verdict(user_message_text, verification_result)
         bot.send_message(message.chat.id, verification_result)
 
+    except AdmissionRejected as e:
+        send_busy_reply(bot, message, e)
+    except StreamInterrupted as e:
+        # The partial analysis stays on screen, marked as cut off, and is not cached
+        print(f"[process_verification_request] Verification cut off: {e}")
     except Exception as e:
         print(f"Error during scam verification with Gemini: {e}")
         bot.send_message(message.chat.id, "Sorry, I encountered an error while trying to verify the message. Please try again later.")
     return
 
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "5"))
+HISTORY_CALLBACK_PREFIX = "history:"
+
+
+def fetch_report_history_page(supabase_client, user_id, cursor=None, newer=False, page_size=HISTORY_PAGE_SIZE):
+    """
+    Returns (rows, has_newer, has_older) for one page of a user's reports, newest first.
+    Pages are keyset-paginated on (reported_at, report_id) through scamreport_users, so every page
+    is an index range scan. `cursor` is the (reported_at, report_id) of the row the page starts after;
+    with newer=True the page holds the rows just before it instead.
+    """
+    query = (supabase_client.table('scamreport_users')
+        .select('report_id, reported_at, scamreports(title, type, timestamp)')
+        .eq('user_id', str(user_id)))
+    if cursor is not None:
+        reported_at, report_id = cursor
+        op = 'gt' if newer else 'lt'
+        query = query.or_(f"reported_at.{op}.{reported_at},and(reported_at.eq.{reported_at},report_id.{op}.{report_id})")
+    response = (query
+        .order('reported_at', desc=not newer)
+        .order('report_id', desc=not newer)
+        .limit(page_size + 1)
+        .execute())
+    rows = response.data or []
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if newer:
+        return list(reversed(rows)), has_more, True
+    return rows, cursor is not None, has_more
+
+
+def format_report_history(rows):
+    history_message = "Here are your submitted reports:\n\n"
+    for row in rows:
+        report = row.get('scamreports') or {}
+        report_title = report.get('title', 'N/A')
+        report_type = report.get('type', 'N/A')
+        # Convert timestamp from milliseconds to a readable date
+        report_timestamp_ms = row.get('reported_at')
+        if report_timestamp_ms:
+            report_date = datetime.fromtimestamp(report_timestamp_ms / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+        else:
+            report_date = 'N/A'
+
+        history_message += f"• *{report_title}* ({report_type})\n"
+        history_message += f"   _Submitted on: {report_date}_\n"
+    return history_message
+
+
+def history_markup(rows, has_newer, has_older):
+    """Inline Newer/Older buttons carrying the keyset cursor of the first/last row on the page."""
+    buttons = []
+    if has_newer:
+        first = rows[0]
+        buttons.append(telebot.types.InlineKeyboardButton(
+            "« Newer", callback_data=f"{HISTORY_CALLBACK_PREFIX}new:{first['reported_at']}:{first['report_id']}"))
+    if has_older:
+        last = rows[-1]
+        buttons.append(telebot.types.InlineKeyboardButton(
+            "Older »", callback_data=f"{HISTORY_CALLBACK_PREFIX}old:{last['reported_at']}:{last['report_id']}"))
+    if not buttons:
+        return None
+    markup = telebot.types.InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
+
+@metrics.timed_handler("history")
 def view_report_history(bot, message, supabase_client):
     user_id = message.from_user.id
 
@@ -670,31 +1169,10 @@ def view_report_history(bot, message, supabase_client):
         return
 
     try:
-        response = (
-            supabase_client.table('scamreports')
-            .select('title, summary, timestamp, type, image') # Select desired fields
-            .contains('user_ids', [str(user_id)])
-            .order('timestamp', desc=True) # Order by timestamp descending
-            .limit(3) # Limit to the last 3 reports
-            .execute()
-        )
-
-        if hasattr(response, 'data') and response.data:
-            history_message = "Here are your last 3 submitted reports:\n\n"
-            for i, report in enumerate(response.data):
-                report_title = report.get('title', 'N/A')
-                report_type = report.get('type', 'N/A')
-                # Convert timestamp from milliseconds to a readable date
-                report_timestamp_ms = report.get('timestamp')
-                if report_timestamp_ms:
-                    report_date = datetime.fromtimestamp(report_timestamp_ms / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
-                else:
-                    report_date = 'N/A'
-                
-                history_message += f"{i+1}. *{report_title}* ({report_type})\n"
-                history_message += f"   _Submitted on: {report_date}_\n"
-            
-            bot.send_message(message.chat.id, history_message, parse_mode='Markdown')
+        rows, has_newer, has_older = fetch_report_history_page(supabase_client, user_id)
+        if rows:
+            bot.send_message(message.chat.id, format_report_history(rows), parse_mode='Markdown',
+                             reply_markup=history_markup(rows, has_newer, has_older))
         else:
             bot.send_message(message.chat.id, "You haven't submitted any reports yet.")
 
@@ -702,48 +1180,42 @@ def view_report_history(bot, message, supabase_client):
         print(f"Error fetching report history: {e}")
         bot.send_message(message.chat.id, "Sorry, I encountered an error while trying to fetch your report history. Please try again later.")
 
+
+@metrics.timed_handler("history_page")
+def handle_history_page(bot, call, supabase_client):
+    """Handles the Newer/Older buttons under a /history message by editing it in place."""
+    if not db_enabled or not supabase_client:
+        bot.answer_callback_query(call.id, "Report history is currently unavailable.")
+        return
+    try:
+        direction, reported_at, report_id = call.data[len(HISTORY_CALLBACK_PREFIX):].split(":", 2)
+        rows, has_newer, has_older = fetch_report_history_page(
+            supabase_client, call.from_user.id, cursor=(int(reported_at), report_id), newer=direction == "new")
+        if not rows:
+            bot.answer_callback_query(call.id, "No more reports.")
+            return
+        bot.edit_message_text(format_report_history(rows), call.message.chat.id, call.message.message_id,
+                              parse_mode='Markdown', reply_markup=history_markup(rows, has_newer, has_older))
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        print(f"Error paging report history: {e}")
+        bot.answer_callback_query(call.id, "Could not load more reports. Please try /history again.")
+
 def upload_image_to_supabase_py(bot: telebot.TeleBot, file_id: str, supabase_client):
     try:
-        file_info = bot.get_file(file_id)
-        if file_info.file_path is None:
-            raise ValueError("File path is None from Telegram API")
-            
-        downloaded_file_bytes = bot.download_file(file_info.file_path)
-
-        file_ext = os.path.splitext(file_info.file_path)[1].lower() if file_info.file_path else ".jpg"
-        if not file_ext:
-            file_ext = ".jpg"
-        
-        content_type = mimetypes.guess_type(f"file{file_ext}")[0] or 'application/octet-stream'
-        
-        file_name = f"{uuid.uuid4()}{file_ext}"
-
-        upload_response = supabase_client.storage.from_('images').upload(
-            path=file_name,
-            file=downloaded_file_bytes,
-            file_options={"content-type": content_type}
-        )
-        if hasattr(upload_response, 'status_code') and upload_response.status_code != 200:
-            error_message = f"Failed to upload image to Supabase. Status: {upload_response.status_code}"
-            try:
-                error_content = upload_response.content.decode()
-                error_details = json.loads(error_content)
-                error_message += f" Details: {error_details.get('message', error_content)}"
-            except (json.JSONDecodeError, AttributeError): 
-                error_message += " Could not parse error details from response."
-            print(error_message)
-            return None
-
-        return file_name
-        
+        evidence_image = download_evidence(bot, file_id)
     except Exception as e: 
-        print(f"Error uploading image to Supabase: {e}")
+        print(f"Error downloading image from Telegram: {e}")
         return None
+    try:
+        return upload_evidence(evidence_image, supabase_client)
+    finally:
+        evidence_image.close()
 
 # Initialize Supabase client if not already done globally and db_enabled
 if db_enabled and supabase_url and supabase_key and not supabase:
     try:
-        supabase = create_client(supabase_url, supabase_key)
+        supabase = metrics.InstrumentedSupabase(create_client(supabase_url, supabase_key))
         print("[Supabase Client] Initialized in functions.py")
     except Exception as e:
         print(f"[Supabase Client] Error initializing in functions.py: {e}")
@@ -752,10 +1224,96 @@ elif not supabase and db_enabled:
     print("[Supabase Client] supabase_url or supabase_key might be missing. Supabase client not initialized.")
 
 
+def format_broadcast_message(report):
+    title = report.get('title', 'N/A')
+    summary = report.get('summary') or 'N/A'
+    scam_type = report.get('type') or 'Unknown'
+    current_report_count = report.get('count', 0)
+    summary = summary.replace("\\ \\ ", '\n').replace(" \\ \\", '\n').replace("\\ \\", '\n').replace("\u000d\u000d", '\n').replace("\u000d", '\n').replace("\u000a\u000a", '\n').replace("\u000a", '\n').strip()
+
+    return (
+        f"📢 *Scam Alert!* 📢\n\n"
+        f"*Title:* {title}\n"
+        f"*Type:* {scam_type}\n"
+        f"*Reported Instances:* {current_report_count}\n\n"
+        f"*Details & How to Avoid:*\n{summary}\n\n"
+        f"#TsFraudPmo #ScamAlert #{scam_type.replace(' ', '').replace('-', '').replace('/', ' #')}" 
+    )
+
+
+def send_broadcast(bot: telebot.TeleBot, channel_id, report, max_attempts=3):
+    """Sends one scam alert to the channel, waiting out Telegram's 429 responses. Returns True if it was sent."""
+    report_id = report.get('id')
+    message_text = format_broadcast_message(report)
+    image_public_url = report.get('image')
+
+    for attempt in range(max_attempts):
+        broadcast_limiter.acquire()
+        try:
+            if image_public_url:
+                print(f"[broadcast_popular_scams] Sending photo broadcast for report ID {report_id} with image URL: {image_public_url}")
+                bot.send_photo(channel_id, photo=image_public_url, caption=message_text, parse_mode="Markdown")
+            else:
+                print(f"[broadcast_popular_scams] Sending text-only broadcast for report ID {report_id}")
+                bot.send_message(channel_id, message_text, parse_mode="Markdown")
+            return True
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429 and attempt < max_attempts - 1:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 5)
+                print(f"[broadcast_popular_scams] Rate limited by Telegram, retrying report {report_id} in {retry_after}s")
+                time.sleep(retry_after)
+                continue
+            print(f"[broadcast_popular_scams] Error sending message for report {report_id} to channel {channel_id}: {e}")
+            return False
+        except Exception as e:
+            print(f"[broadcast_popular_scams] Error sending message for report {report_id} to channel {channel_id}: {e}")
+            return False
+    return False
+
+
+def claim_broadcast_batch(after_id, batch_size):
+    """
+    Fetches the next page of broadcast candidates after `after_id` (keyset on id) and leases them to this process.
+    Returns (claimed report rows, number of candidates in the page, last id in the page or None when done).
+    Candidates leased by another pass are skipped until their lease expires.
+    """
+    query = (supabase.table('scamreports')
+        .select('id')
+        .gte('count', BROADCAST_MIN_COUNT)
+        .eq('was_broadcasted', False))
+    if after_id is not None:
+        query = query.gt('id', after_id)
+    page = query.order('id').limit(batch_size).execute().data or []
+    if not page:
+        return [], 0, None
+
+    now = datetime.now(timezone.utc)
+    candidate_ids = [row['id'] for row in page]
+    claimed = (supabase.table('scamreports')
+        .update({
+            'broadcast_lease_owner': broadcast_owner,
+            'broadcast_lease_expires_at': (now + timedelta(seconds=broadcast_lease_seconds)).isoformat(),
+        })
+        .in_('id', candidate_ids)
+        .eq('was_broadcasted', False)
+        .or_(f"broadcast_lease_expires_at.is.null,broadcast_lease_expires_at.lt.{now.isoformat()}")
+        .execute()).data or []
+    return claimed, len(page), candidate_ids[-1]
+
+
+def start_broadcast_trigger(bot: telebot.TeleBot):
+    """Starts the background trigger that broadcasts reports as soon as they cross BROADCAST_MIN_COUNT."""
+    global broadcast_trigger
+    broadcast_trigger = BroadcastTrigger(lambda: broadcast_popular_scams(bot)).start()
+    return broadcast_trigger
+
+
+@metrics.timed_handler("broadcast_popular_scams")
 def broadcast_popular_scams(bot: telebot.TeleBot):
     """
     Fetches scam reports with a count of at least 3 that haven't been broadcasted,
     sends them to the designated Telegram channel, and marks them as broadcasted.
+    Candidates are paged and leased in batches; each batch is sent concurrently and confirmed with one bulk update.
     """
     if not db_enabled or not supabase:
         print("[broadcast_popular_scams] Database is not enabled or Supabase client not initialized.")
@@ -772,80 +1330,50 @@ def broadcast_popular_scams(bot: telebot.TeleBot):
         print(f"[broadcast_popular_scams] Invalid TELEGRAM_CHANNEL_ID: {channel_id_str}. Must be an integer.")
         return
 
-    min_count = 3
-    print(f"[broadcast_popular_scams] Checking for reports with count >= {min_count} and was_broadcasted = FALSE")
+    print(f"[broadcast_popular_scams] Checking for reports with count >= {BROADCAST_MIN_COUNT} and was_broadcasted = FALSE")
 
+    start = time.perf_counter()
+    sent_count = failed_count = skipped_count = 0
     try:
-        # Fetch reports
-        response = (supabase.table('scamreports')
-            .select('id, title, summary, image, count, type')
-            .gte('count', min_count)
-            .eq('was_broadcasted', False)
-            .execute())
-
-        # supabase-py v2+ returns APIResponse; errors typically raise exceptions or are in response.error if PostgrestError
-        # For simplicity, we'll check if response.data exists. If an error occurred, response.data might be None or an exception raised.
-        
-        if response.data:
-            reports_to_broadcast = response.data
-            print(f"[broadcast_popular_scams] Found {len(reports_to_broadcast)} reports to broadcast.")
-
-            for report in reports_to_broadcast:
-                report_id = report.get('id')
-                title = report.get('title', 'N/A')
-                summary = report.get('summary', 'N/A')
-                image_filename = report.get('image') # This is the filename in Supabase storage
-                scam_type = report.get('type', 'Unknown')
-                current_report_count = report.get('count', 0)
-                summary = summary.replace("\\ \\ ", '\n').replace(" \\ \\", '\n').replace("\\ \\", '\n').replace("\u000d\u000d", '\n').replace("\u000d", '\n').replace("\u000a\u000a", '\n').replace("\u000a", '\n').strip()
-
-                message_text = (
-                    f"📢 *Scam Alert!* 📢\n\n"
-                    f"*Title:* {title}\n"
-                    f"*Type:* {scam_type}\n"
-                    f"*Reported Instances:* {current_report_count}\n\n"
-                    f"*Details & How to Avoid:*\n{summary}\n\n"
-                    f"#TsFraudPmo #ScamAlert #{scam_type.replace(' ', '').replace('-', '').replace('/', ' #')}" 
-                )
-                
-                try:
-                    photo_sent = False
-                    if image_filename:
-                        image_public_url = image_filename
-
-                        print(image_public_url)
-                        
-                        if image_public_url:
-                            print(f"[broadcast_popular_scams] Sending photo broadcast for report ID {report_id} with image URL: {image_public_url}")
-                            bot.send_photo(channel_id, photo=image_public_url, caption=message_text, parse_mode="Markdown")
-                            photo_sent = True
-                        else:
-                            print(f"[broadcast_popular_scams] Could not get public URL for image {image_filename}. Sending text only for report ID {report_id}.")
-                    
-                    if not photo_sent: # If no image or image URL failed
-                        print(f"[broadcast_popular_scams] Sending text-only broadcast for report ID {report_id}")
-                        bot.send_message(channel_id, message_text, parse_mode="Markdown")
-                    
-                    # Mark as broadcasted
+        after_id = None
+        with ThreadPoolExecutor(max_workers=broadcast_concurrency) as pool:
+            while True:
+                claimed, page_size, after_id = claim_broadcast_batch(after_id, broadcast_batch_size)
+                if after_id is None:
+                    break
+                skipped_count += page_size - len(claimed)
+
+                results = list(pool.map(lambda report: send_broadcast(bot, channel_id, report), claimed))
+                sent_ids = [report['id'] for report, sent in zip(claimed, results) if sent]
+                failed_ids = [report['id'] for report, sent in zip(claimed, results) if not sent]
+
+                if sent_ids:
+                    # Confirm the whole batch in one write, right after sending, to keep the window for a re-send small
                     update_response = (supabase.table('scamreports')
-                        .update({'was_broadcasted': True})
-                        .eq('id', report_id)
+                        .update({'was_broadcasted': True, 'broadcast_lease_owner': None, 'broadcast_lease_expires_at': None})
+                        .in_('id', sent_ids)
+                        .execute())
+                    if not update_response.data:
+                        print(f"[broadcast_popular_scams] Failed to mark reports {sent_ids} as broadcasted. Response: {update_response}")
+                if failed_ids:
+                    # Release the lease so the next pass retries them
+                    (supabase.table('scamreports')
+                        .update({'broadcast_lease_owner': None, 'broadcast_lease_expires_at': None})
+                        .in_('id', failed_ids)
                         .execute())
-                        
-                    # Check if update was successful (supabase-py v2, data is usually a list of updated records)
-                    if not update_response.data: # Or if an error attribute exists and is set, depending on exact error
-                         print(f"[broadcast_popular_scams] Failed to mark report {report_id} as broadcasted. Response: {update_response}")
-                    else:
-                        print(f"[broadcast_popular_scams] Successfully marked report {report_id} as broadcasted.")
-
-                except Exception as e_broadcast:
-                    print(f"[broadcast_popular_scams] Error sending message for report {report_id} to channel {channel_id}: {e_broadcast}")
-        elif response.data is None and hasattr(response, 'error') and response.error: # Check for explicit error if data is None
-             print(f"[broadcast_popular_scams] Error fetching reports: {response.error}")
-        else: # No data and no explicit error object, or data is empty list
-            print("[broadcast_popular_scams] No new high-count reports to broadcast or error fetching.")
+                sent_count += len(sent_ids)
+                failed_count += len(failed_ids)
+                metrics.count("broadcast_sent", len(sent_ids))
+                metrics.count("broadcast_failed", len(failed_ids))
 
     except Exception as e:
         print(f"[broadcast_popular_scams] An unexpected error occurred: {e}")
         import traceback
         traceback.print_exc()
+
+    elapsed = time.perf_counter() - start
+    if sent_count or failed_count or skipped_count:
+        print(f"[broadcast_popular_scams] Pass finished in {elapsed:.2f}s: {sent_count} sent, {failed_count} failed, "
+              f"{skipped_count} skipped (leased elsewhere)")
+    else:
+        print(f"[broadcast_popular_scams] No new high-count reports to broadcast ({elapsed:.2f}s).")
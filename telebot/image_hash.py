@@ -0,0 +1,173 @@
+"""
+Perceptual hashes of evidence screenshots, so near-identical images from the same scam campaign
+match across reports even when the written descriptions differ.
+
+Hashes are 64-bit dHashes. ImageHashIndex finds stored hashes within a Hamming distance using
+multi-index hashing: the hash is split into CHUNKS 16-bit chunks, and by the pigeonhole principle
+two hashes within distance d agree to within d // CHUNKS bits on at least one chunk. A lookup
+therefore only probes a handful of buckets per chunk and checks the few candidates found there.
+"""
+import io
+import itertools
+import os
+import threading
+from array import array
+
+try:
+    from PIL import Image
+except ImportError:  # without Pillow, evidence is not hashed and screenshot matching is skipped
+    Image = None
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Screenshots of the same message usually differ by a few bits after re-compression or resizing. Different chats in
+# the same app layout can land this close too, so callers confirm a match against the text (find_report_by_screenshot).
+MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "6"))
+
+
+def dhash(data, hash_size=8):
+    """Returns the 64-bit difference hash of image bytes, or None if the image cannot be decoded."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    except Exception as e:
+        print(f"[dhash] Could not hash image: {e}")
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def to_signed(value):
+    """Maps an unsigned 64-bit hash to the Postgres bigint range."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _flip_masks(radius):
+    """All CHUNK_BITS-bit masks with at most `radius` bits set."""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in itertools.combinations(range(CHUNK_BITS), bits):
+            masks.append(sum(1 << position for position in positions))
+    return masks
+
+
+class ImageHashIndex:
+    """
+    In-process Hamming-distance index over scamreport_image_hashes.
+    Hashes live in one array('Q'); each chunk table maps a 16-bit chunk value to an array('I')
+    of positions in it.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.ready = False
+        self.last_id = 0  # newest scamreport_image_hashes.id seen, for incremental refresh
+        self._hashes = array('Q')
+        self._owners = array('I')  # position -> index into _report_ids
+        self._report_ids = []
+        self._report_ordinals = {}
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._masks = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _probe_masks(self, max_distance):
+        radius = max_distance // CHUNKS
+        if radius not in self._masks:
+            self._masks[radius] = _flip_masks(radius)
+        return self._masks[radius]
+
+    def add(self, report_id, image_hash):
+        """Indexes a hash for a report. Returns False if that report already has this exact hash."""
+        image_hash = to_unsigned(int(image_hash))
+        with self._lock:
+            ordinal = self._report_ordinals.get(report_id)
+            if ordinal is None:
+                ordinal = len(self._report_ids)
+                self._report_ids.append(report_id)
+                self._report_ordinals[report_id] = ordinal
+            else:
+                for position in self._tables[0].get(image_hash & CHUNK_MASK, ()):
+                    if self._hashes[position] == image_hash and self._owners[position] == ordinal:
+                        return False
+            position = len(self._hashes)
+            self._hashes.append(image_hash)
+            self._owners.append(ordinal)
+            for chunk, table in enumerate(self._tables):
+                key = (image_hash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+                bucket = table.get(key)
+                if bucket is None:
+                    table[key] = array('I', [position])
+                else:
+                    bucket.append(position)
+        return True
+
+    def add_many(self, rows):
+        """Bulk-loads (report_id, hash) pairs. Returns the number indexed."""
+        return sum(1 for report_id, image_hash in rows if self.add(report_id, image_hash))
+
+    def query(self, image_hash, max_distance=None):
+        """Returns (report_id, distance) pairs for reports with a hash within max_distance, closest first."""
+        image_hash = to_unsigned(int(image_hash))
+        max_distance = self.max_distance if max_distance is None else max_distance
+        masks = self._probe_masks(max_distance)
+        best = {}
+        seen = set()
+        with self._lock:
+            for chunk, table in enumerate(self._tables):
+                key = (image_hash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+                for mask in masks:
+                    for position in table.get(key ^ mask, ()):
+                        if position in seen:
+                            continue
+                        seen.add(position)
+                        distance = (self._hashes[position] ^ image_hash).bit_count()
+                        if distance <= max_distance:
+                            report_id = self._report_ids[self._owners[position]]
+                            if distance < best.get(report_id, HASH_BITS + 1):
+                                best[report_id] = distance
+        return sorted(best.items(), key=lambda item: item[1])
+
+    def _fetch(self, supabase_client, after_id, page_size):
+        """Yields scamreport_image_hashes rows with id > after_id, keyset-paginated on id."""
+        while True:
+            response = (supabase_client.table('scamreport_image_hashes')
+                .select('id, report_id, hash')
+                .gt('id', after_id)
+                .order('id')
+                .limit(page_size)
+                .execute())
+            rows = response.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1]['id']
+
+    def refresh(self, supabase_client, page_size=1000):
+        """Pulls hashes stored since the last refresh (including by other bot instances). Returns the number indexed."""
+        added = 0
+        for row in self._fetch(supabase_client, self.last_id, page_size):
+            if self.add(row['report_id'], row['hash']):
+                added += 1
+            self.last_id = max(self.last_id, row['id'])
+        return added
+
+    def load(self, supabase_client, page_size=1000):
+        """Loads every stored hash from the database and marks the index ready."""
+        added = self.refresh(supabase_client, page_size)
+        self.ready = True
+        return added
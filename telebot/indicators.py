@@ -0,0 +1,323 @@
+"""
+Scam indicators (links, domains, phone numbers, crypto wallets and Telegram-style @handles) pulled out
+of report text, so a message can be checked against every known one before any model call.
+
+Every indicator kind has a recognisable shape, so matching a message means extracting its candidate
+indicators and looking each one up; domains are also looked up by each parent domain, so a known
+scam domain matches its subdomains (the walk a reversed-label trie would do). Lookups hit a sorted
+array of 64-bit hashes of "kind:value", which keeps a million indicators in about 12 MB; new
+indicators wait in a small dict until it is merged into the arrays.
+
+Links on well-known legitimate sites (ALLOWED_DOMAINS, extendable with INDICATOR_ALLOWED_DOMAINS) are
+never indexed, because reports often name the organisation a scammer impersonated; t.me and wa.me
+links are read as the handle or phone number they point to. Short links are indexed as full URLs only.
+
+A number is only read as a phone number when it is written with a + country code, follows tel: or a cue
+such as "call", "WhatsApp" or "SMS", or comes from a wa.me link, so order and transaction ids are skipped.
+Official hotlines (ALLOWED_PHONES, extendable with INDICATOR_ALLOWED_PHONES) are never indexed.
+
+Usage: python indicators.py backfill   # extracts indicators from every stored report's title and summary
+"""
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+
+KINDS = ("url", "domain", "phone", "wallet", "handle")
+MERGE_THRESHOLD = 10_000
+
+ALLOWED_DOMAINS = {
+    "gov.sg", "dbs.com.sg", "dbs.com", "posb.com.sg", "ocbc.com", "uob.com.sg", "citibank.com.sg", "sc.com",
+    "singpost.com", "singtel.com", "starhub.com", "m1.com.sg", "scamshield.gov.sg", "police.gov.sg",
+    "google.com", "youtube.com", "facebook.com", "instagram.com", "whatsapp.com", "wa.me", "telegram.org",
+    "t.me", "tiktok.com", "x.com", "twitter.com", "linkedin.com", "paypal.com", "apple.com", "microsoft.com",
+    "shopee.sg", "lazada.sg", "carousell.sg", "carousell.com", "grab.com", "amazon.com", "amazon.sg",
+} | {domain.strip().lower() for domain in os.getenv("INDICATOR_ALLOWED_DOMAINS", "").split(",") if domain.strip()}
+# Published customer service numbers of the banks scammers most often impersonate
+ALLOWED_PHONES = {
+    "+6563272265",  # DBS / POSB
+    "+6563633333",  # OCBC
+    "+6562222121",  # UOB
+    "+6562255225",  # Citibank
+    "+6567477000",  # Standard Chartered
+}
+SHORTENERS = {"bit.ly", "tinyurl.com", "t.co", "goo.gl", "is.gd", "rb.gy", "cutt.ly", "t.ly", "shorturl.at", "ow.ly"}
+# Bare domains (without http:// or www.) are only recognised on these TLDs, so "e.g." or "file.txt" aren't links
+BARE_TLDS = ("com|net|org|info|biz|xyz|top|site|online|shop|store|club|live|icu|vip|cc|io|co|me|ly|sg|my|id|ph|"
+             "th|vn|cn|hk|tw|uk|us|ru|app|link|click|tk|ml|ga|cf|gq|pw|ws|asia|buzz|fun|today|world|life|win|"
+             "bid|loan|work|xin|cyou|sbs|cfd")
+
+_SCHEME_URL = re.compile(r"\b(?:https?://|www\.)[^\s<>\"'`]+", re.IGNORECASE)
+_BARE_URL = re.compile(rf"(?<![\w@.-])(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+(?:{BARE_TLDS})\b(?:/[^\s<>\"'`]*)?", re.IGNORECASE)
+_PHONE = re.compile(r"(?<![\w+])\+?\d[\d\s().-]{6,17}\d(?!\w)")
+# Words just before a bare number that mark it as a phone number rather than an id or amount
+_PHONE_CUE = re.compile(r"(?:\b(?:tel|telephone|phone|mobile|hp|call(?:ed|ing)?|ring|whats\s?app|wa|sms|text(?:ed)?|"
+                        r"signal|viber|contact)\b)[^\w\n]*(?:\w+[^\w\n]+){0,3}$", re.IGNORECASE)
+_WALLETS = [
+    re.compile(r"\b0x[a-fA-F0-9]{40}\b"),                       # Ethereum and other EVM chains
+    re.compile(r"\bbc1[ac-hj-np-z02-9]{25,60}\b", re.IGNORECASE),  # Bitcoin bech32
+    re.compile(r"\b[13][a-km-zA-HJ-NP-Z1-9]{25,34}\b"),         # Bitcoin base58
+    re.compile(r"\bT[a-km-zA-HJ-NP-Z1-9]{33}\b"),               # Tron (USDT-TRC20)
+]
+_HANDLE = re.compile(r"(?<![\w.@])@([a-zA-Z][a-zA-Z0-9_]{4,31})\b")
+_TELEGRAM_LINK = re.compile(r"^(?:t\.me|telegram\.me)/([a-zA-Z][a-zA-Z0-9_]{4,31})/?$")
+_WHATSAPP_LINK = re.compile(r"^wa\.me/(\d{8,15})")
+_TRAILING = ".,;:!?)]}>'\""
+
+
+def _host(url):
+    return url.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0].split(":", 1)[0]
+
+
+def _allowed(host):
+    parts = host.split(".")
+    return any(".".join(parts[i:]) in ALLOWED_DOMAINS for i in range(len(parts) - 1))
+
+
+def normalize_url(url):
+    """Strips the scheme, www. and trailing punctuation, and lowercases the host. Paths keep their case (short links need it)."""
+    url = url.rstrip(_TRAILING)
+    url = re.sub(r"^(?:https?://)?(?:www\.)?", "", url, flags=re.IGNORECASE)
+    host = _host(url)
+    rest = url[len(host):].rstrip("/")
+    return host.lower() + rest
+
+
+def normalize_phone(raw):
+    """
+    Returns a phone number as +<digits>, treating 8-digit numbers starting 3, 6, 8 or 9 as Singaporean, or None.
+    Callers decide whether a number is a phone number at all (see _is_phone).
+    """
+    digits = re.sub(r"\D", "", raw)
+    if raw.lstrip().startswith("+"):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    if len(digits) == 8 and digits[0] in "3689":
+        return f"+65{digits}"
+    if len(digits) == 10 and digits.startswith("65") and digits[2] in "3689":
+        return f"+{digits}"
+    return None
+
+
+ALLOWED_PHONES |= {phone for phone in map(normalize_phone, os.getenv("INDICATOR_ALLOWED_PHONES", "").split(",")) if phone}
+
+
+def _is_phone(text, match):
+    """Whether a _PHONE match in text is written as a phone number: with a + country code, after tel: or a cue word."""
+    if match.group().startswith("+"):
+        return True
+    before = text[max(0, match.start() - 40):match.start()]
+    return before.lower().endswith("tel:") or _PHONE_CUE.search(before) is not None
+
+
+def extract_indicators(text):
+    """Returns the set of (kind, value) indicators in a text."""
+    found = set()
+    if not text:
+        return found
+    spans = []
+    for pattern in (_SCHEME_URL, _BARE_URL):
+        for match in pattern.finditer(text):
+            if any(start <= match.start() < end for start, end in spans):
+                continue
+            spans.append(match.span())
+            url = normalize_url(match.group())
+            host = _host(url)
+            if "." not in host:
+                continue
+            handle = _TELEGRAM_LINK.match(url)
+            whatsapp = _WHATSAPP_LINK.match(url)
+            if handle:
+                found.add(("handle", "@" + handle.group(1).lower()))
+            elif whatsapp:
+                if "+" + whatsapp.group(1) not in ALLOWED_PHONES:
+                    found.add(("phone", "+" + whatsapp.group(1)))
+            elif _allowed(host):
+                continue
+            elif host in SHORTENERS:
+                if url != host:
+                    found.add(("url", url))
+            else:
+                found.add(("domain", host))
+                if url != host:
+                    found.add(("url", url))
+    # Links are blanked out first so digits in their paths aren't read as phone numbers
+    rest = text
+    for start, end in sorted(spans, reverse=True):
+        rest = rest[:start] + " " + rest[end:]
+    for pattern in _WALLETS:
+        for match in pattern.finditer(rest):
+            wallet = match.group()
+            if any(c.isdigit() for c in wallet) and any(c.isalpha() for c in wallet[1:]):
+                found.add(("wallet", wallet.lower() if wallet[:2].lower() in ("0x", "bc") else wallet))
+                rest = rest.replace(wallet, " ")
+    for match in _PHONE.finditer(rest):
+        if not _is_phone(rest, match):
+            continue
+        phone = normalize_phone(match.group())
+        if phone and phone not in ALLOWED_PHONES:
+            found.add(("phone", phone))
+    for match in _HANDLE.finditer(rest):
+        found.add(("handle", "@" + match.group(1).lower()))
+    return found
+
+
+def indicator_key(kind, value):
+    return int.from_bytes(hashlib.blake2b(f"{kind}:{value}".encode(), digest_size=8).digest(), "little")
+
+
+def _parent_domains(host):
+    """The host and each parent domain with at least two labels, e.g. a.b.com -> a.b.com, b.com."""
+    parts = host.split(".")
+    return [".".join(parts[i:]) for i in range(len(parts) - 1)]
+
+
+class IndicatorIndex:
+    """
+    In-process lookup over scamreport_indicators. Keys are sorted 64-bit hashes in a numpy array with
+    a parallel array of report ordinals; a key appears once per report that mentioned it.
+    """
+
+    def __init__(self, merge_threshold=MERGE_THRESHOLD):
+        self.merge_threshold = merge_threshold
+        self.ready = False
+        self.last_id = 0  # newest scamreport_indicators.id seen, for incremental refresh
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._owners = np.zeros(0, dtype=np.uint32)
+        self._pending = {}  # key -> [ordinal], not merged into the arrays yet
+        self._pending_count = 0
+        self._report_ids = []
+        self._report_ordinals = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._keys) + self._pending_count
+
+    def _ordinals(self, key):
+        position = np.searchsorted(self._keys, np.uint64(key))
+        ordinals = []
+        while position < len(self._keys) and self._keys[position] == key:
+            ordinals.append(int(self._owners[position]))
+            position += 1
+        return ordinals + self._pending.get(key, [])
+
+    def add(self, report_id, kind, value):
+        """Indexes an indicator for a report. Returns False if that report already has it."""
+        key = indicator_key(kind, value)
+        with self._lock:
+            ordinal = self._report_ordinals.get(report_id)
+            if ordinal is None:
+                ordinal = len(self._report_ids)
+                self._report_ids.append(report_id)
+                self._report_ordinals[report_id] = ordinal
+            elif ordinal in self._ordinals(key):
+                return False
+            self._pending.setdefault(key, []).append(ordinal)
+            self._pending_count += 1
+            # Merging costs a sort of the whole array, so it waits until pending is comparable in size
+            if self._pending_count >= max(self.merge_threshold, len(self._keys)):
+                self._merge()
+        return True
+
+    def add_many(self, rows):
+        """Bulk-loads (report_id, kind, value) rows. Returns the number indexed."""
+        return sum(1 for report_id, kind, value in rows if self.add(report_id, kind, value))
+
+    def _merge(self):
+        if not self._pending:
+            return
+        keys = np.fromiter((key for key, ordinals in self._pending.items() for _ in ordinals),
+                           dtype=np.uint64, count=self._pending_count)
+        owners = np.fromiter((ordinal for ordinals in self._pending.values() for ordinal in ordinals),
+                             dtype=np.uint32, count=self._pending_count)
+        keys = np.concatenate((self._keys, keys))
+        owners = np.concatenate((self._owners, owners))
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._owners = keys[order], owners[order]
+        self._pending = {}
+        self._pending_count = 0
+
+    def lookup(self, kind, value):
+        """Report ids that mention this indicator."""
+        with self._lock:
+            return [self._report_ids[ordinal] for ordinal in self._ordinals(indicator_key(kind, value))]
+
+    def match(self, text):
+        """Returns [(kind, value, report_ids)] for the known indicators in a text. Subdomains match their domain."""
+        return self.match_indicators(extract_indicators(text))
+
+    def match_indicators(self, indicators):
+        """match() for indicators already extracted with extract_indicators()."""
+        matches = []
+        for kind, value in indicators:
+            candidates = _parent_domains(value) if kind == "domain" else [value]
+            for candidate in candidates:
+                report_ids = self.lookup(kind, candidate)
+                if report_ids:
+                    matches.append((kind, candidate, report_ids))
+                    break
+        return matches
+
+    def _fetch(self, supabase_client, after_id, page_size):
+        """Yields scamreport_indicators rows with id > after_id, keyset-paginated on id."""
+        while True:
+            response = (supabase_client.table('scamreport_indicators')
+                .select('id, report_id, kind, value')
+                .gt('id', after_id)
+                .order('id')
+                .limit(page_size)
+                .execute())
+            rows = response.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1]['id']
+
+    def refresh(self, supabase_client, page_size=1000):
+        """Pulls indicators stored since the last refresh (including by other bot instances). Returns the number indexed."""
+        added = 0
+        for row in self._fetch(supabase_client, self.last_id, page_size):
+            if self.add(row['report_id'], row['kind'], row['value']):
+                added += 1
+            self.last_id = max(self.last_id, row['id'])
+        return added
+
+    def load(self, supabase_client, page_size=1000):
+        """Loads every stored indicator from the database and marks the index ready."""
+        added = self.refresh(supabase_client, page_size)
+        with self._lock:
+            self._merge()  # leaves the whole load in the compact arrays
+        self.ready = True
+        return added
+
+
+def backfill(supabase_client, page_size=500):
+    """Extracts indicators from every report's title and summary and stores them. Returns the number of rows written."""
+    written, last_id = 0, None
+    while True:
+        query = supabase_client.table('scamreports').select('id, title, summary').order('id').limit(page_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        reports = query.execute().data or []
+        rows = [{"report_id": report["id"], "kind": kind, "value": value}
+                for report in reports
+                for kind, value in extract_indicators(f"{report.get('title') or ''}\n{report.get('summary') or ''}")]
+        if rows:
+            supabase_client.table('scamreport_indicators').upsert(
+                rows, on_conflict='kind,value,report_id', ignore_duplicates=True).execute()
+            written += len(rows)
+        print(f"[indicators] Backfilled {len(reports)} reports ({written} indicators so far)")
+        if len(reports) < page_size:
+            return written
+        last_id = reports[-1]["id"]
+
+
+if __name__ == '__main__':
+    import sys
+    from dotenv import load_dotenv
+    from supabase import create_client
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("Usage: python indicators.py backfill")
+    load_dotenv()
+    backfill(create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")))
@@ -0,0 +1,323 @@
+"""
+Latency histograms and counters for the bot, exposed in the Prometheus text format.
+
+    with metrics.external_call("gemini", "gemini-2.0-flash"):
+        response = client.models.generate_content(...)
+
+    @metrics.timed_handler("process_full_report")
+    def process_full_report(...): ...
+
+serve_metrics() starts a scrape endpoint (GET /metrics) on a background thread. Components that
+already keep their own counters (caches, dispatcher, session store) are read at scrape time through
+register_collector() instead of being counted twice. benchmarks/bench_metrics.py checks that an
+instrumented call stays within OVERHEAD_BUDGET_US.
+"""
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Gemini calls take seconds, Supabase and Telegram calls tens of milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Most an instrumented call may add: well under 0.1% of the fastest Supabase or Telegram round trip (~10ms)
+OVERHEAD_BUDGET_US = 10.0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class _Metric:
+    kind = None
+    suffix = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        # The name HELP and TYPE describe, which must match the sample names in the 0.0.4 text format
+        self.family = name + self.suffix
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.family} {self.help}", f"# TYPE {self.family} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+    # Samples are name_total, as client_python writes counters, and the collectors' counters are named
+    suffix = "_total"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *values, amount=1):
+        self.labels(*values).inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.family}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, *values):
+        self.labels(*values).observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """
+        Adds a function called at scrape time that returns (name, kind, help, {labels}, value) samples,
+        for components that keep their own counters.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        described = set()
+        for collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"[metrics] Collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if name not in described:
+                    described.add(name)
+                    lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_seconds = registry.register(Histogram(
+    "tsfraud_handler_seconds", "Time spent in a bot handler.", ("handler", "outcome")))
+external_call_seconds = registry.register(Histogram(
+    "tsfraud_external_call_seconds", "Latency of calls to Gemini, Supabase and Telegram.", ("service", "target", "outcome")))
+events = registry.register(Counter(
+    "tsfraud_events", "Report pipeline and broadcast events.", ("event",)))
+
+register_collector = registry.register_collector
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.histogram.labels(*self.labels, "error" if exc_type else "ok").observe(elapsed)
+        return False
+
+
+def external_call(service, target):
+    """Context manager timing one call to an external service, e.g. ("supabase", "rpc:match_scam")."""
+    return _Timer(external_call_seconds, (service, target))
+
+
+def timed_handler(name):
+    """Decorator recording a handler's latency under `name`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(handler_seconds, (name,)):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(event, amount=1):
+    events.labels(event).inc(amount)
+
+
+class _InstrumentedQuery:
+    """Wraps a postgrest query builder so execute() is timed under the table or RPC name."""
+
+    __slots__ = ("_query", "_target")
+
+    def __init__(self, query, target):
+        self._query = query
+        self._target = target
+
+    def execute(self, *args, **kwargs):
+        with external_call("supabase", self._target):
+            return self._query.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        value = getattr(self._query, name)
+        if not callable(value):
+            return _InstrumentedQuery(value, self._target) if hasattr(value, "execute") else value
+        target = self._target
+
+        def chained(*args, **kwargs):
+            result = value(*args, **kwargs)
+            return _InstrumentedQuery(result, target) if hasattr(result, "execute") else result
+        return chained
+
+
+class _InstrumentedBucket:
+    __slots__ = ("_bucket", "_target")
+
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self._target = f"storage:{name}"
+
+    def upload(self, *args, **kwargs):
+        with external_call("supabase", self._target):
+            return self._bucket.upload(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        with external_call("supabase", self._target):
+            return self._bucket.remove(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._bucket, name)
+
+
+class _InstrumentedStorage:
+    __slots__ = ("_storage",)
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket):
+        return _InstrumentedBucket(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class InstrumentedSupabase:
+    """
+    Supabase client wrapper that times every query by table ("table:scamreports"), RPC
+    ("rpc:match_scam") or storage bucket ("storage:images"). Everything else passes through.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.storage = _InstrumentedStorage(client.storage)
+
+    def table(self, name):
+        return _InstrumentedQuery(self._client.table(name), f"table:{name}")
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        return _InstrumentedQuery(self._client.rpc(name, params or {}, *args, **kwargs), f"rpc:{name}")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(host="127.0.0.1", port=9464):
+    """Serves GET /metrics on a daemon thread. Returns the server (call shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"[metrics] Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
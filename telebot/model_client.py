@@ -0,0 +1,335 @@
+"""
+A resilient stand-in for genai.Client that the handlers use unchanged (client.models.generate_content /
+embed_content), adding:
+
+- a deadline per call (GEMINI_DEADLINE_SECONDS), also passed to the SDK as the HTTP timeout
+- retries with full-jitter exponential backoff on transient errors (429, 5xx, timeouts)
+- a hedged second request when an attempt runs past the model's recent p95 latency
+- a circuit breaker per model that opens after sustained failures
+- fallback to a cheaper model (FALLBACK_MODELS) when the primary is failing or has used its share of the budget,
+  through the `admit` hook so the fallback model's admission gate still applies
+
+generate_content_stream gets the same deadline, retries, breaker and fallback up to its first chunk.
+After that a failure ends the stream, because the caller has already shown part of the reply.
+
+Retries, hedges, fallbacks and breaker trips are counted in metrics, and every attempt is timed.
+benchmarks/check_model_client.py injects faults to show the tail latency stays bounded.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from google.genai import errors, types
+
+import metrics
+
+try:
+    import httpx
+    TRANSIENT_EXCEPTIONS = (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError)
+except ImportError:
+    TRANSIENT_EXCEPTIONS = (TimeoutError, ConnectionError)
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Where to go when a model is failing or slow. Embedding models have no fallback: vectors from another model don't compare.
+FALLBACK_MODELS = {
+    "gemini-2.0-flash": "gemini-2.0-flash-lite",
+}
+DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "30"))
+# Share of the deadline kept back for the fallback model while the primary is being retried
+FALLBACK_RESERVE = float(os.getenv("GEMINI_FALLBACK_RESERVE", "0.4"))
+MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+
+
+class ModelCallError(Exception):
+    """Raised when every attempt (and fallback) for a model call failed or ran out of time."""
+
+
+class DeadlineExceeded(ModelCallError):
+    pass
+
+
+class CircuitOpen(ModelCallError):
+    pass
+
+
+def is_transient(exc):
+    if isinstance(exc, errors.APIError):
+        return exc.code in TRANSIENT_STATUS_CODES
+    return isinstance(exc, TRANSIENT_EXCEPTIONS)
+
+
+class LatencyTracker:
+    """Recent successful call latencies for one model, for the hedging threshold."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_seconds`.
+    After that one trial call is let through (half-open); its result closes or re-opens the breaker.
+    A trial that ends without either result must call release_trial(), or no trial runs again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._trial_thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                self._trial_thread = threading.get_ident()
+                return True
+            return False
+
+    def release_trial(self):
+        """Ends a trial the calling thread was let through without recording a result (no-op otherwise)."""
+        with self._lock:
+            if self._trial_running and self._trial_thread == threading.get_ident():
+                self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Returns True if this failure opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            reopening = self._trial_running
+            self._trial_running = False
+            if reopening or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class ResilientModels:
+    """The `models` attribute of ModelClient."""
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, model, contents, config=None, deadline=None):
+        return self._owner.call("generate_content", model, contents, config, deadline)
+
+    def embed_content(self, model, contents, config=None, deadline=None):
+        return self._owner.call("embed_content", model, contents, config, deadline)
+
+    def generate_content_stream(self, model, contents, config=None, deadline=None):
+        return self._owner.stream(model, contents, config, deadline)
+
+
+class ModelClient:
+    def __init__(self, client, fallbacks=None, deadline=DEADLINE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 fallback_reserve=FALLBACK_RESERVE, base_backoff=0.2, max_backoff=4.0, hedge_floor=0.5,
+                 breaker_threshold=5, breaker_reset_seconds=30.0, max_workers=32, admit=None):
+        self.client = client
+        # admit(model, seconds) -> context manager held while a fallback model is called; the caller holds the primary's slot
+        self.admit = admit
+        self.fallbacks = FALLBACK_MODELS if fallbacks is None else fallbacks
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.fallback_reserve = fallback_reserve
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.hedge_floor = hedge_floor
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.models = ResilientModels(self)
+        self._trackers = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        # Attempts run here so a call can stop waiting at its deadline; an abandoned attempt ends at its HTTP timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+        self._random = random.Random()
+
+    def tracker(self, model):
+        with self._lock:
+            return self._trackers.setdefault(model, LatencyTracker())
+
+    def breaker(self, model):
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.breaker_threshold, self.breaker_reset_seconds)
+            return self._breakers[model]
+
+    def _model_chain(self, model):
+        chain = [model]
+        while chain[-1] in self.fallbacks and self.fallbacks[chain[-1]] not in chain:
+            chain.append(self.fallbacks[chain[-1]])
+        return chain
+
+    @staticmethod
+    def _with_timeout(method, config, seconds):
+        http_options = types.HttpOptions(timeout=max(1, int(seconds * 1000)))
+        if config is None:
+            config_type = types.GenerateContentConfig if method == "generate_content" else types.EmbedContentConfig
+            return config_type(http_options=http_options)
+        if hasattr(config, "model_copy"):
+            return config.model_copy(update={"http_options": http_options})
+        return config
+
+    def _attempt(self, method, model, contents, config, budget_end):
+        """One request, timed under the model's name."""
+        remaining = budget_end - time.monotonic()
+        with metrics.external_call("gemini", model):
+            return getattr(self.client.models, method)(
+                model=model, contents=contents, config=self._with_timeout(method, config, remaining))
+
+    def _hedged_attempt(self, method, model, contents, config, budget_end):
+        """Runs one attempt, adding a second identical request if the first outlives the model's p95 latency."""
+        start = time.monotonic()
+        p95 = self.tracker(model).p95()
+        hedge_at = start + max(p95, self.hedge_floor) if p95 is not None else None
+        pending = {self._pool.submit(self._attempt, method, model, contents, config, budget_end)}
+        last_error = None
+        while pending:
+            now = time.monotonic()
+            if now >= budget_end:
+                break
+            until = budget_end if hedge_at is None else min(budget_end, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.tracker(model).record(time.monotonic() - start)
+                    return future.result()
+                last_error = future.exception()
+            if not done and hedge_at is not None and time.monotonic() >= hedge_at:
+                metrics.count("gemini_hedge")
+                pending.add(self._pool.submit(self._attempt, method, model, contents, config, budget_end))
+                hedge_at = None
+        if last_error is not None and not pending:
+            raise last_error
+        raise DeadlineExceeded(f"{model} did not answer within the deadline")
+
+    def _open_stream(self, model, contents, config, budget_end):
+        """Starts a stream and waits for its first chunk. Returns (first_chunk, rest); streams aren't hedged."""
+        remaining = budget_end - time.monotonic()
+
+        def first_chunk():
+            # The timeout bounds each read, so it also limits how long the stream may stall later on
+            with metrics.external_call("gemini", model):
+                chunks = iter(self.client.models.generate_content_stream(
+                    model=model, contents=contents, config=self._with_timeout("generate_content", config, remaining)))
+                return next(chunks, None), chunks
+
+        future = self._pool.submit(first_chunk)
+        try:
+            return future.result(timeout=max(0.0, remaining))
+        except FutureTimeout:
+            raise DeadlineExceeded(f"{model} did not start streaming within the deadline")
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff."""
+        return self._random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def call(self, method, model, contents, config=None, deadline=None):
+        with ExitStack() as slots:
+            return self._run(model, deadline, lambda current, budget_end: self._hedged_attempt(
+                method, current, contents, config, budget_end), slots)
+
+    def stream(self, model, contents, config=None, deadline=None):
+        # A fallback model's slot is held until the stream ends
+        with ExitStack() as slots:
+            first, rest = self._run(model, deadline, lambda current, budget_end: self._open_stream(
+                current, contents, config, budget_end), slots)
+            if first is not None:
+                yield first
+            yield from rest
+
+    def _run(self, model, deadline, attempt_call, slots):
+        """
+        Calls attempt_call(model, budget_end) down the fallback chain, with retries and the breakers.
+        Admission slots for fallback models are entered on `slots`; AdmissionRejected from the hook propagates.
+        """
+        end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        chain = self._model_chain(model)
+        last_error = None
+        for position, current in enumerate(chain):
+            breaker = self.breaker(current)
+            if not breaker.allow():
+                last_error = CircuitOpen(f"circuit open for {current}")
+                metrics.count("gemini_circuit_rejected")
+                continue
+            if position > 0:
+                metrics.count("gemini_fallback")
+            if position > 0 and not isinstance(last_error, CircuitOpen):
+                print(f"[ModelClient] Falling back from {chain[position - 1]} to {current}: {last_error}")
+            # Keep part of the budget for the next model in the chain
+            remaining = end - time.monotonic()
+            budget_end = end if position == len(chain) - 1 else time.monotonic() + remaining * (1 - self.fallback_reserve)
+
+            # Whatever ends the attempts below, a half-open trial this call was let through is over
+            try:
+                if position > 0 and self.admit is not None:
+                    slots.enter_context(self.admit(current, max(0.0, remaining)))
+
+                for attempt in range(self.max_attempts):
+                    try:
+                        result = attempt_call(current, budget_end)
+                        breaker.record_success()
+                        return result
+                    except DeadlineExceeded as e:
+                        last_error = e
+                        if breaker.record_failure():
+                            metrics.count("gemini_circuit_opened")
+                        break
+                    except Exception as e:
+                        last_error = e
+                        if not is_transient(e):
+                            # Bad requests fail the same way on any model. They say nothing about the model's
+                            # health, so they neither reset the failure count nor close the breaker; the finally
+                            # below frees a half-open trial for the next call.
+                            raise
+                        if breaker.record_failure():
+                            metrics.count("gemini_circuit_opened")
+                            print(f"[ModelClient] Circuit opened for {current} after {breaker.failures} failures: {e}")
+                            break
+                        delay = self._backoff(attempt)
+                        if attempt == self.max_attempts - 1 or time.monotonic() + delay >= budget_end:
+                            break
+                        metrics.count("gemini_retry")
+                        time.sleep(delay)
+            finally:
+                breaker.release_trial()
+        if isinstance(last_error, ModelCallError):
+            raise last_error
+        raise ModelCallError(f"{model} call failed: {last_error}") from last_error
@@ -0,0 +1,59 @@
+from google.genai import types
+from pydantic import BaseModel, ConfigDict
+
+REPORT_MODEL = "gemini-2.0-flash"
+
+
+class ReportAnalysis(BaseModel):
+    """Structured model output for a scam report: the verification verdict plus the summary fields."""
+    model_config = ConfigDict(strict=True)
+
+    verdict: bool
+    title: str
+    type: str
+    description: str
+    avoidance: str
+
+    @property
+    def content(self):
+        """Summary as stored in scamreports.summary: the description, then how to avoid the scam."""
+        return f"{self.description.strip()}\n\n{self.avoidance.strip()}"
+
+
+def parse_report_analysis(text):
+    """Parses a JSON model response into a ReportAnalysis. Raises pydantic.ValidationError if it does not match."""
+    return ReportAnalysis.model_validate_json(text)
+
+
+def build_report_prompt(description, existing_summary=None):
+    if existing_summary is None:
+        information = f"Incident description:\n{description}"
+    else:
+        information = (f"Existing Summary:\n{existing_summary}\n\n---\n\n"
+                       f"New Incident Description:\n{description}")
+    return (
+        "Verify whether the incident description is a legitimate scam incident by identifying common scam red flags "
+        "such as phishing links, unsolicited requests for personal info (passwords, bank details, phone number), "
+        "sense of urgency or threats. Set 'verdict' to true if it is legitimate; if unsure, set it to true to be safe.\n"
+        "Then summarise the scam information into a short title, a scam type, a description of the scam, and how to "
+        "avoid falling for such scams. Do not use Markdown. Keep description and avoidance to under 120 words in total.\n\n"
+        f"{information}"
+    )
+
+
+def analyze_report(gemini_client, description, existing_summary=None, image_parts=()):
+    """
+    Verifies and summarises a report in a single call. Pass existing_summary to summarise the merge
+    of a new incident into an existing report. Raises on API errors or output that does not match the schema.
+    """
+    response = gemini_client.models.generate_content(
+        model=REPORT_MODEL,
+        contents=[build_report_prompt(description, existing_summary), *image_parts],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=ReportAnalysis,
+        ),
+    )
+    if isinstance(response.parsed, ReportAnalysis):
+        return response.parsed
+    return parse_report_analysis(response.text)
@@ -0,0 +1,194 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """
+    Bounded store for in-progress conversations (e.g. /report drafts), keyed by user id.
+    Sessions idle for longer than ttl_seconds expire, and the least recently used session is
+    evicted once max_sessions is reached. on_evict(key, value) is called for every evicted session.
+
+    Values must be JSON-serialisable dicts. Callers get a copy and must put() it back after changing it.
+    """
+
+    def __init__(self, max_sessions=10000, ttl_seconds=1800, on_evict=None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.ttl_evictions = 0
+        self.lru_evictions = 0
+        self._lock = threading.Lock()
+
+    def _notify(self, evicted):
+        if not self.on_evict:
+            return
+        for key, value in evicted:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print(f"[SessionStore] Eviction callback failed for {key}: {e}")
+
+    def stats(self):
+        return {
+            "live_sessions": len(self),
+            "ttl_evictions": self.ttl_evictions,
+            "lru_evictions": self.lru_evictions,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, max_sessions=10000, ttl_seconds=1800, on_evict=None):
+        super().__init__(max_sessions, ttl_seconds, on_evict)
+        self._sessions = OrderedDict()  # key -> (last_access, serialised value)
+
+    def get(self, key, default=None):
+        evicted = []
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return default
+            last_access, data = entry
+            now = time.monotonic()
+            if now - last_access > self.ttl_seconds:
+                del self._sessions[key]
+                self.ttl_evictions += 1
+                evicted.append((key, json.loads(data)))
+            else:
+                self._sessions[key] = (now, data)
+                self._sessions.move_to_end(key)
+        if evicted:
+            self._notify(evicted)
+            return default
+        return json.loads(data)
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            self._sessions[key] = (time.monotonic(), json.dumps(value))
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                old_key, (_, data) = self._sessions.popitem(last=False)
+                self.lru_evictions += 1
+                evicted.append((old_key, json.loads(data)))
+        self._notify(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def sweep(self):
+        """Evicts every expired session. Returns the number evicted."""
+        evicted = []
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            # Entries are kept in access order, so expired ones are at the front
+            while self._sessions:
+                key, (last_access, data) = next(iter(self._sessions.items()))
+                if last_access >= cutoff:
+                    break
+                del self._sessions[key]
+                self.ttl_evictions += 1
+                evicted.append((key, json.loads(data)))
+        self._notify(evicted)
+        return len(evicted)
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(len(data) for _, data in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Crash-safe backend: sessions live in a SQLite database in WAL mode and survive restarts."""
+
+    def __init__(self, path, max_sessions=10000, ttl_seconds=1800, on_evict=None):
+        super().__init__(max_sessions, ttl_seconds, on_evict)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key PRIMARY KEY, data TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access_idx ON sessions (last_access)")
+
+    def get(self, key, default=None):
+        evicted = []
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT data, last_access FROM sessions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            data, last_access = row
+            if now - last_access > self.ttl_seconds:
+                self._conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+                self.ttl_evictions += 1
+                evicted.append((key, json.loads(data)))
+            else:
+                self._conn.execute("UPDATE sessions SET last_access = ? WHERE key = ?", (now, key))
+        if evicted:
+            self._notify(evicted)
+            return default
+        return json.loads(data)
+
+    def put(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (key, data, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, last_access = excluded.last_access",
+                (key, json.dumps(value), time.time()),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+            evicted = []
+            if overflow > 0:
+                evicted = self._conn.execute(
+                    "DELETE FROM sessions WHERE key IN "
+                    "(SELECT key FROM sessions ORDER BY last_access LIMIT ?) RETURNING key, data",
+                    (overflow,),
+                ).fetchall()
+                self.lru_evictions += len(evicted)
+        self._notify([(key, json.loads(data)) for key, data in evicted])
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def sweep(self):
+        """Evicts every expired session. Returns the number evicted."""
+        with self._lock:
+            evicted = self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ? RETURNING key, data",
+                (time.time() - self.ttl_seconds,),
+            ).fetchall()
+            self.ttl_evictions += len(evicted)
+        self._notify([(key, json.loads(data)) for key, data in evicted])
+        return len(evicted)
+
+    def memory_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM sessions").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(on_evict=None):
+    """Builds the session store configured by SESSION_BACKEND (memory or sqlite)."""
+    max_sessions = int(os.getenv("SESSION_MAX", "10000"))
+    ttl_seconds = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("SESSION_DB_PATH", "sessions.db")
+        return SQLiteSessionStore(path, max_sessions, ttl_seconds, on_evict)
+    return MemorySessionStore(max_sessions, ttl_seconds, on_evict)
@@ -0,0 +1,138 @@
+"""
+Streams a Gemini reply into Telegram: the first chunk is sent as a new message as soon as it arrives,
+and the message is then edited as more text streams in.
+
+Telegram allows roughly one message or edit per second in a private chat and 20 per minute in a group,
+so edits are throttled per message (STREAM_EDIT_INTERVAL_SECONDS / STREAM_GROUP_EDIT_INTERVAL_SECONDS)
+and wait out any 429 retry_after. Text past Telegram's 4096 character limit continues in a new message.
+Time to the first chunk is recorded in tsfraud_gemini_ttfb_seconds.
+"""
+import os
+import time
+
+import telebot
+
+import metrics
+
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "True").lower() == "true"
+EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.0"))
+GROUP_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_GROUP_EDIT_INTERVAL_SECONDS", "3.1"))
+# The first message waits for about a sentence, and later edits for this many new characters
+FIRST_MESSAGE_CHARS = 60
+MIN_EDIT_CHARS = 24
+MESSAGE_LIMIT = 4096
+INTERRUPTED_NOTE = "\n\n(The reply was cut off. Please try again.)"
+
+ttfb_seconds = metrics.registry.register(metrics.Histogram(
+    "tsfraud_gemini_ttfb_seconds", "Time from starting a streamed Gemini call to its first text.", ("handler", "model")))
+
+
+class StreamInterrupted(Exception):
+    """Raised when a stream fails after part of the reply was already shown to the user."""
+
+
+def edit_interval(chat):
+    return GROUP_EDIT_INTERVAL_SECONDS if chat.type in ('group', 'supergroup') else EDIT_INTERVAL_SECONDS
+
+
+class StreamingReply:
+    """
+    One reply in a chat, growing as chunks arrive. Call consume() with a Gemini stream, then finish()
+    once nothing else needs the model, since the final edit may have to wait for the throttle.
+    """
+
+    def __init__(self, bot, chat_id, handler, model, interval=EDIT_INTERVAL_SECONDS):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.handler = handler
+        self.model = model
+        self.interval = interval
+        self.text = ""
+        self.message_ids = []
+        self.edits = 0
+        self.usage = None  # usage_metadata from the stream, once Gemini reports it
+        self._offset = 0  # where the current message's text starts in self.text
+        self._shown = ""  # what the current message shows now
+        self._next_edit_at = 0.0
+
+    def consume(self, chunks):
+        """Feeds every chunk of a stream. If it fails after a message was sent, marks the reply and raises StreamInterrupted."""
+        start = time.perf_counter()
+        try:
+            for chunk in chunks:
+                self.usage = getattr(chunk, "usage_metadata", None) or self.usage
+                piece = chunk.text or ""
+                if not piece:
+                    continue
+                if not self.text:
+                    ttfb_seconds.observe(time.perf_counter() - start, self.handler, self.model)
+                self.text += piece
+                self._flush(final=False)
+        except Exception as e:
+            if not self.message_ids:
+                raise
+            print(f"[StreamingReply] Stream failed after {len(self.text)} characters: {e}")
+            self.text += INTERRUPTED_NOTE
+            self.finish()
+            raise StreamInterrupted(str(e)) from e
+        if not self.text:
+            raise ValueError(f"{self.model} streamed an empty reply")
+        return self.text
+
+    def finish(self):
+        """Shows the complete text, waiting for the throttle if needed. Returns the full reply."""
+        self._flush(final=True)
+        return self.text
+
+    def _flush(self, final):
+        while len(self.text) - self._offset > MESSAGE_LIMIT:
+            # The current message is full: show its last part and continue in a new one
+            self._show(self.text[self._offset:self._offset + MESSAGE_LIMIT], wait=True)
+            self._offset += MESSAGE_LIMIT
+            self._shown = ""
+            self.message_ids.append(None)
+        pending = self.text[self._offset:]
+        if not pending.strip() or pending == self._shown:
+            return
+        if final:
+            self._show(pending, wait=True)
+        elif self._current_id() is None:
+            if len(pending) >= FIRST_MESSAGE_CHARS:
+                self._show(pending, wait=False)
+        elif time.monotonic() >= self._next_edit_at and len(pending) - len(self._shown) >= MIN_EDIT_CHARS:
+            self._show(pending, wait=False)
+
+    def _current_id(self):
+        return self.message_ids[-1] if self.message_ids else None
+
+    def _show(self, text, wait):
+        """Sends or edits the current message. With wait=False a rate-limited edit is skipped for now."""
+        for attempt in range(3):
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                if not wait:
+                    return
+                time.sleep(delay)
+            try:
+                if self._current_id() is None:
+                    sent = self.bot.send_message(self.chat_id, text)
+                    if self.message_ids:
+                        self.message_ids[-1] = sent.message_id
+                    else:
+                        self.message_ids.append(sent.message_id)
+                else:
+                    self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self._current_id())
+                    self.edits += 1
+                self._shown = text
+                self._next_edit_at = time.monotonic() + self.interval
+                return
+            except telebot.apihelper.ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 5)
+                    print(f"[StreamingReply] Rate limited by Telegram, next edit in {retry_after}s")
+                    self._next_edit_at = time.monotonic() + retry_after
+                    continue
+                if e.error_code == 400 and "not modified" in e.description:
+                    self._shown = text
+                    return
+                raise
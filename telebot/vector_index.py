@@ -0,0 +1,210 @@
+import json
+import threading
+
+import numpy as np
+
+
+def parse_embedding(value):
+    """Returns a float32 vector from a list or a pgvector string such as '[0.1,0.2]', or None."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    vector = np.asarray(value, dtype=np.float32)
+    if vector.ndim != 1 or vector.size == 0:
+        return None
+    return vector
+
+
+def normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def to_halfvec(embedding):
+    """
+    Returns the embedding L2-normalised and rounded to half precision, in the '[0.01234,...]' text form
+    the scamreports.embeddings halfvec column takes, or None. Half precision keeps cosine similarity
+    to about 1e-4, well inside the gap between a duplicate and a different scam.
+    """
+    vector = parse_embedding(embedding)
+    if vector is None:
+        return None
+    return "[" + ",".join(map(str, normalize(vector).astype(np.float16))) + "]"
+
+
+def running_mean(centroid, count, embedding):
+    """
+    Folds one more embedding into the normalised mean of `count` earlier ones and re-normalises,
+    as merge_scam_report does on the server. Each report keeps an equal say however many follow it.
+    """
+    centroid = parse_embedding(centroid)
+    vector = normalize(parse_embedding(embedding))
+    if centroid is None or centroid.size != vector.size:
+        return vector
+    return normalize(normalize(centroid) * max(count or 1, 1) + vector)
+
+
+class ScamVectorIndex:
+    """
+    In-process cosine-similarity index over scamreports embeddings.
+    Rows are L2-normalised so a dot product is the cosine similarity. Queries are exact, over a contiguous
+    float32 matrix: about 5ms at 10k rows of 3072 dimensions, growing linearly with rows
+    (benchmarks/bench_vector_index.py). The matrix may use at most max_bytes; a table that outgrows it
+    disables the index and frees the matrix, and callers go back to the match_scam RPC.
+    Float16 rows would halve the memory, but NumPy converts them back at about a tenth of the matmul speed.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, initial_capacity=1024, refresh_overlap_ms=60_000):
+        self.max_bytes = max_bytes
+        # Rows whose embedding changed this long before the newest change seen are read again on refresh,
+        # for transactions that committed after a later one was already picked up
+        self.refresh_overlap_ms = refresh_overlap_ms
+        self.dim = None
+        self.ready = False
+        self.disabled = False
+        self.last_updated = 0  # newest scamreports.embedding_updated_at seen, for incremental refresh
+        self._capacity = initial_capacity
+        self._matrix = None
+        self._ids = []
+        self._rows = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def max_rows(self):
+        return self.max_bytes // (self.dim * 4) if self.dim else None
+
+    def _ensure_capacity(self, dim, needed):
+        if self._matrix is None:
+            self.dim = dim
+            self._capacity = min(max(self._capacity, needed), self.max_rows)
+            self._matrix = np.zeros((self._capacity, dim), dtype=np.float32)
+            return
+        if needed > self._capacity:
+            self._capacity = min(max(needed, self._capacity * 2), self.max_rows)
+            grown = np.zeros((self._capacity, self.dim), dtype=np.float32)
+            grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+            self._matrix = grown
+
+    def _disable(self):
+        print(f"[ScamVectorIndex] More than {self.max_rows} reports of {self.dim} dimensions exceed "
+              f"{self.max_bytes / 2**20:.0f} MB; disabling the local index in favour of match_scam")
+        self.disabled = True
+        self.ready = False
+        self._matrix = None
+        self._ids = []
+        self._rows = {}
+
+    def upsert(self, report_id, embedding):
+        """Adds or replaces the embedding for a report. Embeddings with the wrong dimension are ignored."""
+        vector = parse_embedding(embedding)
+        if vector is None or (self.dim is not None and vector.size != self.dim):
+            return False
+        vector = normalize(vector)
+        with self._lock:
+            if self.disabled:
+                return False
+            row = self._rows.get(report_id)
+            if row is None:
+                if len(self._ids) + 1 > self.max_bytes // (vector.size * 4):
+                    self._disable()
+                    return False
+                self._ensure_capacity(vector.size, len(self._ids) + 1)
+                row = len(self._ids)
+                self._ids.append(report_id)
+                self._rows[report_id] = row
+            self._matrix[row] = vector
+        return True
+
+    def upsert_many(self, rows):
+        """Bulk-loads (report_id, embedding) pairs. Returns the number indexed."""
+        added = 0
+        for report_id, embedding in rows:
+            if self.upsert(report_id, embedding):
+                added += 1
+        return added
+
+    def query(self, embedding, k=1, threshold=0.0):
+        """Returns up to k (report_id, similarity) pairs with similarity >= threshold, best first."""
+        vector = parse_embedding(embedding)
+        with self._lock:
+            count = len(self._ids)
+            if vector is None or count == 0 or vector.size != self.dim:
+                return []
+            vector = normalize(vector)
+            k = min(k, count)
+            all_scores = self._matrix[:count] @ vector
+            if k == 1:
+                rows = np.array([int(np.argmax(all_scores))])
+            else:
+                rows = np.argpartition(-all_scores, k - 1)[:k]
+                rows = rows[np.argsort(-all_scores[rows])]
+            scores = all_scores[rows]
+            return [(self._ids[row], float(score)) for row, score in zip(rows, scores) if score >= threshold]
+
+    def _fetch(self, supabase_client, since, page_size):
+        """
+        Yields scamreports rows whose embedding changed after `since` (embedding_updated_at), keyset-paginated
+        on (embedding_updated_at, id). The column is set by a trigger whenever embeddings is written, so
+        merges from the bot, the mobile app and the offline jobs are all picked up.
+        """
+        query = (supabase_client.table('scamreports')
+            .select('id, embeddings, embedding_updated_at')
+            .not_.is_('embeddings', 'null')
+            .gt('embedding_updated_at', since))
+        while True:
+            response = query.order('embedding_updated_at').order('id').limit(page_size).execute()
+            rows = response.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1]
+            query = (supabase_client.table('scamreports')
+                .select('id, embeddings, embedding_updated_at')
+                .not_.is_('embeddings', 'null')
+                .or_(f"embedding_updated_at.gt.{last['embedding_updated_at']},"
+                     f"and(embedding_updated_at.eq.{last['embedding_updated_at']},id.gt.{last['id']})"))
+
+    def refresh(self, supabase_client, page_size=1000):
+        """Pulls reports whose embedding changed since the last refresh (e.g. written by the mobile app). Returns the number indexed."""
+        if self.disabled:
+            return 0
+        added = 0
+        seen = self.last_updated
+        since = max(0, seen - self.refresh_overlap_ms) if seen else 0
+        for row in self._fetch(supabase_client, since, page_size):
+            updated = row.get('embedding_updated_at') or 0
+            if self.upsert(row['id'], row['embeddings']) and updated > seen:
+                added += 1
+            if self.disabled:
+                return 0
+            self.last_updated = max(self.last_updated, updated)
+        return added
+
+    def remove(self, report_ids):
+        """Drops reports that no longer exist (e.g. merged away by consolidate.py). Returns the number removed."""
+        removed = 0
+        with self._lock:
+            for report_id in report_ids:
+                row = self._rows.pop(report_id, None)
+                if row is None:
+                    continue
+                # Move the last row into the gap so the matrix stays contiguous
+                last = len(self._ids) - 1
+                if row != last:
+                    moved = self._ids[last]
+                    self._matrix[row] = self._matrix[last]
+                    self._ids[row] = moved
+                    self._rows[moved] = row
+                self._ids.pop()
+                removed += 1
+        return removed
+
+    def load(self, supabase_client, page_size=1000):
+        """Loads every report embedding from the database and marks the index ready, unless it outgrew max_bytes."""
+        added = self.refresh(supabase_client, page_size)
+        self.ready = not self.disabled
+        return added
@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from embedding_cache import normalize_text
+from indicators import extract_indicators
+
+SIMHASH_BITS = 64
+BANDS = 8
+BAND_BITS = SIMHASH_BITS // BANDS
+
+
+def _hash64(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text, shingle_size=3):
+    """
+    64-bit SimHash over character shingles of normalised text. Similar texts get fingerprints with a
+    small Hamming distance; character shingles keep that distance low for short messages with small edits.
+    """
+    if len(text) <= shingle_size:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)]
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def _bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, fingerprint >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+
+class VerdictCache:
+    """
+    Caches model verdicts for messages, matching exact copies by hash and near-duplicates by SimHash.
+    Fingerprints are split into 8 bands of 8 bits; with max_distance <= 7 any near-duplicate shares
+    at least one band exactly, so only entries in matching band buckets are compared.
+    A near-duplicate only counts if it has exactly the same links, phone numbers, wallets and handles:
+    swapping a bank's domain for a look-alike is a small edit that changes the verdict.
+    """
+
+    def __init__(self, max_entries=5000, ttl_seconds=86400, max_distance=6, min_tokens=8):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens  # shorter texts are only matched exactly
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (fingerprint, value, expires_at, indicators)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, text):
+        normalized = normalize_text(text)
+        key = hashlib.sha256(normalized.encode()).hexdigest()
+        fingerprint = simhash(normalized) if len(normalized.split()) >= self.min_tokens else None
+        return key, fingerprint
+
+    def _remove(self, key):
+        fingerprint = self._entries.pop(key)[0]
+        if fingerprint is not None:
+            for band in _bands(fingerprint):
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] < now:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, text):
+        key, fingerprint = self._fingerprint(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[1]
+            if fingerprint is not None:
+                indicators = extract_indicators(text)
+                candidates = set()
+                for band in _bands(fingerprint):
+                    candidates.update(self._buckets.get(band, ()))
+                best = None
+                for candidate in candidates:
+                    entry = self._live(candidate, now)
+                    if entry is None:
+                        continue
+                    distance = bin(entry[0] ^ fingerprint).count("1")
+                    if distance > self.max_distance or entry[3] != indicators:
+                        continue
+                    if best is None or distance < best[0]:
+                        best = (distance, candidate, entry[1])
+                if best is not None:
+                    self._entries.move_to_end(best[1])
+                    self.near_hits += 1
+                    return best[2]
+            self.misses += 1
+            return None
+
+    def put(self, text, value):
+        key, fingerprint = self._fingerprint(text)
+        indicators = extract_indicators(text) if fingerprint is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (fingerprint, value, time.monotonic() + self.ttl_seconds, indicators)
+            if fingerprint is not None:
+                for band in _bands(fingerprint):
+                    self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        hits = self.exact_hits + self.near_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "gemini_calls_saved": hits,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,215 @@
+"""
+Webhook ingestion for the bot, as an alternative to long polling.
+
+Run `python webhook.py replay updates.jsonl --url http://127.0.0.1:8443/telegram --secret ...`
+to post recorded updates (one JSON update per line) at a fixed rate against a local server.
+"""
+import argparse
+import hmac
+import json
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telebot
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY_BYTES = 1024 * 1024
+# Payloads acknowledged but not yet handed to the bot. When full, posts get 503 and Telegram redelivers later.
+MAX_QUEUED_PAYLOADS = 100
+
+
+class WebhookServer:
+    """
+    Accepts Telegram updates over HTTP, checks the secret token, acknowledges immediately
+    and hands the parsed updates to the bot on a background thread.
+    The handoff queue is bounded: once the bot's dispatcher applies backpressure and the queue fills,
+    posts are answered with 503 so Telegram keeps the updates and retries them.
+    """
+
+    def __init__(self, bot, secret_token, host="0.0.0.0", port=8443, path="/telegram",
+                 max_queued=MAX_QUEUED_PAYLOADS):
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.received = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._handoff = threading.Thread(target=self._run_handoff, name="webhook-handoff", daemon=True)
+        self._handoff.start()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server._handle_post(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _handle_post(self, request):
+        if request.path != self.path:
+            request.send_response(404)
+            request.end_headers()
+            return
+
+        # Compared as bytes: compare_digest raises TypeError on non-ASCII str
+        token = request.headers.get(SECRET_HEADER, "").encode()
+        if not self.secret_token or not hmac.compare_digest(token, self.secret_token.encode()):
+            with self._lock:
+                self.rejected += 1
+            request.send_response(403)
+            request.end_headers()
+            return
+
+        try:
+            length = int(request.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = 0
+        if length <= 0 or length > MAX_BODY_BYTES:
+            request.send_response(400)
+            request.end_headers()
+            return
+
+        body = request.rfile.read(length)
+        # Queue first and acknowledge without waiting for parsing, so Telegram's next delivery is not delayed.
+        try:
+            self._queue.put_nowait(body)
+        except queue.Full:
+            with self._lock:
+                self.overloaded += 1
+            request.send_response(503)
+            request.send_header("Retry-After", "1")
+            request.end_headers()
+            return
+        request.send_response(200)
+        request.end_headers()
+
+    def _run_handoff(self):
+        while True:
+            body = self._queue.get()
+            if body is None:
+                return
+            self._dispatch(body)
+
+    def _dispatch(self, body):
+        try:
+            payload = json.loads(body)
+            items = payload if isinstance(payload, list) else [payload]
+            updates = [telebot.types.Update.de_json(item) for item in items]
+            with self._lock:
+                self.received += len(updates)
+            self.bot.process_new_updates(updates)
+        except Exception as e:
+            print(f"[WebhookServer] Could not process webhook payload: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"[WebhookServer] Listening on {self.address[0]}:{self.address[1]}{self.path}")
+
+    def serve_forever(self):
+        print(f"[WebhookServer] Listening on {self.address[0]}:{self.address[1]}{self.path}")
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        # Blocks until the payloads already acknowledged are handed off
+        self._queue.put(None)
+        self._handoff.join()
+
+
+def run_webhook(bot, public_url, secret_token, host="0.0.0.0", port=8443, path="/telegram",
+                max_queued=MAX_QUEUED_PAYLOADS):
+    """Registers the webhook with Telegram and serves updates until interrupted."""
+    bot.remove_webhook()
+    # One delivery at a time: concurrent deliveries land on separate handler threads and could queue
+    # updates from the same chat out of order, breaking the dispatcher's per-chat ordering
+    bot.set_webhook(url=public_url.rstrip("/") + path, secret_token=secret_token, max_connections=1)
+    server = WebhookServer(bot, secret_token, host=host, port=port, path=path, max_queued=max_queued)
+    try:
+        server.serve_forever()
+    finally:
+        server.stop()
+
+
+def replay_updates(url, secret_token, updates, rate=100.0, batch_size=1, concurrency=8):
+    """
+    Fake Telegram sender: posts recorded updates to a webhook URL at roughly `rate` updates per second.
+    Returns (sent, failed, elapsed_seconds).
+    """
+    batches = [updates[i:i + batch_size] for i in range(0, len(updates), batch_size)]
+    interval = batch_size / rate if rate > 0 else 0
+    sent = 0
+    failed = 0
+    lock = threading.Lock()
+
+    def post(batch):
+        nonlocal sent, failed
+        body = json.dumps(batch if batch_size > 1 else batch[0]).encode()
+        request = urllib.request.Request(url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            SECRET_HEADER: secret_token,
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                ok = response.status == 200
+        except Exception:
+            ok = False
+        with lock:
+            if ok:
+                sent += len(batch)
+            else:
+                failed += len(batch)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, batch in enumerate(batches):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(post, batch)
+    return sent, failed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Telegram updates against a webhook server.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay = subparsers.add_parser("replay")
+    replay.add_argument("file", help="JSON lines file with one Telegram update per line")
+    replay.add_argument("--url", required=True)
+    replay.add_argument("--secret", required=True)
+    replay.add_argument("--rate", type=float, default=100.0, help="updates per second")
+    replay.add_argument("--batch-size", type=int, default=1)
+    replay.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.file) as fh:
+        updates = [json.loads(line) for line in fh if line.strip()]
+    expanded = []
+    for i in range(args.repeat):
+        for update in updates:
+            # Keep update ids increasing so the bot does not treat repeats as stale
+            expanded.append({**update, "update_id": update["update_id"] + i * len(updates)})
+
+    sent, failed, elapsed = replay_updates(args.url, args.secret, expanded, args.rate, args.batch_size)
+    print(f"Sent {sent} updates ({failed} failed) in {elapsed:.2f}s ({sent / elapsed:.0f} updates/s)")
+
+
+if __name__ == '__main__':
+    main()